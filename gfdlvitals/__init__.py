@@ -22,5 +22,6 @@ __all__ = [
     "util",
     "VitalsDataFrame",
     "open_db",
+    "open_mfdb",
     "plot_timeseries",
 ]
@@ -3,69 +3,147 @@
 import xarray as xr
 
 import gfdlvitals.util.gmeantools as gmeantools
+import gfdlvitals.util.gridcache as gridcache
 import gfdlvitals.util.xrtools as xrtools
 import gfdlvitals.util.netcdf as netcdf
+import gfdlvitals.util.regions as regions
 
 __all__ = ["xr_average"]
 
 
+def _average(dset, ds_grid, fyears, label):
+    """Averages a member of one year, or of several stacked years
+
+    Parameters
+    ----------
+    dset : xarray.DataSet
+        Time-dependent variables, optionally with a "year" dimension
+        (see `xrtools.xr_stack_years`)
+    ds_grid : xarray.DataSet
+        Grid spec tiles
+    fyears : list
+        Years being processed (YYYY)
+    label : str
+        Output db file name
+    """
+    dset["area"] = ds_grid["area"]
+
+    # Buffer results and write each db file in a single transaction
+    writer = gmeantools.VitalsWriter()
+
+    # Average all regions and years in a single reduction
+    _masked_area = xrtools.xr_region_weights(dset.area, ds_grid.grid_latt)
+    t_bounds = dset.time_bnds
+    dt = t_bounds.isel(nv=1) - t_bounds.isel(nv=0)
+    weights = dt.astype("float") * _masked_area
+    _dset_weighted = xrtools.xr_weighted_avg(dset, weights)
+
+    for fyear in fyears:
+        _year = {"year": fyear} if "year" in dset.dims else {}
+        for region in xrtools.REGIONS:
+            writer.write_sqlite_data(
+                f"{fyear}.{region}Ave{label}.db",
+                "area",
+                fyear,
+                _masked_area.sel(region=region).sum().data,
+            )
+            xrtools.xr_to_db(
+                _dset_weighted.sel(region=region, **_year, drop=True),
+                fyear,
+                f"{fyear}.{region}Ave{label}.db",
+                writer=writer,
+            )
+
+    # Average user-defined regions with sparse weights
+    _regions = regions.weight_matrix(ds_grid.grid_latt, ds_grid.get("grid_lont"))
+    if len(_regions.names) > 0:
+        _region_area = regions.region_sum(dset.area, _regions)
+        for fyear in fyears:
+            _year = {"year": fyear} if "year" in dset.dims else {}
+            _dset_weighted = regions.weighted_avg(
+                dset.sel(_year, drop=True),
+                dt.sel(_year, drop=True).astype("float") * dset.area,
+                _regions,
+            )
+            for region in _regions.names:
+                writer.write_sqlite_data(
+                    f"{fyear}.{region}Ave{label}.db",
+                    "area",
+                    fyear,
+                    _region_area.sel(region=region).data,
+                )
+                xrtools.xr_to_db(
+                    _dset_weighted.sel(region=region, drop=True),
+                    fyear,
+                    f"{fyear}.{region}Ave{label}.db",
+                    writer=writer,
+                )
+
+    writer.flush()
+
+
 def xr_average(fyear, tar, modules):
     """xarray-based processing routines for cubed sphere atmos. output
 
+    In batch mode, a member is read from the tar files of several years,
+    stacked along a "year" dimension, and averaged in a single reduction.
+
     Parameters
     ----------
-    fyear : str
-        Year being processed (YYYY)
-    tar : tarfile
-        In-memory tarfile object
+    fyear : str or list
+        Year being processed (YYYY), or a list of consecutive years to
+        process in batch mode
+    tar : gfdlvitals.util.netcdf.TarIndex or list
+        Indexed history tarfile object, or a list with one per year
     modules : dict
         Mappings of netCDF file names inside the tar file to output db file names
     """
 
-    members = [
-        x for x in modules if netcdf.tar_member_exists(tar, f"{fyear}.{x}.tile1.nc")
-    ]
+    fyears = fyear if isinstance(fyear, list) else [fyear]
+    tars = tar if isinstance(tar, list) else [tar]
 
-    for member in members:
-        print(f"{fyear}.{member}.nc")
-        data_files = [
-            netcdf.extract_from_tar(tar, f"{fyear}.{member}.tile{x}.nc")
-            for x in range(1, 7)
-        ]
-        data_files = [netcdf.in_mem_xr(x) for x in data_files]
-        dset = xr.concat(data_files, "tile")
-
-        # Retain only time-dependent variables
-        variables = list(dset.variables.keys())
-        for x in variables:
-            if "time" not in dset[x].dims:
-                del dset[x]
-
-        # Aggregate grid spec tiles
-        grid_files = [
-            netcdf.extract_from_tar(tar, f"{fyear}.grid_spec.tile{x}.nc")
-            for x in range(1, 7)
+    for member in modules:
+        years = [
+            (x, y)
+            for x, y in zip(fyears, tars)
+            if netcdf.tar_member_exists(y, f"{x}.{member}.tile1.nc")
         ]
-        grid_files = [netcdf.in_mem_xr(x) for x in grid_files]
-        ds_grid = xr.concat(grid_files, "tile")
 
-        dset["area"] = ds_grid["area"]
+        dsets = []
+        grids = []
+        for _fyear, _tar in years:
+            print(f"{_fyear}.{member}.nc")
+            data_files = [
+                netcdf.extract_buffer(_tar, f"{_fyear}.{member}.tile{x}.nc")
+                for x in range(1, 7)
+            ]
+            data_files = [netcdf.in_mem_xr(x) for x in data_files]
 
-        for region in ["global", "nh", "sh", "tropics"]:
-            _masked_area = xrtools.xr_mask_by_latitude(
-                dset.area, ds_grid.grid_latt, region=region
-            )
-            gmeantools.write_sqlite_data(
-                f"{fyear}.{region}Ave{modules[member]}.db",
-                "area",
-                fyear,
-                _masked_area.sum().data,
-            )
+            # Retain only time-dependent variables before the tiles are read
+            data_files = [xrtools.xr_time_dependent(x) for x in data_files]
 
-            t_bounds = dset.time_bnds
-            dt = t_bounds.isel(nv=1) - t_bounds.isel(nv=0)
-            weights = dt.astype("float") * _masked_area
-            _dset_weighted = xrtools.xr_weighted_avg(dset, weights)
-            xrtools.xr_to_db(
-                _dset_weighted, fyear, f"{fyear}.{region}Ave{modules[member]}.db"
+            # When averaging in chunks, tiles are read chunk by chunk
+            if not xrtools.is_chunked():
+                dsets.append(xr.concat(data_files, "tile"))
+            else:
+                dsets.append(xrtools.xr_concat_lazy(data_files, "tile"))
+
+            # Aggregate grid spec tiles
+            grids.append(
+                gridcache.load_grid(
+                    _tar,
+                    [f"{_fyear}.grid_spec.tile{x}.nc" for x in range(1, 7)],
+                    variables=["area", "grid_latt", "grid_lont"],
+                    concat_dim="tile",
+                )
             )
+
+        # Years on the same grid are averaged together
+        if len(dsets) > 1 and all(x is grids[0] for x in grids):
+            dset = xrtools.xr_stack_years(dsets, [x[0] for x in years])
+            if dset is not None:
+                _average(dset, grids[0], [x[0] for x in years], modules[member])
+                continue
+
+        for (_fyear, _), _dset, ds_grid in zip(years, dsets, grids):
+            _average(_dset, ds_grid, [_fyear], modules[member])
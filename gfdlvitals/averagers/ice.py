@@ -3,8 +3,10 @@
 import warnings
 
 import numpy as np
+import xarray as xr
 
 import gfdlvitals.util.gmeantools as gmeantools
+import gfdlvitals.util.gridcache as gridcache
 import gfdlvitals.util.xrtools as xrtools
 import gfdlvitals.util.netcdf as netcdf
 
@@ -12,6 +14,103 @@ import gfdlvitals.util.netcdf as netcdf
 __all__ = ["xr_average"]
 
 
+def _regional_sums(arr, masked_area):
+    """Sums an array times the masked cell area for each region
+
+    Parameters
+    ----------
+    arr : xarray.DataArray
+        Input array with the horizontal dimensions last
+    masked_area : xarray.DataArray
+        Masked cell areas with a leading "region" dimension
+
+    Returns
+    -------
+    xarray.DataArray
+        Area-weighted sums with a leading "region" dimension
+    """
+    # -- Reduce one region at a time into a preallocated output so that
+    #    only a single product of the array and an area is held in memory
+    values = arr.values
+    area = masked_area.values
+    sums = np.empty(
+        area.shape[:1] + values.shape[:-2], dtype=np.result_type(values, area)
+    )
+    for i, region_area in enumerate(area):
+        sums[i] = np.nansum(values * region_area, axis=(-2, -1))
+    coords = {x: arr[x] for x in arr.dims[:-2] if x in arr.coords}
+    coords["region"] = masked_area["region"]
+    return xr.DataArray(sums, dims=("region",) + arr.dims[:-2], coords=coords)
+
+
+def _regional_stats(dset, concentration, masked_area, dt):
+    """Computes the statistics of the sea ice variables for all regions
+
+    Each variable is read once, in time chunks if a memory budget or
+    streaming is set in `xrtools`, and reduced for all regions together.
+    The area covered by sea ice and the extent are derived from the same
+    chunks of the concentration.
+
+    Parameters
+    ----------
+    dset : xarray.DataSet
+        Time-dependent sea ice variables
+    concentration : xarray.DataArray or None
+        Sea ice concentration
+    masked_area : xarray.DataArray
+        Masked cell areas with a leading "region" dimension
+    dt : xarray.DataArray
+        Time step used to weight the time mean
+
+    Returns
+    -------
+    xarray.DataSet
+        Time mean, maximum, and minimum of each variable for each region
+    """
+    hdims = masked_area.dims[1:]
+    total_area = masked_area.sum(hdims)
+
+    attrs = {
+        "ice_area": {"long_name": "area covered by sea ice", "units": "million km2"},
+        "extent": {"long_name": "sea ice extent", "units": "million km2"},
+    }
+    accumulators = {}
+
+    def _accumulate(name, arr, weight):
+        if name not in accumulators:
+            accumulators[name] = (xrtools.RegionAccumulator(["time"]), arr.dtype)
+        accumulators[name][0].add(arr, weight)
+        accumulators[name][0].add_extrema(arr, "time")
+
+    variables = [x for x in dset.data_vars if dset[x].dims[-3:] == ("time",) + hdims]
+    for x in variables:
+        attrs.setdefault(x, dset[x].attrs)
+        indexers = xrtools.xr_chunk_indexers(dset[x], dims=["time"])
+        for indexer, chunk in xrtools.xr_iter_chunks(dset[x], indexers):
+            weight = dt.isel(indexer)
+            _accumulate(x, _regional_sums(chunk, masked_area) / total_area, weight)
+            if concentration is not None and x == concentration.name:
+                for name, threshold in [("ice_area", 0.0), ("extent", 0.15)]:
+                    covered = (chunk > threshold).astype(chunk.dtype)
+                    covered = _regional_sums(covered, masked_area) * 1.0e-12
+                    _accumulate(name, covered, weight)
+
+    names = [x for x in attrs if x in accumulators]
+    result = xr.Dataset(coords={"region": masked_area["region"]})
+    for stat in ["mean", "max", "min"]:
+        for x in names:
+            accumulator, dtype = accumulators[x]
+            if stat == "mean":
+                arr = accumulator.mean().astype(dtype)
+            else:
+                arr = accumulator.maximum if stat == "max" else accumulator.minimum
+            result[f"{x}_{stat}"] = xr.DataArray(
+                arr.data, dims="region", attrs=attrs[x]
+            )
+
+    return result
+
+
 def xr_average(fyear, tar, modules):
     """xarray-based processing routines for lat-lon model output
 
@@ -19,8 +118,8 @@ def xr_average(fyear, tar, modules):
     ----------
     fyear : str
         Year being processed (YYYY)
-    tar : tarfile
-        In-memory tarfile object
+    tar : gfdlvitals.util.netcdf.TarIndex
+        Indexed history tarfile object
     modules : dict
         Mappings of netCDF file names inside the tar file to output db file names
     """
@@ -29,32 +128,33 @@ def xr_average(fyear, tar, modules):
 
     for member in members:
         print(f"{fyear}.{member}.nc")
-        data_file = netcdf.extract_from_tar(tar, f"{fyear}.ice_month.nc")
+        data_file = netcdf.extract_buffer(tar, f"{fyear}.ice_month.nc")
         dset = netcdf.in_mem_xr(data_file)
 
+        # Retain only time-dependent variables
+        dset = xrtools.xr_time_dependent(dset)
+        if "CN" in dset.variables:
+            dset["CN"] = dset["CN"].sum(("ct")).assign_attrs(dset["CN"].attrs)
+
+        # Monthly files change every year, so only static files are cached
+        grid_variables = ["Ah", "geolat", "CELL_AREA", "GEOLAT"]
         if netcdf.tar_member_exists(tar, f"{fyear}.ice_static.nc"):
-            grid_file = f"{fyear}.ice_static.nc"
+            ds_grid = gridcache.load_grid(
+                tar, f"{fyear}.ice_static.nc", variables=grid_variables
+            )
         elif netcdf.tar_member_exists(tar, f"{fyear}.sea_ice_geometry.nc"):
-            grid_file = f"{fyear}.sea_ice_geometry.nc"
+            ds_grid = gridcache.load_grid(
+                tar, f"{fyear}.sea_ice_geometry.nc", variables=grid_variables
+            )
         else:
-            grid_file = f"{fyear}.ice_month.nc"
-
-        grid_file = netcdf.extract_from_tar(tar, grid_file)
-        ds_grid = netcdf.in_mem_xr(grid_file)
-
-        # Retain only time-dependent variables
-        variables = list(dset.variables.keys())
-        for x in variables:
-            if "time" not in dset[x].dims:
-                del dset[x]
-            if x == "CN":
-                dset[x] = dset[x].sum(("ct")).assign_attrs(dset[x].attrs)
+            ds_grid = netcdf.in_mem_xr(data_file, variables=grid_variables)
 
         if "CN" in list(dset.variables.keys()):
             concentration = dset["CN"]
         elif "siconc" in list(dset.variables.keys()):
             concentration = dset["siconc"]
         else:
+            concentration = None
             warnings.warn("Unable to determine sea ice concentation")
 
         if "Ah" in ds_grid.variables:
@@ -72,78 +172,37 @@ def xr_average(fyear, tar, modules):
 
             _area = ds_grid["CELL_AREA"] * 4.0 * np.pi * (earth_radius**2)
 
-        # --- todo Add in concentration and extent
+        if "geolat" in ds_grid.variables:
+            _geolat = ds_grid["geolat"]
+            _geolat = _geolat.rename({"lath": "yT", "lonh": "xT"})
+        else:
+            _geolat = ds_grid["GEOLAT"]
 
-        for region in ["global", "nh", "sh"]:
+        # Area masks for all hemispheres, stacked along a region dimension
+        regions = ["global", "nh", "sh"]
+        _masked_area = xrtools.xr_region_weights(_area, _geolat, regions=regions)
 
-            if "geolat" in ds_grid.variables:
-                _geolat = ds_grid["geolat"]
-                _geolat = _geolat.rename({"lath": "yT", "lonh": "xT"})
-            else:
-                _geolat = ds_grid["GEOLAT"]
+        t_bounds = dset.time_bnds
+        dt = t_bounds.isel(nv=1) - t_bounds.isel(nv=0)
+        dt = dt.astype("float")
+
+        stats = _regional_stats(dset, concentration, _masked_area, dt)
 
-            _masked_area = xrtools.xr_mask_by_latitude(_area, _geolat, region=region)
-            gmeantools.write_sqlite_data(
+        # Buffer results and write each db file in a single transaction
+        writer = gmeantools.VitalsWriter()
+
+        for region in regions:
+            writer.write_sqlite_data(
                 f"{fyear}.{region}Ave{modules[member]}.db",
                 "area",
                 fyear,
-                _masked_area.sum().data,
+                _masked_area.sel(region=region).sum().data,
+            )
+            xrtools.xr_to_db(
+                stats.sel(region=region, drop=True),
+                fyear,
+                f"{fyear}.{region}AveIce.db",
+                writer=writer,
             )
 
-            # area-weight but not time_weight
-            weights = _masked_area
-            _dset = dset.copy()
-
-            ones = (concentration * 0.0) + 1.0
-            ice_area = ones.where(concentration > 0.0, 0.0) * _masked_area
-            extent = ones.where(concentration > 0.15, 0.0) * _masked_area
-
-            ice_area_attrs = {
-                "long_name": "area covered by sea ice",
-                "units": "million km2",
-            }
-            extent_attrs = {"long_name": "sea ice extent", "units": "million km2"}
-
-            for x in list(_dset.variables):
-                if tuple(_dset[x].dims)[-3::] == ("time", "yT", "xT"):
-                    _dset[x] = (
-                        (_dset[x] * weights).sum(("yT", "xT")) / weights.sum()
-                    ).assign_attrs(dset[x].attrs)
-                    _dset["ice_area"] = (
-                        ice_area.sum(("yT", "xT")) * 1.0e-12
-                    ).assign_attrs(ice_area_attrs)
-                    _dset["extent"] = (extent.sum(("yT", "xT")) * 1.0e-12).assign_attrs(
-                        extent_attrs
-                    )
-                elif tuple(_dset[x].dims)[-3::] == ("time", "yt", "xt"):
-                    _dset[x] = (
-                        (_dset[x] * weights).sum(("yt", "xt")) / weights.sum()
-                    ).assign_attrs(dset[x].attrs)
-                    _dset["ice_area"] = (
-                        ice_area.sum(("yt", "xt")) * 1.0e-12
-                    ).assign_attrs(ice_area_attrs)
-                    _dset["extent"] = (extent.sum(("yt", "xt")) * 1.0e-12).assign_attrs(
-                        extent_attrs
-                    )
-                else:
-                    del _dset[x]
-
-            _dset_max = _dset.max(("time"))
-            newvars = {x: x + "_max" for x in list(_dset_max.variables)}
-            _dset_max = _dset_max.rename(newvars)
-
-            _dset_min = _dset.min(("time"))
-            newvars = {x: x + "_min" for x in list(_dset_min.variables)}
-            _dset_min = _dset_min.rename(newvars)
-
-            t_bounds = dset.time_bnds
-            dt = t_bounds.isel(nv=1) - t_bounds.isel(nv=0)
-            weights = dt.astype("float")
-
-            _dset_weighted = xrtools.xr_weighted_avg(_dset, weights)
-            newvars = {x: x + "_mean" for x in list(_dset_weighted.variables)}
-            _dset_weighted = _dset_weighted.rename(newvars)
-
-            xrtools.xr_to_db(_dset_weighted, fyear, f"{fyear}.{region}AveIce.db")
-            xrtools.xr_to_db(_dset_max, fyear, f"{fyear}.{region}AveIce.db")
-            xrtools.xr_to_db(_dset_min, fyear, f"{fyear}.{region}AveIce.db")
+        writer.flush()
@@ -1,8 +1,10 @@
 """ Legacy land model averaging routines """
 
+import atexit
 import multiprocessing
 
 from functools import partial
+from multiprocessing import shared_memory
 
 import numpy as np
 
@@ -10,13 +12,205 @@ from gfdlvitals.util.average import RichVariable
 from gfdlvitals.util.average import process_var
 
 import gfdlvitals.util.netcdf as nctools
+import gfdlvitals.util.scheduler as scheduler
 
 __all__ = ["average"]
 
+# Worker pool that is reused across calls, and its number of processes
+_POOL = None
+_POOL_SIZE = None
 
-def average(grid_file, data_file, fyear, out, lab):
+# Per-worker state for the shared data of the current call
+_WORKER_CACHE = {}
+
+
+def _get_pool(processes):
+    """Returns the persistent worker pool, starting it if needed
+
+    The pool is restarted if the number of processes changes.
+
+    Parameters
+    ----------
+    processes : int
+        Number of worker processes
+
+    Returns
+    -------
+    multiprocessing.Pool
+        Worker pool
+    """
+    global _POOL, _POOL_SIZE
+    if _POOL is not None and _POOL_SIZE != processes:
+        _close_pool()
+    if _POOL is None:
+        _POOL = multiprocessing.Pool(processes)
+        _POOL_SIZE = processes
+        atexit.register(_close_pool)
+    return _POOL
+
+
+def _close_pool():
+    """Shuts down the persistent worker pool"""
+    global _POOL, _POOL_SIZE
+    if _POOL is not None:
+        _POOL.close()
+        _POOL.join()
+        _POOL = None
+        _POOL_SIZE = None
+
+
+def _share(arrays):
+    """Copies arrays into shared memory blocks
+
+    Masked arrays are stored as separate data and mask blocks.
+
+    Parameters
+    ----------
+    arrays : dict
+        Mappings of names to numpy arrays
+
+    Returns
+    -------
+    tuple
+        List of shared memory blocks and a dict of their descriptors
+    """
+    blocks = []
+    shared = {}
+    for key, arr in arrays.items():
+        parts = {key: np.ma.getdata(arr)}
+        if isinstance(arr, np.ma.MaskedArray):
+            parts[f"{key}.mask"] = np.ma.getmaskarray(arr)
+        for name, part in parts.items():
+            part = np.ascontiguousarray(part)
+            block = shared_memory.SharedMemory(create=True, size=max(part.nbytes, 1))
+            np.ndarray(part.shape, dtype=part.dtype, buffer=block.buf)[...] = part
+            blocks.append(block)
+            shared[name] = (block.name, part.shape, part.dtype.str)
+    return blocks, shared
+
+
+def _attach(name):
+    """Attaches to a shared memory block created by the parent process"""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13 always tracks blocks. Workers share the resource
+        # tracker of the parent, which unlinks the blocks.
+        return shared_memory.SharedMemory(name=name)
+
+
+def _worker_state(shared):
+    """Returns the arrays and parsed data file for the current call
+
+    Each worker attaches to the shared memory and parses the data file
+    once per call, and reuses them for every variable.
+
+    Parameters
+    ----------
+    shared : dict
+        Descriptors of the shared memory blocks
+
+    Returns
+    -------
+    dict
+        Worker state with "arrays" and "dataset" entries
+    """
+    key = shared["data_file"][0]
+    if _WORKER_CACHE.get("key") != key:
+        # Release the state of the previous call
+        if "dataset" in _WORKER_CACHE:
+            _WORKER_CACHE["dataset"].close()
+        blocks = _WORKER_CACHE.get("blocks", [])
+        _WORKER_CACHE.clear()
+        for block in blocks:
+            try:
+                block.close()
+            except BufferError:
+                pass
+
+        blocks = []
+        arrays = {}
+        for name, (block_name, shape, dtype) in shared.items():
+            block = _attach(block_name)
+            arr = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+            arr.flags.writeable = False
+            blocks.append(block)
+            arrays[name] = arr
+        for name in [x for x in arrays if x.endswith(".mask")]:
+            mask = arrays.pop(name)
+            arrays[name[:-5]] = np.ma.array(arrays[name[:-5]], mask=mask)
+
+        _WORKER_CACHE["key"] = key
+        _WORKER_CACHE["blocks"] = blocks
+        _WORKER_CACHE["arrays"] = arrays
+        _WORKER_CACHE["dataset"] = nctools.in_mem_nc(arrays["data_file"])
+
+    return _WORKER_CACHE
+
+
+def _process_land_var(varname, arrays, dataset, fyear, out, lab):
+    """Processes a variable with the grid arrays and parsed data file
+
+    Parameters
+    ----------
+    varname : str
+        Variable name
+    arrays : dict
+        Mappings of names to grid arrays
+    dataset : netCDF4.Dataset
+        Parsed data file
+    fyear : str
+        Year being processed
+    out : str
+        Output path directory
+    lab : str
+        DB file name
+    """
+    variable = RichVariable(
+        varname,
+        None,
+        dataset,
+        fyear,
+        out,
+        lab,
+        arrays["geolat"],
+        arrays["geolon"],
+        cell_area=arrays["cell_area"],
+        cell_frac=arrays["cell_frac"],
+        soil_area=arrays["soil_area"],
+        soil_frac=arrays["soil_frac"],
+    )
+    process_var(variable, averager="land-lm3")
+
+
+def _process_shared_var(varname, shared, fyear, out, lab):
+    """Worker function that processes a variable from shared memory
+
+    Parameters
+    ----------
+    varname : str
+        Variable name
+    shared : dict
+        Descriptors of the shared memory blocks
+    fyear : str
+        Year being processed
+    out : str
+        Output path directory
+    lab : str
+        DB file name
+    """
+    state = _worker_state(shared)
+    _process_land_var(varname, state["arrays"], state["dataset"], fyear, out, lab)
+
+
+def average(grid_file, data_file, fyear, out, lab, processes=None):
     """Mid-level averaging routine
 
+    The variables are processed by a persistent worker pool. The data file
+    and grid arrays are placed in shared memory rather than being pickled
+    for every variable. With a single process, the variables are
+    processed in the calling process without a pool.
+
     Parameters
     ----------
     grid_file : bytes-like
@@ -29,8 +223,14 @@ def average(grid_file, data_file, fyear, out, lab):
         Output path directory
     lab : [type]
         DB file name
+    processes : int, optional
+        Number of worker processes, by default the CPUs available to each
+        of the concurrent jobs (see `scheduler.worker_processes`)
     """
 
+    if hasattr(data_file, "read"):
+        data_file = data_file.read()
+
     _grid_file = nctools.in_mem_nc(grid_file)
     _data_file = nctools.in_mem_nc(data_file)
 
@@ -53,23 +253,41 @@ def average(grid_file, data_file, fyear, out, lab):
     soil_frac = np.ma.array(soil_area / (cell_area * cell_frac))
 
     variables = list(_data_file.variables.keys())
-    variables = [
-        RichVariable(
-            x,
-            grid_file,
-            data_file,
-            fyear,
-            out,
-            lab,
-            geolat,
-            geolon,
-            cell_area=cell_area,
-            cell_frac=cell_frac,
-            soil_area=soil_area,
-            soil_frac=soil_frac,
+    _grid_file.close()
+
+    arrays = {
+        "geolat": geolat,
+        "geolon": geolon,
+        "cell_area": cell_area,
+        "cell_frac": cell_frac,
+        "soil_area": soil_area,
+        "soil_frac": soil_frac,
+    }
+
+    processes = scheduler.worker_processes() if processes is None else processes
+    if processes <= 1:
+        for varname in variables:
+            _process_land_var(varname, arrays, _data_file, fyear, out, lab)
+        _data_file.close()
+        return
+
+    _data_file.close()
+    blocks, shared = _share(
+        dict(arrays, data_file=np.frombuffer(data_file, dtype=np.uint8))
+    )
+
+    try:
+        _get_pool(processes).map(
+            partial(_process_shared_var, shared=shared, fyear=fyear, out=out, lab=lab),
+            variables,
         )
-        for x in variables
-    ]
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
 
-    pool = multiprocessing.Pool(multiprocessing.cpu_count())
-    pool.map(partial(process_var, **{"averager": "land-lm3"}), variables)
+        # -- Worker processes, e.g. with --jobs, do not run exit handlers
+        #    and would wait for the pool forever, so only the main process
+        #    keeps it
+        if multiprocessing.parent_process() is not None:
+            _close_pool()
@@ -3,13 +3,35 @@
 import xarray as xr
 
 import gfdlvitals.util.gmeantools as gmeantools
+import gfdlvitals.util.gridcache as gridcache
 import gfdlvitals.util.xrtools as xrtools
 import gfdlvitals.util.netcdf as netcdf
+import gfdlvitals.util.regions as regions
 
 
 __all__ = ["xr_average"]
 
 
+def _land_points(ds_grid):
+    """Returns indexers of the grid cells with a nonzero land area
+
+    Parameters
+    ----------
+    ds_grid : xarray.Dataset
+        Land static grid
+
+    Returns
+    -------
+    dict
+        Indexers from `xrtools.xr_gather_index`
+    """
+    areas = [ds_grid[x] for x in ds_grid.data_vars if "area" in x]
+    mask = areas[0].fillna(0.0) > 0.0
+    for x in areas[1:]:
+        mask = mask | (x.fillna(0.0) > 0.0)
+    return xrtools.xr_gather_index(mask, dim="land_point")
+
+
 def xr_average(fyear, tar, modules):
     """xarray-based processing routines for cubed sphere LM4 land output
 
@@ -17,8 +39,8 @@ def xr_average(fyear, tar, modules):
     ----------
     fyear : str
         Year being processed (YYYY)
-    tar : tarfile
-        In-memory tarfile object
+    tar : gfdlvitals.util.netcdf.TarIndex
+        Indexed history tarfile object
     modules : dict
         Mappings of netCDF file names inside the tar file to output db file names
     """
@@ -30,31 +52,40 @@ def xr_average(fyear, tar, modules):
     for member in members:
         print(f"{fyear}.{member}.nc")
         data_files = [
-            netcdf.extract_from_tar(tar, f"{fyear}.{member}.tile{x}.nc")
+            netcdf.extract_buffer(tar, f"{fyear}.{member}.tile{x}.nc")
             for x in range(1, 7)
         ]
         data_files = [netcdf.in_mem_xr(x) for x in data_files]
-        dset = xr.concat(data_files, "tile")
 
         # Calculate cell depth
-        depth = dset["zhalf_soil"].data
+        depth = data_files[0]["zhalf_soil"].data
         depth = [depth[x] - depth[x - 1] for x in range(1, len(depth))]
-        dset["depth"] = xr.DataArray(depth, dims=("zfull_soil"))
-        depth = dset["depth"]
+        depth = xr.DataArray(depth, dims=("zfull_soil"))
 
-        # Retain only time-dependent variables
-        variables = list(dset.variables.keys())
-        for x in variables:
-            if "time" not in dset[x].dims:
-                del dset[x]
+        # Retain only time-dependent variables before the tiles are read
+        data_files = [xrtools.xr_time_dependent(x) for x in data_files]
+
+        # When averaging in chunks, tiles are read chunk by chunk
+        if not xrtools.is_chunked():
+            dset = xr.concat(data_files, "tile")
+        else:
+            dset = xrtools.xr_concat_lazy(data_files, "tile")
 
         # Load grid data
-        grid_files = [
-            netcdf.extract_from_tar(tar, f"{fyear}.land_static.tile{x}.nc")
-            for x in range(1, 7)
+        grid_members = [f"{fyear}.land_static.tile{x}.nc" for x in range(1, 7)]
+        grid_variables = netcdf.in_mem_xr(netcdf.extract_buffer(tar, grid_members[0]))
+        grid_variables = [
+            x
+            for x in grid_variables.variables
+            if "area" in x or "frac" in x or x in ["geolat_t", "geolon_t"]
         ]
-        grid_files = [netcdf.in_mem_xr(x) for x in grid_files]
-        ds_grid = xr.concat(grid_files, "tile")
+        ds_grid = gridcache.load_grid(
+            tar, grid_members, variables=grid_variables, concat_dim="tile"
+        )
+
+        # Pack the land cells into one dimension. Ocean cells have no
+        # weight and are skipped by the averages of the predefined regions.
+        land_points = gridcache.derived(ds_grid, "land_points", _land_points)
 
         # Retain only time-invariant area fields
         grid = xr.Dataset()
@@ -91,6 +122,9 @@ def xr_average(fyear, tar, modules):
         if "area: glac_area" in cell_measures:
             cell_measures.remove("area: glac_area")
 
+        # Buffer results and write each db file in a single transaction
+        writer = gmeantools.VitalsWriter()
+
         # Loop over groups
         for measure in cell_measures:
             _dset = land_groups[measure]
@@ -98,42 +132,94 @@ def xr_average(fyear, tar, modules):
             _measure = measure.split(" ")[-1]
             _area = ds_grid[_measure]
 
-            for region in ["global", "nh", "sh", "tropics"]:
-                _masked_area = xrtools.xr_mask_by_latitude(
-                    _area, ds_grid.geolat_t, region=region
-                )
-                gmeantools.write_sqlite_data(
+            # Region areas are summed over the full grid
+            _masked_area = xrtools.xr_region_weights(_area, ds_grid.geolat_t)
+
+            # Average all regions in a single reduction over the land cells
+            _land_area = xrtools.xr_region_weights(
+                xrtools.xr_gather(_area, land_points),
+                xrtools.xr_gather(ds_grid.geolat_t, land_points),
+            )
+
+            # _masked_area = _masked_area.fillna(0)
+
+            t_bounds = dset.time_bnds
+            dt = t_bounds.isel(nv=1) - t_bounds.isel(nv=0)
+            if "tile" in dt.dims:
+                dt = dt.isel(tile=0, drop=True)
+            weights = dt.astype("float") * _land_area
+            if _measure == "soil_area":
+                area_x_depth = _masked_area * depth
+                weights = [
+                    weights,
+                    (weights * depth).transpose(
+                        ..., "time", "zfull_soil", "land_point"
+                    ),
+                ]
+                for x in list(_dset.variables):
+                    if "zfull_soil" in list(_dset[x].dims):
+                        _dset[x].attrs["measure"] = "soil_volume"
+
+            _dset_weighted = xrtools.xr_weighted_avg(
+                xrtools.xr_gather(_dset, land_points),
+                weights,
+                split_dims=["time", "zfull_soil"],
+            )
+
+            for region in xrtools.REGIONS:
+                writer.write_sqlite_data(
                     f"{fyear}.{region}Ave{modules[member]}.db",
                     _measure,
                     fyear,
-                    _masked_area.sum().data,
+                    _masked_area.sel(region=region).sum().data,
                 )
 
-                # _masked_area = _masked_area.fillna(0)
-
-                t_bounds = dset.time_bnds
-                dt = t_bounds.isel(nv=1) - t_bounds.isel(nv=0)
-                weights = dt.astype("float") * _masked_area
                 if _measure == "soil_area":
-                    area_x_depth = _masked_area * depth
-                    gmeantools.write_sqlite_data(
+                    writer.write_sqlite_data(
                         f"{fyear}.{region}Ave{modules[member]}.db",
                         "soil_volume",
                         fyear,
-                        area_x_depth.sum().data,
+                        area_x_depth.sel(region=region).sum().data,
                     )
-                    weights = [
-                        weights,
-                        (weights * depth).transpose(
-                            "tile", "time", "zfull_soil", "grid_yt", "grid_xt"
-                        ),
-                    ]
-                    for x in list(_dset.variables):
-                        if "zfull_soil" in list(_dset[x].dims):
-                            _dset[x].attrs["measure"] = "soil_volume"
-
-                _dset_weighted = xrtools.xr_weighted_avg(_dset, weights)
 
                 xrtools.xr_to_db(
-                    _dset_weighted, fyear, f"{fyear}.{region}Ave{modules[member]}.db"
+                    _dset_weighted.sel(region=region, drop=True),
+                    fyear,
+                    f"{fyear}.{region}Ave{modules[member]}.db",
+                    writer=writer,
                 )
+
+            # Average user-defined regions with sparse weights
+            _regions = regions.weight_matrix(ds_grid.geolat_t, ds_grid.get("geolon_t"))
+            if len(_regions.names) > 0:
+                _region_area = regions.region_sum(_area, _regions)
+                weights = dt.astype("float") * _area
+                if _measure == "soil_area":
+                    _region_volume = regions.region_sum(_area * depth, _regions)
+                    weights = [weights, weights * depth]
+                _dset_weighted = regions.weighted_avg(_dset, weights, _regions)
+
+                for region in _regions.names:
+                    writer.write_sqlite_data(
+                        f"{fyear}.{region}Ave{modules[member]}.db",
+                        _measure,
+                        fyear,
+                        _region_area.sel(region=region).data,
+                    )
+
+                    if _measure == "soil_area":
+                        writer.write_sqlite_data(
+                            f"{fyear}.{region}Ave{modules[member]}.db",
+                            "soil_volume",
+                            fyear,
+                            _region_volume.sel(region=region).data,
+                        )
+
+                    xrtools.xr_to_db(
+                        _dset_weighted.sel(region=region, drop=True),
+                        fyear,
+                        f"{fyear}.{region}Ave{modules[member]}.db",
+                        writer=writer,
+                    )
+
+        writer.flush()
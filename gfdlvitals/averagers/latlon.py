@@ -7,60 +7,136 @@ import xarray as xr
 import gfdlvitals.util.gmeantools as gmeantools
 import gfdlvitals.util.xrtools as xrtools
 import gfdlvitals.util.netcdf as netcdf
+import gfdlvitals.util.regions as regions
 
 
 __all__ = ["xr_average"]
 
 
+def _average(dset, fyears, label):
+    """Averages a member of one year, or of several stacked years
+
+    Parameters
+    ----------
+    dset : xarray.DataSet
+        Model output, optionally with a "year" dimension
+        (see `xrtools.xr_stack_years`)
+    fyears : list
+        Years being processed (YYYY)
+    label : str
+        Output db file name
+    """
+    geolat = np.tile(dset.lat.data[:, None], (1, dset.lon.data.shape[0]))
+    geolon = np.tile(dset.lon.data[None, :], (dset.lat.data.shape[0], 1))
+
+    _geolat = xr.DataArray(geolat, coords=((dset.lat, dset.lon)))
+    _geolon = xr.DataArray(geolon, coords=((dset.lat, dset.lon)))
+    _area = xr.DataArray(
+        gmeantools.standard_grid_cell_area(dset.lat.data, dset.lon.data),
+        coords=((dset.lat, dset.lon)),
+    )
+
+    # Retain only time-dependent variables
+    dset = xrtools.xr_time_dependent(dset)
+
+    # Buffer results and write each db file in a single transaction
+    writer = gmeantools.VitalsWriter()
+
+    # Average all regions and years in a single reduction
+    _masked_area = xrtools.xr_region_weights(_area, _geolat)
+    t_bounds = dset.time_bnds
+    dt = t_bounds.isel(nv=1) - t_bounds.isel(nv=0)
+    weights = dt.astype("float") * _masked_area
+    _dset_weighted = xrtools.xr_weighted_avg(dset, weights)
+
+    for fyear in fyears:
+        _year = {"year": fyear} if "year" in dset.dims else {}
+        for region in xrtools.REGIONS:
+            writer.write_sqlite_data(
+                f"{fyear}.{region}Ave{label}.db",
+                "area",
+                fyear,
+                _masked_area.sel(region=region).sum().data,
+            )
+            xrtools.xr_to_db(
+                _dset_weighted.sel(region=region, **_year, drop=True),
+                fyear,
+                f"{fyear}.{region}Ave{label}.db",
+                writer=writer,
+            )
+
+    # Average user-defined regions with sparse weights
+    _regions = regions.weight_matrix(_geolat, _geolon)
+    if len(_regions.names) > 0:
+        _region_area = regions.region_sum(_area, _regions)
+        for fyear in fyears:
+            _year = {"year": fyear} if "year" in dset.dims else {}
+            _dset_weighted = regions.weighted_avg(
+                dset.sel(_year, drop=True),
+                dt.sel(_year, drop=True).astype("float") * _area,
+                _regions,
+            )
+            for region in _regions.names:
+                writer.write_sqlite_data(
+                    f"{fyear}.{region}Ave{label}.db",
+                    "area",
+                    fyear,
+                    _region_area.sel(region=region).data,
+                )
+                xrtools.xr_to_db(
+                    _dset_weighted.sel(region=region, drop=True),
+                    fyear,
+                    f"{fyear}.{region}Ave{label}.db",
+                    writer=writer,
+                )
+
+    writer.flush()
+
+
 def xr_average(fyear, tar, modules):
     """xarray-based processing routines for lat-lon model output
 
+    In batch mode, a member is read from the tar files of several years,
+    stacked along a "year" dimension, and averaged in a single reduction.
+
     Parameters
     ----------
-    fyear : str
-        Year being processed (YYYY)
-    tar : tarfile
-        In-memory tarfile object
+    fyear : str or list
+        Year being processed (YYYY), or a list of consecutive years to
+        process in batch mode
+    tar : gfdlvitals.util.netcdf.TarIndex or list
+        Indexed history tarfile object, or a list with one per year
     modules : dict
         Mappings of netCDF file names inside the tar file to output db file names
     """
 
-    members = [x for x in modules if netcdf.tar_member_exists(tar, f"{fyear}.{x}.nc")]
-
-    for member in members:
-        print(f"{fyear}.{member}.nc")
-        data_file = netcdf.extract_from_tar(tar, f"{fyear}.{member}.nc")
-        dset = netcdf.in_mem_xr(data_file)
-
-        geolat = np.tile(dset.lat.data[:, None], (1, dset.lon.data.shape[0]))
-        geolon = np.tile(dset.lon.data[None, :], (dset.lat.data.shape[0], 1))
-
-        _geolat = xr.DataArray(geolat, coords=((dset.lat, dset.lon)))
-        _geolon = xr.DataArray(geolon, coords=((dset.lat, dset.lon)))
-        _area = xr.DataArray(
-            gmeantools.standard_grid_cell_area(dset.lat.data, dset.lon.data),
-            coords=((dset.lat, dset.lon)),
-        )
-
-        # Retain only time-dependent variables
-        variables = list(dset.variables.keys())
-        for x in variables:
-            if "time" not in dset[x].dims:
-                del dset[x]
-
-        for region in ["global", "nh", "sh", "tropics"]:
-            _masked_area = xrtools.xr_mask_by_latitude(_area, _geolat, region=region)
-            gmeantools.write_sqlite_data(
-                f"{fyear}.{region}Ave{modules[member]}.db",
-                "area",
-                fyear,
-                _masked_area.sum().data,
-            )
+    fyears = fyear if isinstance(fyear, list) else [fyear]
+    tars = tar if isinstance(tar, list) else [tar]
 
-            t_bounds = dset.time_bnds
-            dt = t_bounds.isel(nv=1) - t_bounds.isel(nv=0)
-            weights = dt.astype("float") * _masked_area
-            _dset_weighted = xrtools.xr_weighted_avg(dset, weights)
-            xrtools.xr_to_db(
-                _dset_weighted, fyear, f"{fyear}.{region}Ave{modules[member]}.db"
+    for member in modules:
+        years = [
+            (x, y)
+            for x, y in zip(fyears, tars)
+            if netcdf.tar_member_exists(y, f"{x}.{member}.nc")
+        ]
+
+        dsets = []
+        for _fyear, _tar in years:
+            print(f"{_fyear}.{member}.nc")
+            data_file = netcdf.extract_buffer(_tar, f"{_fyear}.{member}.nc")
+            dsets.append(netcdf.in_mem_xr(data_file))
+
+        # Years on the same grid are averaged together
+        if len(dsets) > 1 and all(
+            x.lat.equals(dsets[0].lat) and x.lon.equals(dsets[0].lon) for x in dsets
+        ):
+            dset = xrtools.xr_stack_years(
+                [xrtools.xr_time_dependent(x) for x in dsets], [x[0] for x in years]
             )
+            if dset is not None:
+                dset = dset.assign_coords(lat=dsets[0].lat, lon=dsets[0].lon)
+                _average(dset, [x[0] for x in years], modules[member])
+                continue
+
+        for (_fyear, _), _dset in zip(years, dsets):
+            _average(_dset, [_fyear], modules[member])
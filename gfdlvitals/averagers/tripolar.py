@@ -3,12 +3,30 @@
 import warnings
 
 import gfdlvitals.util.gmeantools as gmeantools
+import gfdlvitals.util.gridcache as gridcache
 import gfdlvitals.util.xrtools as xrtools
 import gfdlvitals.util.netcdf as netcdf
+import gfdlvitals.util.regions as regions
 
 __all__ = ["xr_average"]
 
 
+def _wet_points(area):
+    """Returns indexers of the ocean cells with a nonzero wet area
+
+    Parameters
+    ----------
+    area : xarray.DataArray
+        Cell area multiplied by the wet mask
+
+    Returns
+    -------
+    dict
+        Indexers from `xrtools.xr_gather_index`
+    """
+    return xrtools.xr_gather_index(area.fillna(0.0) > 0.0, dim="wet_point")
+
+
 def xr_average(fyear, tar, modules):
     """xarray-based processing routines for lat-lon model output
 
@@ -16,8 +34,8 @@ def xr_average(fyear, tar, modules):
     ----------
     fyear : str
         Year being processed (YYYY)
-    tar : tarfile
-        In-memory tarfile object
+    tar : gfdlvitals.util.netcdf.TarIndex
+        Indexed history tarfile object
     modules : dict
         Mappings of netCDF file names inside the tar file to output db file names
     """
@@ -26,22 +44,23 @@ def xr_average(fyear, tar, modules):
 
     for member in members:
         print(f"{fyear}.{member}.nc")
-        data_file = netcdf.extract_from_tar(tar, f"{fyear}.{member}.nc")
+        data_file = netcdf.extract_buffer(tar, f"{fyear}.{member}.nc")
         dset = netcdf.in_mem_xr(data_file)
 
-        grid_file = (
-            f"{fyear}.ocean_static.nc"
-            if netcdf.tar_member_exists(tar, f"{fyear}.ocean_static.nc")
-            else f"{fyear}.ocean_month.nc"
-        )
-        grid_file = netcdf.extract_from_tar(tar, grid_file)
-        ds_grid = netcdf.in_mem_xr(grid_file)
-
         # Retain only time-dependent variables
-        variables = list(dset.variables.keys())
-        for x in variables:
-            if "time" not in dset[x].dims:
-                del dset[x]
+        dset = xrtools.xr_time_dependent(dset)
+
+        # Monthly files change every year, so only static files are cached
+        grid_variables = ["areacello", "area_t", "wet", "geolat", "geolon"]
+        if netcdf.tar_member_exists(tar, f"{fyear}.ocean_static.nc"):
+            ds_grid = gridcache.load_grid(
+                tar, f"{fyear}.ocean_static.nc", variables=grid_variables
+            )
+        else:
+            ds_grid = netcdf.in_mem_xr(
+                netcdf.extract_buffer(tar, f"{fyear}.ocean_month.nc"),
+                variables=grid_variables,
+            )
 
         _area = "areacello" if "areacello" in list(ds_grid.variables) else "area_t"
         if "wet" in list(ds_grid.variables):
@@ -51,21 +70,70 @@ def xr_average(fyear, tar, modules):
             warnings.warn("Unable to find wet mask")
         _area = ds_grid[_area] * _wet
 
-        for region in ["global", "nh", "sh", "tropics"]:
-            _masked_area = xrtools.xr_mask_by_latitude(
-                _area, ds_grid.geolat, region=region
-            )
-            gmeantools.write_sqlite_data(
+        # Buffer results and write each db file in a single transaction
+        writer = gmeantools.VitalsWriter()
+
+        # Region areas are summed over the full grid
+        _masked_area = xrtools.xr_region_weights(_area, ds_grid.geolat)
+
+        # Pack the wet cells of the fields on the tracer grid into one
+        # dimension, which is the only one that is averaged
+        wet_points = gridcache.derived(
+            ds_grid, "wet_points", lambda _: _wet_points(_area)
+        )
+        _dset = dset[
+            [
+                x
+                for x in dset.data_vars
+                if sorted(dset[x].dims) == sorted(("time",) + _area.dims)
+            ]
+        ]
+
+        # Average all regions in a single reduction over the wet cells
+        _wet_area = xrtools.xr_region_weights(
+            xrtools.xr_gather(_area, wet_points),
+            xrtools.xr_gather(ds_grid.geolat, wet_points),
+        )
+        t_bounds = dset.time_bnds
+        dt = t_bounds.isel(nv=1) - t_bounds.isel(nv=0)
+        weights = dt.astype("float") * _wet_area
+        _dset_weighted = xrtools.xr_weighted_avg(
+            xrtools.xr_gather(_dset, wet_points), weights, split_dims=["time"]
+        )
+
+        for region in xrtools.REGIONS:
+            writer.write_sqlite_data(
                 f"{fyear}.{region}Ave{modules[member]}.db",
                 "area",
                 fyear,
-                _masked_area.sum().data,
+                _masked_area.sel(region=region).sum().data,
             )
-
-            t_bounds = dset.time_bnds
-            dt = t_bounds.isel(nv=1) - t_bounds.isel(nv=0)
-            weights = dt.astype("float") * _masked_area
-            _dset_weighted = xrtools.xr_weighted_avg(dset, weights)
             xrtools.xr_to_db(
-                _dset_weighted, fyear, f"{fyear}.{region}Ave{modules[member]}.db"
+                _dset_weighted.sel(region=region, drop=True),
+                fyear,
+                f"{fyear}.{region}Ave{modules[member]}.db",
+                writer=writer,
             )
+
+        # Average user-defined regions with sparse weights
+        _regions = regions.weight_matrix(ds_grid.geolat, ds_grid.get("geolon"))
+        if len(_regions.names) > 0:
+            _region_area = regions.region_sum(_area, _regions)
+            _dset_weighted = regions.weighted_avg(
+                dset, dt.astype("float") * _area, _regions
+            )
+            for region in _regions.names:
+                writer.write_sqlite_data(
+                    f"{fyear}.{region}Ave{modules[member]}.db",
+                    "area",
+                    fyear,
+                    _region_area.sel(region=region).data,
+                )
+                xrtools.xr_to_db(
+                    _dset_weighted.sel(region=region, drop=True),
+                    fyear,
+                    f"{fyear}.{region}Ave{modules[member]}.db",
+                    writer=writer,
+                )
+
+        writer.flush()
@@ -1,15 +1,50 @@
 """ Command Line Script for running gfdlvitals """
 
 import argparse
+import concurrent.futures
+import copy
 import glob
 import os
 import shutil
-import subprocess
 import sys
 import tempfile
 import gfdlvitals
 
-__all__ = ["arguments", "process_year", "run", "main"]
+__all__ = [
+    "arguments",
+    "compute_year",
+    "merge_year",
+    "process_year",
+    "run",
+    "main",
+]
+
+
+def _memory_size(value):
+    """Converts a memory size such as "16GB" to a number of bytes
+
+    Parameters
+    ----------
+    value : str
+        Memory size with an optional B, KB, MB, GB, or TB suffix
+
+    Returns
+    -------
+    int
+        Number of bytes
+    """
+    units = {"TB": 1024**4, "GB": 1024**3, "MB": 1024**2, "KB": 1024, "B": 1}
+    _value = value.strip().upper()
+    for suffix, factor in units.items():
+        if _value.endswith(suffix):
+            _value = _value[: -len(suffix)]
+            break
+    else:
+        factor = 1
+    try:
+        return int(float(_value) * factor)
+    except ValueError as exc:
+        raise argparse.ArgumentTypeError(f"invalid memory size: {value}") from exc
 
 
 def arguments(args=None):
@@ -85,38 +120,179 @@ def arguments(args=None):
         help="Path to gridspec tarfile. Used in AMOC calculation. " + "Default is None",
     )
 
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of years to process in parallel. Default is 1.",
+    )
+
+    parser.add_argument(
+        "--component-jobs",
+        type=int,
+        default=1,
+        help="Number of components of a year to process in parallel. "
+        + "Default is 1.",
+    )
+
+    parser.add_argument(
+        "--batch-years",
+        type=int,
+        default=1,
+        help="Number of consecutive years whose atmospheric fields are "
+        + "averaged together in one pass. Default is 1.",
+    )
+
+    parser.add_argument(
+        "--grid-cache",
+        type=str,
+        default=None,
+        help="Directory in which to persist static grid files between runs. "
+        + "Default is None",
+    )
+
+    parser.add_argument(
+        "--max-memory",
+        type=_memory_size,
+        default=None,
+        help="Memory budget for averaging, e.g. 16GB. When set, variables are "
+        + "read and reduced in chunks along time and depth. Default is None",
+    )
+
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        default=False,
+        help="Read and average variables one time record at a time, reading "
+        + "the next record in the background. Default is False.",
+    )
+
+    parser.add_argument(
+        "-r",
+        "--regions",
+        type=str,
+        default=None,
+        help="Comma-separated list of additional regions to average. Entries "
+        + "are regionmask defined regions (e.g. ar6.land) or netCDF mask files. "
+        + "Default is None",
+    )
+
+    parser.add_argument(
+        "--prefetch",
+        type=int,
+        default=0,
+        help="Number of history files to read ahead in the background while "
+        + "the current year is processed. Only the members used by the "
+        + "requested components are read. Default is 0 (disabled).",
+    )
+
+    parser.add_argument(
+        "--prefetch-memory",
+        type=_memory_size,
+        default=None,
+        help="Maximum amount of data read ahead of the current year, e.g. 8GB. "
+        + "Default is None",
+    )
+
+    parser.add_argument(
+        "--stage",
+        type=str,
+        choices=sorted(gfdlvitals.util.staging.BACKENDS),
+        default=None,
+        help="Method used to bring history files online. Default is dmget if "
+        + "available, otherwise local.",
+    )
+
+    parser.add_argument(
+        "--stage-batch",
+        type=int,
+        default=8,
+        help="Number of history files staged at once. Default is 8.",
+    )
+
+    parser.add_argument(
+        "--stage-dir",
+        type=str,
+        default=None,
+        help="Directory to which history files are copied with --stage copy. "
+        + "Default is a temporary directory.",
+    )
+
+    parser.add_argument(
+        "-i",
+        "--incremental",
+        action="store_true",
+        default=False,
+        help="Skip years and components that are already recorded in the "
+        + "manifest of the output directory. Default is False.",
+    )
+
     args = parser.parse_args(args)
     args.historydir = os.path.abspath(args.historydir)
+    if args.stage_dir is not None:
+        args.stage_dir = os.path.abspath(args.stage_dir)
+    if args.grid_cache is not None:
+        args.grid_cache = os.path.abspath(args.grid_cache)
     if args.gridspec is not None:
         args.gridspec = os.path.abspath(args.gridspec)
+    if args.regions is not None:
+        args.regions = ",".join(
+            os.path.abspath(x) if os.path.exists(x) else x
+            for x in args.regions.split(",")
+        )
 
     return args
 
 
-def process_year(args, infile):
-    """Function to process a single year
+def compute_year(args, infile):
+    """Function to generate the per-year db files in the current directory
 
     Parameters
     ----------
     args : argparse.parser
         Parsed commmand line arguments
-    infile : str, pathlike
-        History tar file path
+    infile : str, pathlike, or list
+        History tar file path, or a list of paths of consecutive years
+        to process in batch mode
+
+    Returns
+    -------
+    list
+        Requested components that succeeded for all years
     """
 
-    # -- Set the model year string
-    fyear = str(infile.split("/")[-1].split(".")[0])
+    # -- Apply the grid cache, region, and memory settings
+    gfdlvitals.util.scheduler.configure(args)
 
     # -- Run the main code
+    done = []
     if args.modelclass == "ESM2":
-        gfdlvitals.models.ESM2.routines(args, infile)
+        done = gfdlvitals.models.ESM2.routines(args, infile)
     elif args.modelclass == "CM4":
-        gfdlvitals.models.CM4.routines(args, infile)
+        done = gfdlvitals.models.CM4.routines(args, infile)
+
+    return done
+
+
+def merge_year(args, fyear, workdir="./"):
+    """Function to merge the per-year db files into the output directory
+
+    Parameters
+    ----------
+    args : argparse.parser
+        Parsed commmand line arguments
+    fyear : str
+        Year label of the db files (YYYYMMDD)
+    workdir : str, pathlike, optional
+        Directory containing the per-year db files, by default "./"
+    """
 
     # -- Move results to their final location
     if not os.path.exists(args.outdir):
         os.makedirs(args.outdir)
-    for reg in ["global", "nh", "sh", "tropics"]:
+    gfdlvitals.util.regions.configure(args.regions)
+    for reg in gfdlvitals.util.xrtools.REGIONS + gfdlvitals.util.regions.names():
         for component in [
             "Land",
             "Atmos",
@@ -131,21 +307,139 @@ def process_year(args, infile):
             "OBGC",
             "Timing",
         ]:
-            if os.path.exists(fyear + "." + reg + "Ave" + component + ".db"):
+            source = os.path.join(
+                workdir, fyear + "." + reg + "Ave" + component + ".db"
+            )
+            if os.path.exists(source):
                 if not os.path.exists(
                     args.outdir + "/" + reg + "Ave" + component + ".db"
                 ):
                     shutil.copyfile(
-                        fyear + "." + reg + "Ave" + component + ".db",
+                        source,
                         args.outdir + "/" + reg + "Ave" + component + ".db",
                     )
                 else:
                     gfdlvitals.util.merge.merge(
-                        fyear + "." + reg + "Ave" + component + ".db",
+                        source,
                         args.outdir + "/" + reg + "Ave" + component + ".db",
                     )
 
 
+def process_year(args, infile):
+    """Function to process a single year
+
+    Parameters
+    ----------
+    args : argparse.parser
+        Parsed commmand line arguments
+    infile : str, pathlike
+        History tar file path
+    """
+
+    # -- Set the model year string
+    fyear = str(infile.split("/")[-1].split(".")[0])
+
+    compute_year(args, infile)
+    merge_year(args, fyear)
+
+
+def _compute_year_in_scratch(args, infile, scratch):
+    """Worker function that computes a year inside its own scratch directory
+
+    Parameters
+    ----------
+    args : argparse.parser
+        Parsed commmand line arguments
+    infile : str, pathlike, or list
+        History tar file path, or a list of paths in batch mode
+    scratch : str, pathlike
+        Parent directory in which to create the worker directory
+
+    Returns
+    -------
+    tuple
+        Path to the directory containing the per-year db files, and the
+        requested components that succeeded
+    """
+    workdir = tempfile.mkdtemp(dir=scratch)
+    os.chdir(workdir)
+    done = compute_year(args, infile)
+    return workdir, done
+
+
+def _merge_completed(tasks, results, start, manifest=None, prefetcher=None):
+    """Merges the computed years that are next in year order
+
+    Parameters
+    ----------
+    tasks : list
+        Parsed arguments and history tar file path of each year, in year order
+    results : dict
+        Mappings of task positions to the path from which the year was read
+        and a tuple of its working directory and the components that
+        succeeded, or a future that returns the tuple. Years of a batch
+        share the future, and its directory is removed once the last of
+        them is merged.
+    start : int
+        Position of the next year to merge
+    manifest : dict, optional
+        Manifest of processed history files to update, by default None
+    prefetcher : gfdlvitals.util.prefetch.Prefetcher, optional
+        Read-ahead of the upcoming history files, by default None
+
+    Returns
+    -------
+    int
+        Position of the next year to merge
+    """
+    while start in results:
+        path, result = results[start]
+        if isinstance(result, concurrent.futures.Future):
+            if not result.done():
+                break
+            workdir, done = result.result()
+            cleanup = True
+        else:
+            workdir, done = result
+            cleanup = False
+
+        _args, _infile = tasks[start]
+        if prefetcher is not None:
+            prefetcher.advance(path)
+        fyear = str(_infile.split("/")[-1].split(".")[0])
+        merge_year(_args, fyear, workdir)
+        if manifest is not None:
+            gfdlvitals.util.manifest.record_year(manifest, _infile, done)
+            gfdlvitals.util.manifest.write_manifest(_args.outdir, manifest)
+
+        future = results.pop(start)[1]
+        if cleanup and all(x[1] is not future for x in results.values()):
+            shutil.rmtree(workdir)
+        start = start + 1
+
+    return start
+
+
+def _history_files(model, components):
+    """Returns the names of the history files read by components of a model
+
+    Parameters
+    ----------
+    model : module
+        Model class driver, e.g. `gfdlvitals.models.CM4`
+    components : list
+        Requested components, possibly including "all"
+
+    Returns
+    -------
+    list
+        History file names, e.g. "atmos_month"
+    """
+    if "all" in components:
+        components = list(model.COMPONENTS) + list(components)
+    return sorted({x for comp in components for x in model.HISTORY_FILES.get(comp, [])})
+
+
 def run(args):
     """Function to run the command line tool
 
@@ -175,25 +469,127 @@ def run(args):
     else:
         infiles = dirlist
 
-    # -- DMGET the history files
-    if shutil.which("dmget") is not None:
-        print("Dmgetting files ...")
-        subprocess.call(["dmget"] + infiles)
-        print("Complete!")
+    # -- Split list of components to process
+    cliargs.component = cliargs.component.split(",")
+
+    # -- Determine the components to compute for each year. Components
+    #    that "all" stands for are computed if they are not yet recorded.
+    model = getattr(gfdlvitals.models, cliargs.modelclass, None)
+    available = None if model is None else model.COMPONENTS
+    tasks = []
+    manifest = (
+        gfdlvitals.util.manifest.read_manifest(cliargs.outdir)
+        if cliargs.incremental
+        else None
+    )
+    for _infile in infiles:
+        _args = cliargs
+        if manifest is not None:
+            pending = gfdlvitals.util.manifest.pending_components(
+                manifest, _infile, cliargs.component, available
+            )
+            if len(pending) == 0:
+                print(f"Skipping {os.path.basename(_infile)}; already processed")
+                continue
+            _args = copy.copy(cliargs)
+            _args.component = pending
+        tasks.append((_args, _infile))
+    infiles = [x[1] for x in tasks]
+
+    # -- Group consecutive years with the same components into batches
+    batches = []
+    for num, (_args, _infile) in enumerate(tasks):
+        if (
+            len(batches) > 0
+            and len(batches[-1]) < cliargs.batch_years
+            and tasks[batches[-1][0]][0].component == _args.component
+        ):
+            batches[-1].append(num)
+        else:
+            batches.append([num])
+    batch_of = {num: batch for batch in batches for num in batch}
 
     # -- Make temporary directory to work in
     cwd = os.getcwd()
     tempdir = tempfile.mkdtemp()
     os.chdir(tempdir)
 
-    # -- Split list of components to process
-    cliargs.component = cliargs.component.split(",")
-
-    # -- Loop over history files
-    for _infile in infiles:
-        process_year(cliargs, _infile)
+    # -- Read the upcoming history files in the background. Years that are
+    #    computed in parallel or in batches are read ahead of the year
+    #    being merged.
+    ahead = cliargs.prefetch + cliargs.jobs * max(1, cliargs.batch_years) - 1
+    prefetcher = gfdlvitals.util.prefetch.Prefetcher(
+        depth=0 if cliargs.prefetch <= 0 else ahead,
+        max_memory=cliargs.prefetch_memory,
+        members=None if model is None else _history_files(model, cliargs.component),
+    ).start()
+
+    # -- Stage the history files in rolling batches. Years that are already
+    #    online are computed first. The window holds a complete batch.
+    backend = gfdlvitals.util.staging.get_backend(
+        cliargs.stage,
+        directory=(
+            os.path.join(tempdir, "staged")
+            if cliargs.stage_dir is None
+            else cliargs.stage_dir
+        ),
+    )
+    stager = gfdlvitals.util.staging.Stager(
+        infiles,
+        backend,
+        batch_size=cliargs.stage_batch,
+        window=2 * cliargs.stage_batch + max(1, cliargs.batch_years) - 1,
+        callback=prefetcher.append,
+    ).start()
+
+    # -- Loop over history files as they come online. Years are merged in
+    #    year order so the output is identical to a serial run. A batch
+    #    is computed once all of its years are online.
+    position = {x[1]: num for num, x in enumerate(tasks)}
+    online = {}
+    results = {}
+    merged = 0
+
+    def _ready():
+        for _infile, path in stager:
+            online[position[_infile]] = path
+            batch = batch_of[position[_infile]]
+            if all(x in online for x in batch):
+                yield batch, [online.pop(x) for x in batch]
+
+    if cliargs.jobs > 1 and len(tasks) > 0:
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=cliargs.jobs
+        ) as executor:
+            for batch, paths in _ready():
+                _args = tasks[batch[0]][0]
+                future = executor.submit(
+                    _compute_year_in_scratch,
+                    _args,
+                    paths if len(paths) > 1 else paths[0],
+                    tempdir,
+                )
+                for num, path in zip(batch, paths):
+                    future.add_done_callback(
+                        lambda _, infile=tasks[num][1]: stager.release(infile)
+                    )
+                    results[num] = (path, future)
+                merged = _merge_completed(tasks, results, merged, manifest, prefetcher)
+            concurrent.futures.wait([x[1] for x in results.values()])
+            merged = _merge_completed(tasks, results, merged, manifest, prefetcher)
+    else:
+        for batch, paths in _ready():
+            _args = tasks[batch[0]][0]
+            prefetcher.advance(paths[0])
+            done = compute_year(_args, paths if len(paths) > 1 else paths[0])
+            for num, path in zip(batch, paths):
+                stager.release(tasks[num][1])
+                results[num] = (path, (tempdir, done))
+            merged = _merge_completed(tasks, results, merged, manifest, prefetcher)
 
     # -- Clean up
+    stager.close()
+    prefetcher.close()
     os.chdir(cwd)
     shutil.rmtree(tempdir)
 
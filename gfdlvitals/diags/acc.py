@@ -20,8 +20,8 @@ def mom6_acc(fyear, tar, label="Ocean", outdir="./"):
     ----------
     fyear : str
         Year label (YYYY)
-    tar : tarfile
-        In-memory history tarfile object
+    tar : gfdlvitals.util.netcdf.TarIndex
+        Indexed history tarfile object
     label : str
         SQLite output stream name
     outdir : str, path-like
@@ -44,7 +44,7 @@ def mom6_acc(fyear, tar, label="Ocean", outdir="./"):
 
     if annual_file is not None and static_file is not None:
         # open the Dataset with the transports
-        ds = in_mem_xr(annual_file)
+        ds = in_mem_xr(annual_file, variables=["umo", "vmo", "z_i"])
         
         # select first time level from static file
         # editorial comment: why does the static file have a time dimension?
@@ -24,8 +24,8 @@ def mom6_amoc(fyear, tar, label="Ocean", outdir="./"):
     ----------
     fyear : str
         Year label (YYYY)
-    tar : tarfile
-        In-memory history tarfile object
+    tar : gfdlvitals.util.netcdf.TarIndex
+        Indexed history tarfile object
     label : str
         SQLite output stream name
     outdir : str, path-like
@@ -48,11 +48,13 @@ def mom6_amoc(fyear, tar, label="Ocean", outdir="./"):
 
     if annual_file is not None and static_file is not None:
         # open the Dataset with the transports
-        dset = in_mem_xr(annual_file)
+        dset = in_mem_xr(annual_file, variables=["umo", "vmo", "z_i"])
 
         # select first time level from static file
         # editorial comment: why does the static file have a time dimension?
-        dset_static = in_mem_xr(static_file).isel(time=0)
+        dset_static = in_mem_xr(
+            static_file, variables=["geolon_v", "geolat_v", "wet_v"]
+        ).isel(time=0, missing_dims="ignore")
 
         # merge static DataSet with transport DataSet
         for geo_coord in ["geolon_v", "geolat_v", "wet_v"]:
@@ -1,8 +1,12 @@
 """ Pandas class extension for gfdlvitals """
 
+import concurrent.futures
 import copy
 import datetime
+import glob
 import math
+import os
+import re
 import sqlite3
 import warnings
 
@@ -14,10 +18,14 @@ import pandas as pd
 
 from scipy import stats
 
+import gfdlvitals.util.dbcache as dbcache
+
 __all__ = [
+    "LazyVitalsDataFrame",
     "VitalsDataFrame",
     "Timeseries",
     "open_db",
+    "open_mfdb",
     "reformat_time_axis",
     "ttest_ind_auto",
 ]
@@ -456,6 +464,201 @@ class VitalsDataFrame(pd.DataFrame):
         return result
 
 
+class LazyVitalsDataFrame:
+    """Frame-like view of a db file that reads columns on first access
+
+    The variable list, metadata, and time index are known up front. Each
+    column is read from the db file when it is first accessed and kept
+    afterwards. Selecting a list of columns returns a VitalsDataFrame.
+    The column-wise VitalsDataFrame methods return lazy frames whose
+    columns are computed on access.
+
+    Use `open_db` with ``lazy=True`` to create instances.
+
+    Parameters
+    ----------
+    index : pandas.Index
+        Time index
+    attributes : dict
+        Attributes of each column
+    loader : callable
+        Called with a list of column names to return a dict of pandas.Series
+        on the time index
+    """
+
+    def __init__(self, index, attributes, loader):
+        self.index = index
+        self.columns = pd.Index(list(attributes))
+        self.attributes = attributes
+        self.attrs = {}
+        self._loader = loader
+        self._cache = {}
+
+    def __str__(self):
+        return self.__class__.__name__
+
+    def __repr__(self):
+        return (
+            f"<{self.__class__.__name__}: {len(self.index)} times, "
+            + f"{len(self.columns)} columns, {len(self._cache)} loaded>"
+        )
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, var):
+        return var in self.attributes
+
+    def __getattr__(self, name):
+        if name.startswith("_") or name not in self.__dict__.get("attributes", {}):
+            raise AttributeError(name)
+        return self[name]
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return self._derive(lambda df: df[key], index=self.index[key])
+        if isinstance(key, str):
+            self.load([key])
+            return self._cache[key]
+        return self.load(list(key))
+
+    @property
+    def loaded(self):
+        """Names of the columns that have been read"""
+        return [x for x in self.columns if x in self._cache]
+
+    def load(self, variables=None):
+        """Reads columns that have not been read yet
+
+        Parameters
+        ----------
+        variables : list, optional
+            Columns to read, by default all columns
+
+        Returns
+        -------
+        gfdlvitals.VitalsDataFrame
+            Data frame of the requested columns
+        """
+        variables = list(self.columns) if variables is None else variables
+        for var in variables:
+            if var not in self.attributes:
+                raise KeyError(var)
+
+        pending = [x for x in variables if x not in self._cache]
+        if len(pending) > 0:
+            for var, series in self._loader(pending).items():
+                series.attrs = self.attributes[var]
+                self._cache[var] = series
+
+        df = VitalsDataFrame({x: self._cache[x] for x in variables}, index=self.index)
+        df.attrs = self.attrs
+        for var in variables:
+            df[var].attrs = self.attributes[var]
+        return df
+
+    def _derive(self, function, index=None, attributes=None):
+        """Returns a lazy frame whose columns are computed from this one
+
+        Parameters
+        ----------
+        function : callable
+            Called with a VitalsDataFrame of one column, returns a frame
+            that contains the column
+        index : pandas.Index, optional
+            Time index of the result, by default the same index
+        attributes : dict, optional
+            Columns of the result and their attributes, by default the same
+
+        Returns
+        -------
+        LazyVitalsDataFrame
+            Lazy frame of the derived columns
+        """
+
+        def loader(variables):
+            return {x: function(self.load([x]))[x] for x in variables}
+
+        result = LazyVitalsDataFrame(
+            self.index if index is None else index,
+            self.attributes if attributes is None else attributes,
+            loader,
+        )
+        result.attrs = self.attrs
+        return result
+
+    def smooth(self, window, extrap=False):
+        """Lazy version of `VitalsDataFrame.smooth`"""
+        return self._derive(lambda df: df.smooth(window, extrap=extrap))
+
+    def trend(self, order=1):
+        """Lazy version of `VitalsDataFrame.trend`"""
+        return self._derive(lambda df: df.trend(order=order))
+
+    def detrend(self, order=1, anomaly=True):
+        """Lazy version of `VitalsDataFrame.detrend` without a reference"""
+        return self._derive(lambda df: df.detrend(order=order, anomaly=anomaly))
+
+    def extend(self, maxlen):
+        """Lazy version of `VitalsDataFrame.extend`"""
+        index = VitalsDataFrame(index=self.index).extend(maxlen).index
+        return self._derive(lambda df: df.extend(maxlen), index=index)
+
+    def areasum(self):
+        """Lazy version of `VitalsDataFrame.areasum`"""
+        measures = {x: y["cell_measure"] for x, y in self.attributes.items()}
+        attributes = {
+            x: self.attributes[x]
+            for x, y in measures.items()
+            if y is not None and y in self.attributes and x not in measures.values()
+        }
+
+        def loader(variables):
+            return {x: self[x] * self[measures[x]] for x in variables}
+
+        result = LazyVitalsDataFrame(self.index, attributes, loader)
+        result.attrs = self.attrs
+        return result
+
+
+def _open_lazy(
+    dbfile, variables=None, yearshift=0.0, legacy_land=False, start=None, end=None
+):
+    """Returns a LazyVitalsDataFrame of a db file
+
+    Parameters are the same as for `open_db`. Only the metadata and the
+    first and last year of each table are read.
+    """
+
+    years, _, attributes = _read_db(
+        dbfile, variables, legacy_land=legacy_land, start=start, end=end, extents=True
+    )
+    times, _ = _shift_years(
+        _year_index(years, start=start, end=end, warn=False),
+        yearshift,
+        start=start,
+        end=end,
+    )
+    index = pd.Index(_time_index(times))
+
+    def loader(variables):
+        _times, columns, values, _ = _read_columns(
+            dbfile,
+            variables=variables,
+            yearshift=yearshift,
+            legacy_land=legacy_land,
+            start=start,
+            end=end,
+        )
+        data = np.full((len(times), len(columns)), np.nan)
+        data[np.searchsorted(times, _times)] = values
+        return {
+            x: pd.Series(data[:, i], index=index, name=x) for i, x in enumerate(columns)
+        }
+
+    return LazyVitalsDataFrame(index, attributes, loader)
+
+
 class Timeseries:
     """Timeseries class object
 
@@ -588,41 +791,168 @@ class Timeseries:
         return hash([self.__dict__[x] for x in list(self.__dict__.keys())])
 
 
-def open_db(
-    dbfile,
-    variables=None,
-    yearshift=0.0,
-    legacy_land=False,
-    start=None,
-    end=None,
+def _read_db(
+    dbfile, variables=None, legacy_land=False, start=None, end=None, extents=False
 ):
-    """Function to read sqlite dbfile"""
+    """Reads the requested tables of a db file over a single connection
 
-    if variables is None:
-        conn = sqlite3.connect(dbfile)
-        cur = conn.cursor()
-        sql = "SELECT name FROM sqlite_master WHERE type='table'"
-        _ = cur.execute(sql)
-        variables = [str(record[0]) for record in cur.fetchall()]
-        cur.close()
-        conn.close()
-        removes = ["units", "long_name", "cell_measure"]
-        variables = [x for x in variables if x not in removes]
+    Parameters
+    ----------
+    dbfile : str, path-like
+        Input SQLite file
+    variables : list, optional
+        Variables to read, by default all tables except the metadata tables
+    legacy_land : bool, optional
+        Read legacy version of the land SQLite files, by default False
+    start : int, optional
+        Specify start year, by default None
+    end : int, optional
+        Specify end year, by default None
+    extents : bool, optional
+        Only read the first and last year of each table, with NaN values,
+        by default False
 
-    # -- Loop over variables
-    data = {}
-    attributes = {}
-    years = []
-    skipped = []
+    Returns
+    -------
+    tuple
+        Mappings of variable names to arrays of years and values, and to
+        dicts of attributes. Variables without data are omitted unless
+        both `start` and `end` are given.
+    """
+
+    conn = sqlite3.connect(dbfile)
+    cur = conn.cursor()
+
+    _ = cur.execute("SELECT name FROM sqlite_master WHERE type='table'")
+    tables = [str(record[0]) for record in cur.fetchall()]
+
+    metadata = ["long_name", "units", "cell_measure"]
+    if variables is None:
+        variables = [x for x in tables if x not in metadata]
+
+    # -- Read the metadata tables once
+    attributes = {x: {} for x in metadata if x in tables}
+    for attr, values in attributes.items():
+        _ = cur.execute(f"SELECT var,value FROM {attr}")
+        for var, value in cur.fetchall():
+            values.setdefault(var, value)
+
+    # -- Apply the start and end years in the query
+    where = []
+    params = []
+    if start is not None:
+        where.append("year >= ?")
+        params.append(start)
+    if end is not None:
+        where.append("year <= ?")
+        params.append(end)
+    where = "" if len(where) == 0 else " WHERE " + " AND ".join(where)
+
+    column = "sum" if legacy_land is True else "value"
+    years = {}
+    values = {}
     for var in variables:
-        tsobj = Timeseries(dbfile, var, legacy_land=legacy_land, start=start, end=end)
-        if len(tsobj.t) > 0:
-            data[var] = pd.Series(tsobj.data, index=list(tsobj.t))
-            attributes[var] = {
-                "long_name": tsobj.long_name,
-                "units": tsobj.units,
-                "cell_measure": tsobj.cell_measure,
-            }
+        if extents is True:
+            _ = cur.execute(f'SELECT MIN(year),MAX(year) FROM "{var}"{where}', params)
+            results = [(x, np.nan) for x in cur.fetchone() if x is not None]
+        else:
+            _ = cur.execute(
+                f'SELECT year,{column} FROM "{var}"{where} ORDER BY year ASC', params
+            )
+            results = cur.fetchall()
+        if len(results) > 0:
+            years[var] = np.array([x[0] for x in results])
+            values[var] = np.array([x[1] for x in results], dtype=np.float64)
+        elif start is not None and end is not None:
+            # Padded with NaNs over the requested years
+            years[var] = np.array([], dtype=np.int64)
+            values[var] = np.array([], dtype=np.float64)
+
+    cur.close()
+    conn.close()
+
+    attributes = {
+        var: {x: attributes.get(x, {}).get(var) for x in metadata} for var in years
+    }
+
+    return years, values, attributes
+
+
+def _read_columns(
+    dbfile, variables=None, yearshift=0.0, legacy_land=False, start=None, end=None
+):
+    """Reads the columns of a db file as arrays
+
+    Parameters are the same as for `open_db`.
+
+    Returns
+    -------
+    tuple
+        Shifted years (numpy.ndarray), column names (list), values
+        (numpy.ndarray of shape years x columns), and attributes of
+        each column (dict)
+    """
+
+    years, values, attributes = _read_db(
+        dbfile, variables, legacy_land=legacy_land, start=start, end=end
+    )
+
+    # -- Build the columns on the union of years
+    times = _year_index(years, start=start, end=end)
+    data = np.full((len(times), len(years)), np.nan)
+    for num, (var, _t) in enumerate(years.items()):
+        data[np.searchsorted(times, _t), num] = values[var]
+
+    times, idx = _shift_years(times, yearshift, start=start, end=end)
+
+    return times, list(years), data[idx], attributes
+
+
+def _year_index(years, start=None, end=None, warn=True):
+    """Returns the union of the years of all variables
+
+    Missing years of each variable are included, so they are padded
+    with NaNs.
+
+    Parameters
+    ----------
+    years : dict
+        Mappings of variable names to arrays of years
+    start : int, optional
+        Specify start year, by default None
+    end : int, optional
+        Specify end year, by default None
+    warn : bool, optional
+        Warn about variables with missing years, by default True
+
+    Returns
+    -------
+    numpy.ndarray
+        Sorted years
+    """
+
+    index = {}
+    for var, _t in years.items():
+        _start = _t.min() if start is None else start
+        _end = _t.max() + 1 if end is None else end
+        missing_times = set(np.arange(_start, _end)) - set(_t)
+        if warn and len(list(missing_times)) != 0:
+            warnings.warn(f"Timeseries is incomplete for {var}: {missing_times}")
+        index[var] = np.union1d(_t, np.array(sorted(missing_times), dtype=_t.dtype))
+
+    if len(index) == 0:
+        return np.array([], dtype=np.int64)
+    return np.unique(np.concatenate(list(index.values())))
+
+
+def _shift_years(years, yearshift=0.0, start=None, end=None):
+    """Shifts years and selects those between `start` and `end`
+
+    Returns
+    -------
+    tuple
+        Shifted years that are selected, and the selection mask
+    """
 
     if start is None:
         start = -1 * math.inf
@@ -630,15 +960,26 @@ def open_db(
     if end is None:
         end = math.inf
 
-    df = pd.DataFrame(data)
-    df.index = df.index + float(yearshift)
-    df = df[(df.index >= start) & (df.index <= end)]
-    df.index = cftime.num2date(
-        (df.index * 365.0) - (365.0 / 2.0) - 1,
+    years = years + float(yearshift)
+    idx = (years >= start) & (years <= end)
+
+    return years[idx], idx
+
+
+def _time_index(years):
+    """Converts years to mid-year cftime dates"""
+    return cftime.num2date(
+        (years * 365.0) - (365.0 / 2.0) - 1,
         "days since 0001-01-01",
         calendar="365_day",
     )
 
+
+def _to_frame(years, columns, values, attributes):
+    """Builds a VitalsDataFrame from the arrays of `_read_columns`"""
+
+    df = pd.DataFrame(values, index=_time_index(years), columns=columns)
+
     df = VitalsDataFrame(df)
     df = df.sort_index()
 
@@ -646,3 +987,264 @@ def open_db(
         df[var].attrs = attributes[var]
 
     return df
+
+
+def open_db(
+    dbfile,
+    variables=None,
+    yearshift=0.0,
+    legacy_land=False,
+    start=None,
+    end=None,
+    cache=False,
+    lazy=False,
+):
+    """Function to read sqlite dbfile
+
+    All requested tables and their metadata are read over a single
+    connection, and years outside of `start` and `end` are excluded in
+    the query.
+
+    With `cache`, data frames are reused while the db file is unchanged.
+    They are held in an in-process LRU cache and, if a cache directory
+    is set, persisted to disk (see `gfdlvitals.util.dbcache`). Use
+    `gfdlvitals.util.dbcache.invalidate` to discard them.
+
+    With `lazy`, a LazyVitalsDataFrame is returned instead. Only the
+    variable list, metadata, and time index are read up front, and each
+    column is read on first access. Lazy frames are not cached.
+    """
+
+    if lazy is True:
+        return _open_lazy(
+            dbfile,
+            variables=variables,
+            yearshift=yearshift,
+            legacy_land=legacy_land,
+            start=start,
+            end=end,
+        )
+
+    kwargs = {
+        "variables": None if variables is None else list(variables),
+        "yearshift": yearshift,
+        "legacy_land": legacy_land,
+        "start": start,
+        "end": end,
+    }
+
+    if cache is True:
+        cached = dbcache.get(dbfile, **kwargs)
+        if cached is not None:
+            df = cached[0].copy()
+            for var in list(df.columns):
+                df[var].attrs = cached[1][var]
+            return df
+
+    columns = dbcache.load(dbfile, **kwargs) if cache is True else None
+    persist = columns is None
+    if columns is None:
+        columns = _read_columns(dbfile, **kwargs)
+
+    df = _to_frame(*columns)
+
+    if cache is True:
+        dbcache.put(
+            dbfile,
+            (df.copy(), columns[3]),
+            columns[0].nbytes + columns[2].nbytes,
+            columns=columns if persist else None,
+            **kwargs,
+        )
+
+    return df
+
+
+def _find_dbfiles(paths):
+    """Finds db files and the experiment each belongs to
+
+    Parameters
+    ----------
+    paths : str, path-like, list, or dict
+        Glob pattern, directory, or db file, or a list of them. A dict
+        maps experiment names to any of these.
+
+    Returns
+    -------
+    list
+        Experiment names and db file paths, as tuples
+    """
+
+    if isinstance(paths, dict):
+        items = list(paths.items())
+    else:
+        paths = [paths] if isinstance(paths, (str, os.PathLike)) else list(paths)
+        items = [(None, x) for x in paths]
+
+    result = []
+    for experiment, path in items:
+        if isinstance(path, (list, tuple)):
+            result = result + [
+                (experiment, x) for _, x in _find_dbfiles([str(y) for y in path])
+            ]
+            continue
+        path = str(path)
+        if os.path.isdir(path):
+            label = os.path.basename(os.path.normpath(path))
+            dbfiles = sorted(glob.glob(os.path.join(path, "*.db")))
+        else:
+            label = None
+            dbfiles = sorted(glob.glob(path))
+        for dbfile in dbfiles:
+            if experiment is not None:
+                _label = experiment
+            elif label is not None:
+                _label = label
+            else:
+                _label = os.path.basename(os.path.dirname(os.path.abspath(dbfile)))
+            result.append((_label, dbfile))
+
+    return result
+
+
+def _tables(dbfile):
+    """Returns the names of the tables of a db file"""
+    conn = sqlite3.connect(dbfile)
+    cur = conn.cursor()
+    _ = cur.execute("SELECT name FROM sqlite_master WHERE type='table'")
+    tables = [str(record[0]) for record in cur.fetchall()]
+    cur.close()
+    conn.close()
+    return tables
+
+
+def _split_dbname(dbfile):
+    """Returns the region and component of a db file name
+
+    Names such as globalAveAtmos.db are split into region and component.
+    Other names are returned as the component, with an empty region.
+    """
+    name = os.path.basename(dbfile)
+    match = re.match(r"^(.*)Ave(.*)\.db$", name)
+    if match is None:
+        return "", os.path.splitext(name)[0]
+    return match.groups()
+
+
+def open_mfdb(
+    paths,
+    variables=None,
+    yearshift=0.0,
+    legacy_land=False,
+    start=None,
+    end=None,
+    cache=False,
+    max_workers=None,
+):
+    """Reads many db files concurrently into one VitalsDataFrame
+
+    Columns are labeled by a MultiIndex of experiment, region, component,
+    and variable. The region and component are parsed from file names
+    such as globalAveAtmos.db. Time indexes are combined, and years that
+    are missing from a file are NaN.
+
+    Threads read the tables of each file as arrays, and the data frame
+    is built once from all of them.
+
+    Parameters
+    ----------
+    paths : str, path-like, list, or dict
+        Glob pattern, directory, or db file, or a list of them. By
+        default, the experiment is the name of the directory given, or of
+        the directory that contains each db file. A dict maps experiment
+        names to paths.
+    variables : list, optional
+        Variables to read from each db file if present, by default all
+    yearshift : float, optional
+        Years added to the time axis, by default 0.0
+    legacy_land : bool, optional
+        Read legacy version of the land SQLite files, by default False
+    start : int, optional
+        Specify start year, by default None
+    end : int, optional
+        Specify end year, by default None
+    cache : bool, optional
+        Reuse the arrays of earlier reads of each file (see `open_db`),
+        by default False
+    max_workers : int, optional
+        Number of threads reading db files, by default chosen by
+        `concurrent.futures.ThreadPoolExecutor`
+
+    Returns
+    -------
+    gfdlvitals.VitalsDataFrame
+        Data frame of all db files
+    """
+
+    dbfiles = _find_dbfiles(paths)
+    if len(dbfiles) == 0:
+        raise ValueError(f"No db files found: {paths}")
+
+    kwargs = {
+        "variables": None if variables is None else list(variables),
+        "yearshift": yearshift,
+        "legacy_land": legacy_land,
+        "start": start,
+        "end": end,
+    }
+
+    def _read(dbfile):
+        _kwargs = dict(kwargs)
+        if variables is not None:
+            tables = _tables(dbfile)
+            _kwargs["variables"] = [x for x in variables if x in tables]
+        return _read_columns(dbfile, **_kwargs)
+
+    # -- Cached files are looked up before, and added after, the threads
+    #    read the others
+    arrays = [None] * len(dbfiles)
+    stored = [False] * len(dbfiles)
+    if cache is True:
+        for num, (_, dbfile) in enumerate(dbfiles):
+            arrays[num] = dbcache.get(dbfile, arrays=True, **kwargs)
+            stored[num] = arrays[num] is not None
+            if arrays[num] is None:
+                arrays[num] = dbcache.load(dbfile, arrays=True, **kwargs)
+
+    missing = [num for num, x in enumerate(arrays) if x is None]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for num, result in zip(
+            missing, executor.map(_read, [dbfiles[x][1] for x in missing])
+        ):
+            arrays[num] = result
+
+    if cache is True:
+        for num, (_, dbfile) in enumerate(dbfiles):
+            if not stored[num]:
+                dbcache.put(
+                    dbfile,
+                    arrays[num],
+                    arrays[num][0].nbytes + arrays[num][2].nbytes,
+                    columns=arrays[num] if num in missing else None,
+                    arrays=True,
+                    **kwargs,
+                )
+
+    # -- Build the columns on the union of years
+    times = np.unique(np.concatenate([x[0] for x in arrays]))
+    data = np.full((len(times), sum(len(x[1]) for x in arrays)), np.nan)
+    labels = []
+    attributes = {}
+    for (experiment, dbfile), (years, columns, values, attrs) in zip(dbfiles, arrays):
+        region, component = _split_dbname(dbfile)
+        data[
+            np.searchsorted(times, years), len(labels) : len(labels) + len(columns)
+        ] = values
+        for var in columns:
+            labels.append((experiment, region, component, var))
+            attributes[labels[-1]] = attrs[var]
+
+    columns = pd.MultiIndex.from_tuples(
+        labels, names=["experiment", "region", "component", "variable"]
+    )
+    return _to_frame(times, columns, data, attributes)
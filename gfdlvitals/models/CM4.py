@@ -1,139 +1,234 @@
 """ Driver for CM4 class models """
 
+import functools
 import os
-import tarfile
 
 from gfdlvitals import averagers
 from gfdlvitals import diags
 from gfdlvitals.util import extract_ocean_scalar
+from gfdlvitals.util import scheduler
 from gfdlvitals.util.netcdf import tar_member_exists
 
 import gfdlvitals.util.netcdf as nctools
 
 
-__all__ = ["routines"]
-
-
-def routines(args, infile):
-    """Driver routine for CM4-class models
-
-    Parameters
-    ----------
-    args : argparse.parser
-        Parsed commmand line arguments
-    infile : str, pathlike
-        History tar file path
-    """
-
-    # -- Open the tarfile
-    tar = tarfile.open(infile)
-
-    # -- Set the model year string
-    fyear = str(infile.split("/")[-1].split(".")[0])
-    print("Processing " + fyear)
-
-    # -- Get list of components to process
-    comps = args.component
-    print(f"Requested Components: {comps}")
-
-    # -- Atmospheric Fields
-    modules = {
-        "atmos_month": "Atmos",
-        "atmos_co2_month": "Atmos",
-        "atmos_month_aer": "AtmosAer",
-        "aerosol_month_cmip": "AeroCMIP",
-    }
-    if any(comp in comps for comp in ["atmos", "all"]):
-        try:
-            averagers.cubesphere.xr_average(fyear, tar, modules)
-        except Exception as exc:
-            print("\n\n# -----\n# Atmosphere vitals failed\n# -----\n\n")
-            print(exc)
-
-    # -- Land Fields
+__all__ = ["COMPONENTS", "HISTORY_FILES", "routines"]
+
+# Components that are processed when "all" are requested
+COMPONENTS = ["acc", "amoc", "atmos", "ice", "iceshelf", "land", "obgc", "ocean"]
+
+# History files averaged by the atmosphere and OBGC components
+_ATMOS_MODULES = {
+    "atmos_month": "Atmos",
+    "atmos_co2_month": "Atmos",
+    "atmos_month_aer": "AtmosAer",
+    "aerosol_month_cmip": "AeroCMIP",
+}
+
+_OBGC_MODULES = {
+    "ocean_cobalt_sfc": "OBGC",
+    "ocean_cobalt_misc": "OBGC",
+    "ocean_cobalt_tracers_year": "OBGC",
+    "ocean_cobalt_tracers_int": "OBGC",
+    "ocean_bling": "OBGC",
+    "ocean_bling_cmip6_omip_2d": "OBGC",
+    "ocean_bling_cmip6_omip_rates_year_z": "OBGC",
+    "ocean_bling_cmip6_omip_sfc": "OBGC",
+    "ocean_bling_cmip6_omip_tracers_month_z": "OBGC",
+    "ocean_bling_cmip6_omip_tracers_year_z": "OBGC",
+}
+
+# History files read by each component, including static grid files
+HISTORY_FILES = {
+    "acc": ["ocean_annual_z", "ocean_static"],
+    "amoc": ["ocean_annual_z", "ocean_static"],
+    "atmos": list(_ATMOS_MODULES) + ["grid_spec"],
+    "ice": ["ice_month", "ice_static", "sea_ice_geometry"],
+    "iceshelf": ["ice_shelf_scalar"],
+    "land": ["land_month", "land_static"],
+    "obgc": list(_OBGC_MODULES) + ["ocean_month", "ocean_static"],
+    "ocean": ["ocean_scalar_annual"],
+}
+
+
+def _atmos(fyear, tar):
+    """Atmospheric Fields, averaged together in batch mode"""
+    try:
+        averagers.cubesphere.xr_average(fyear, tar, _ATMOS_MODULES)
+    except Exception as exc:
+        print("\n\n# -----\n# Atmosphere vitals failed\n# -----\n\n")
+        print(exc)
+        return []
+    return ["atmos"]
+
+
+@scheduler.per_year
+def _land(fyear, tar):
+    """Land Fields"""
     modules = {"land_month": "Land"}
-    if any(comp in comps for comp in ["land", "all"]):
-        try:
-            averagers.land_lm4.xr_average(fyear, tar, modules)
-        except Exception as exc:
-            print("\n\n# -----\n# Land vitals failed\n# -----\n\n")
-            print(exc)
-
-    # -- Ice
+    try:
+        averagers.land_lm4.xr_average(fyear, tar, modules)
+    except Exception as exc:
+        print("\n\n# -----\n# Land vitals failed\n# -----\n\n")
+        print(exc)
+        return []
+    return ["land"]
+
+
+@scheduler.per_year
+def _ice(fyear, tar):
+    """Ice"""
     modules = {"ice_month": "Ice"}
-    if any(comp in comps for comp in ["ice", "all"]):
-        try:
-            averagers.ice.xr_average(fyear, tar, modules)
-        except Exception as exc:
-            print("\n\n# -----\n# Ice vitals failed\n# -----\n\n")
-            print(exc)
-
-    # -- Ice Shelf
+    try:
+        averagers.ice.xr_average(fyear, tar, modules)
+    except Exception as exc:
+        print("\n\n# -----\n# Ice vitals failed\n# -----\n\n")
+        print(exc)
+        return []
+    return ["ice"]
+
+
+@scheduler.per_year
+def _iceshelf(fyear, tar):
+    """Ice Shelf"""
     fname = f"{fyear}.ice_shelf_scalar.nc"
-    if any(comp in comps for comp in ["iceshelf", "all"]):
-        try:
-            if tar_member_exists(tar, fname):
-                print(fname)
-                fdata = nctools.extract_from_tar(tar, fname, ncfile=True)
-                extract_ocean_scalar.mom6(
-                    fdata, fyear, "./", outname="globalAveIceShelf.db"
-                )
-                fdata.close()
-        except Exception as exc:
-            print("\n\n# -----\n# Ice shelf vitals failed\n# -----\n\n")
-            print(exc)
+    try:
+        if tar_member_exists(tar, fname):
+            print(fname)
+            fdata = nctools.extract_from_tar(tar, fname, ncfile=True)
+            extract_ocean_scalar.mom6(
+                fdata, fyear, "./", outname="globalAveIceShelf.db"
+            )
+            fdata.close()
+    except Exception as exc:
+        print("\n\n# -----\n# Ice shelf vitals failed\n# -----\n\n")
+        print(exc)
+        return []
+    return ["iceshelf"]
+
+
+@scheduler.per_year
+def _ocean(fyear, tar, scalars=True, amoc=True, acc=True):
+    """Ocean scalars, AMOC, and ACC
+
+    These are run together since they write to the same db file. The
+    parts that succeeded are returned.
+    """
+    done = []
 
     # -- Ocean
     fname = f"{fyear}.ocean_scalar_annual.nc"
-    if any(comp in comps for comp in ["ocean", "all"]):
+    if scalars:
         try:
             if tar_member_exists(tar, fname):
                 print(f"{fyear}.ocean_scalar_annual.nc")
                 fdata = nctools.extract_from_tar(tar, fname, ncfile=True)
-                extract_ocean_scalar.mom6(fdata, fyear, "./", outname="globalAveOcean.db")
+                extract_ocean_scalar.mom6(
+                    fdata, fyear, "./", outname="globalAveOcean.db"
+                )
                 fdata.close()
+            done.append("ocean")
         except Exception as exc:
             print("\n\n# -----\n# Ocean vitals failed\n# -----\n\n")
             print(exc)
 
-    # -- OBGC
-    modules = {
-        "ocean_cobalt_sfc": "OBGC",
-        "ocean_cobalt_misc": "OBGC",
-        "ocean_cobalt_tracers_year": "OBGC",
-        "ocean_cobalt_tracers_int": "OBGC",
-        "ocean_bling": "OBGC",
-        "ocean_bling_cmip6_omip_2d": "OBGC",
-        "ocean_bling_cmip6_omip_rates_year_z": "OBGC",
-        "ocean_bling_cmip6_omip_sfc": "OBGC",
-        "ocean_bling_cmip6_omip_tracers_month_z": "OBGC",
-        "ocean_bling_cmip6_omip_tracers_year_z": "OBGC",
-    }
-    if any(comp in comps for comp in ["obgc", "all"]):
-        try:
-            averagers.tripolar.xr_average(fyear, tar, modules)
-        except Exception as exc:
-            print("\n\n# -----\n# OBGC vitals failed\n# -----\n\n")
-            print(exc)
-
     # -- AMOC
-    if any(comp in comps for comp in ["amoc", "all"]):
+    if amoc:
         try:
             diags.amoc.mom6_amoc(fyear, tar)
+            done.append("amoc")
         except Exception as exc:
             print("\n\n# -----\n# AMOC vitals failed\n# -----\n\n")
             print(exc)
 
     # -- ACC
-    if any(comp in comps for comp in ["acc", "all"]):
+    if acc:
         try:
             diags.acc.mom6_acc(fyear, tar)
+            done.append("acc")
         except Exception as exc:
             print("\n\n# -----\n# ACC vitals failed\n# -----\n\n")
             print(exc)
 
-    # -- Close out the tarfile handle
-    tar.close()
+    return done
+
+
+@scheduler.per_year
+def _obgc(fyear, tar):
+    """OBGC"""
+    try:
+        averagers.tripolar.xr_average(fyear, tar, _OBGC_MODULES)
+    except Exception as exc:
+        print("\n\n# -----\n# OBGC vitals failed\n# -----\n\n")
+        print(exc)
+        return []
+    return ["obgc"]
+
+
+def routines(args, infile):
+    """Driver routine for CM4-class models
+
+    Components write to separate db files and can be processed in
+    parallel (see `args.component_jobs`). The largest components are
+    listed first to shorten the critical path.
+
+    Parameters
+    ----------
+    args : argparse.parser
+        Parsed commmand line arguments
+    infile : str, pathlike, or list
+        History tar file path, or a list of paths of consecutive years
+        to process in batch mode
+
+    Returns
+    -------
+    list
+        Requested components that succeeded for all years
+    """
+
+    # -- Set the model year string
+    infiles = infile if isinstance(infile, list) else [infile]
+    fyears = [str(x.split("/")[-1].split(".")[0]) for x in infiles]
+    print("Processing " + ", ".join(fyears))
+
+    # -- Get list of components to process
+    comps = args.component
+    print(f"Requested Components: {comps}")
+
+    def _requested(*names):
+        return any(comp in comps for comp in list(names) + ["all"])
+
+    components = []
+    if _requested("obgc"):
+        components.append(("OBGC", _obgc))
+    if _requested("atmos"):
+        components.append(("Atmosphere", _atmos))
+    if _requested("ocean", "amoc", "acc"):
+        components.append(
+            (
+                "Ocean",
+                functools.partial(
+                    _ocean,
+                    scalars=_requested("ocean"),
+                    amoc=_requested("amoc"),
+                    acc=_requested("acc"),
+                ),
+            )
+        )
+    if _requested("land"):
+        components.append(("Land", _land))
+    if _requested("ice"):
+        components.append(("Ice", _ice))
+    if _requested("iceshelf"):
+        components.append(("Ice shelf", _iceshelf))
+
+    # -- Process the components, opening and indexing the tarfiles
+    results = scheduler.run_components(args, infile, components)
+    done = sorted(x for result in results.values() for x in result)
+
+    # -- Years are only recorded as fully processed if nothing failed
+    if "all" in comps:
+        done = ["all"] if set(done) == set(COMPONENTS) else done
 
     # -- Do performance timing
     # try:
@@ -144,3 +239,5 @@ def routines(args, infile):
     #        diags.fms.timing(infile, fyear, "./", label)
     # except RuntimeError:
     #    pass
+
+    return done
@@ -1,13 +1,32 @@
 """ Driver for ESM2 class models """
 
-import tarfile
 import warnings
 
 from gfdlvitals import averagers
 from gfdlvitals.util.average import generic_driver
 
+import gfdlvitals.util.netcdf as nctools
 
-__all__ = ["routines"]
+
+__all__ = ["COMPONENTS", "HISTORY_FILES", "routines"]
+
+# Components that are processed when "all" are requested
+COMPONENTS = ["atmos", "obgc", "ocean"]
+
+# History files read by each component, including static grid files
+HISTORY_FILES = {
+    "atmos": ["atmos_month", "atmos_level"],
+    "obgc": [
+        "ocean_topaz_fluxes",
+        "ocean_topaz_misc",
+        "ocean_topaz_sfc_100",
+        "ocean_topaz_tracers_month_z",
+        "ocean_topaz_wc_btm",
+        "ocean_month",
+        "ocean_static",
+    ],
+    "ocean": ["ocean_month", "ocean_static"],
+}
 
 
 def routines(args, infile):
@@ -17,19 +36,27 @@ def routines(args, infile):
     ----------
     args : argparse.parser
         Parsed commmand line arguments
-    infile : str, pathlike
-        History tar file path
+    infile : str, pathlike, or list
+        History tar file path, or a list of paths of consecutive years
+        to process in batch mode
+
+    Returns
+    -------
+    list
+        Requested components that were processed for all years
     """
 
-    # -- Open the tarfile
-    tar = tarfile.open(infile)
+    # -- Open and index the tarfiles
+    infiles = infile if isinstance(infile, list) else [infile]
+    tars = [nctools.TarIndex(x) for x in infiles]
 
-    # -- Set the model year string
-    fyear = str(infile.split("/")[-1].split(".")[0])
-    print("Processing " + fyear)
+    # -- Set the model year strings
+    fyears = [str(x.split("/")[-1].split(".")[0]) for x in infiles]
+    print("Processing " + ", ".join(fyears))
 
     # -- Get list of components to process
     comps = args.component
+    done = []
 
     # -- Atmos
     modules = {
@@ -37,7 +64,11 @@ def routines(args, infile):
         "atmos_level": "Atmos",
     }
     if any(comp in comps for comp in ["atmos", "all"]):
-        averagers.latlon.xr_average(fyear, tar, modules)
+        if isinstance(infile, list):
+            averagers.latlon.xr_average(fyears, tars, modules)
+        else:
+            averagers.latlon.xr_average(fyears[0], tars[0], modules)
+        done.append("atmos")
 
     # -- Land
     # modules = {"land_month": "Land"}
@@ -60,7 +91,9 @@ def routines(args, infile):
         "ocean_month": "Ocean",
     }
     if any(comp in comps for comp in ["ocean", "all"]):
-        averagers.tripolar.xr_average(fyear, tar, modules)
+        for fyear, tar in zip(fyears, tars):
+            averagers.tripolar.xr_average(fyear, tar, modules)
+        done.append("ocean")
 
     # -- OBGC
     modules = {
@@ -71,10 +104,20 @@ def routines(args, infile):
         "ocean_topaz_wc_btm": "OBGC",
     }
     if any(comp in comps for comp in ["obgc", "all"]):
-        averagers.tripolar.xr_average(fyear, tar, modules)
+        for fyear, tar in zip(fyears, tars):
+            averagers.tripolar.xr_average(fyear, tar, modules)
+        done.append("obgc")
 
     if any(comp in comps for comp in ["amoc"]):
         warnings.warn("AMOC calculation is not supported for ESM2.")
+        done.append("amoc")
+
+    # -- Close out the tarfile handles
+    for tar in tars:
+        tar.close()
+
+    # -- Years are only recorded as fully processed if all components ran
+    if "all" in comps:
+        done = ["all"] if set(done) >= set(COMPONENTS) else done
 
-    # -- Close out the tarfile handle
-    tar.close()
+    return sorted(done)
@@ -51,7 +51,7 @@ def plot_timeseries(
 
     Parameters
     ----------
-    dsets : gfdlvitals.VitalsDataFrame or list
+    dsets : gfdlvitals.VitalsDataFrame, gfdlvitals.LazyVitalsDataFrame, or list
         Dataframe or list of dataframes to plot
     var : str
         Variable name to plot
@@ -360,7 +360,8 @@ def run_plotdb(cliargs):
     cliargs : argparse.arguments
         Processed command-line arguments
     """
-    dsets = [gfdlvitals.open_db(x) for x in cliargs.dbfiles]
+    # -- Columns are read as variables are scrolled through
+    dsets = [gfdlvitals.open_db(x, lazy=True) for x in cliargs.dbfiles]
 
     all_variables = [set(x.columns) for x in dsets]
     common_variables = set.intersection(*all_variables)
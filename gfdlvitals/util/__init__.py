@@ -1,19 +1,33 @@
 """Generic utilities module"""
 
 from . import average
+from . import dbcache
 from . import extract_ocean_scalar
 from . import git
 from . import gmeantools
+from . import gridcache
+from . import manifest
 from . import merge
 from . import netcdf
+from . import prefetch
+from . import regions
+from . import scheduler
+from . import staging
 from . import xrtools
 
 __all__ = [
     "average",
+    "dbcache",
     "extract_ocean_scalar",
     "git",
     "gmeantools",
+    "gridcache",
+    "manifest",
     "merge",
     "netcdf",
+    "prefetch",
+    "regions",
+    "scheduler",
+    "staging",
     "xrtools",
 ]
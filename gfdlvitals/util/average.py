@@ -1,5 +1,6 @@
 """ Utiliites for use in averaging routines """
 
+import netCDF4
 import numpy as np
 
 from gfdlvitals.util.netcdf import extract_from_tar
@@ -21,7 +22,7 @@ class RichVariable:
     grid_file : io.BufferedReader or list of io.BufferedReader
         Grid-spec tiles
     data_file : io.BufferedReader or list of io.BufferedReader
-        Data tiles
+        Data tiles, or an already open netCDF4.Dataset
     fyear : str
         Year that is being processed
     outdir : str
@@ -132,7 +133,11 @@ def process_var(variable, averager=None):
             _area_weight = variable.cell_area
 
     else:
-        fdata = nctools.in_mem_nc(variable.data_file)
+        # Datasets that are already open are reused and left open
+        if isinstance(variable.data_file, netCDF4.Dataset):
+            fdata = variable.data_file
+        else:
+            fdata = nctools.in_mem_nc(variable.data_file)
         units = gmeantools.extract_metadata(fdata, variable.varname, "units")
         long_name = gmeantools.extract_metadata(fdata, variable.varname, "long_name")
         ndim = len(fdata.variables[variable.varname].shape)
@@ -164,6 +169,10 @@ def process_var(variable, averager=None):
             var = np.ma.average(var, axis=0, weights=fdata["average_DT"][:])
 
     if var is None:
+        if averager in ["cubesphere", "land_lm4"]:
+            _ = [x.close() for x in data_file]
+        elif fdata is not variable.data_file:
+            fdata.close()
         return None
 
     for reg in ["global", "tropics", "nh", "sh"]:
@@ -279,7 +288,7 @@ def process_var(variable, averager=None):
 
     if averager in ["cubesphere", "land_lm4"]:
         _ = [x.close() for x in data_file]
-    else:
+    elif fdata is not variable.data_file:
         fdata.close()
 
     return None
@@ -292,8 +301,8 @@ def generic_cubesphere_driver(fyear, tar, modules, average, grid_spec="grid_spec
     ----------
     fyear : str
         Year to process (YYYYMMDD)
-    tar : tarfile object
-        In-memory pointer to history tarfile
+    tar : gfdlvitals.util.netcdf.TarIndex
+        Indexed history tarfile object
     modules : dict
         Dictionary of history nc streams (keys) and output db name (values)
     """
@@ -327,8 +336,8 @@ def generic_driver(fyear, tar, modules, average, static_file=None):
     ----------
     fyear : str
         Year to process (YYYYMMDD)
-    tar : tarfile object
-        In-memory pointer to history tarfile
+    tar : gfdlvitals.util.netcdf.TarIndex
+        Indexed history tarfile object
     modules : dict
         Dictionary of history nc streams (keys) and output db name (values)
     """
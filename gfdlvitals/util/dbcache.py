@@ -0,0 +1,244 @@
+""" Cache of data frames read from db files """
+
+import collections
+import glob
+import hashlib
+import json
+import os
+
+import numpy as np
+
+__all__ = [
+    "clear",
+    "get",
+    "get_cache_dir",
+    "invalidate",
+    "load",
+    "put",
+    "set_cache_dir",
+    "set_max_memory",
+]
+
+# Data frames held in memory, least recently used first
+_FRAMES = collections.OrderedDict()
+
+# Size in bytes of each data frame held in memory
+_NBYTES = {}
+
+# Memory budget of the in-memory cache
+_MAX_MEMORY = 256 * 1024**2
+
+# Optional directory where data frames are persisted
+_CACHE_DIR = None
+
+
+def set_max_memory(nbytes):
+    """Sets the memory budget of the in-memory cache
+
+    Parameters
+    ----------
+    nbytes : int
+        Memory budget in bytes. The least recently used data frames are
+        evicted once the budget is exceeded.
+    """
+    global _MAX_MEMORY
+    _MAX_MEMORY = nbytes
+    _evict()
+
+
+def set_cache_dir(path):
+    """Sets the directory where data frames are persisted
+
+    Parameters
+    ----------
+    path : str, path-like, or None
+        Cache directory. If None, data frames are only cached in memory.
+    """
+    global _CACHE_DIR
+    _CACHE_DIR = None if path is None else os.path.abspath(path)
+
+
+def get_cache_dir():
+    """Returns the directory where data frames are persisted
+
+    Returns
+    -------
+    str or None
+        Cache directory, or None if data frames are only cached in memory
+    """
+    return _CACHE_DIR
+
+
+def clear():
+    """Removes all data frames from the in-memory cache"""
+    _FRAMES.clear()
+    _NBYTES.clear()
+
+
+def _digest(value):
+    """Returns a short hash of the representation of a value"""
+    return hashlib.blake2b(repr(value).encode(), digest_size=8).hexdigest()
+
+
+def _key(dbfile, **kwargs):
+    """Returns the cache key of a db file and the arguments it is read with
+
+    The key is made of hashes of the file path, of its modification time
+    and size, and of the arguments, so changed files are not matched.
+
+    Parameters
+    ----------
+    dbfile : str, path-like
+        Input SQLite file
+    **kwargs
+        Arguments the db file is read with
+
+    Returns
+    -------
+    tuple
+        Hashes of the path, the file state, and the arguments
+    """
+    path = os.path.abspath(dbfile)
+    stat = os.stat(path)
+    return (
+        _digest(path),
+        _digest((stat.st_mtime_ns, stat.st_size)),
+        _digest(sorted(kwargs.items())),
+    )
+
+
+def _cache_file(key):
+    """Returns the path of the on-disk copy of a cache entry"""
+    return os.path.join(_CACHE_DIR, ".".join(key) + ".npz")
+
+
+def _evict():
+    """Evicts the least recently used data frames over the memory budget"""
+    while len(_FRAMES) > 0 and sum(_NBYTES.values()) > _MAX_MEMORY:
+        key, _ = _FRAMES.popitem(last=False)
+        del _NBYTES[key]
+
+
+def get(dbfile, **kwargs):
+    """Returns a data frame of a db file from the in-memory cache
+
+    Parameters
+    ----------
+    dbfile : str, path-like
+        Input SQLite file
+    **kwargs
+        Arguments the db file is read with
+
+    Returns
+    -------
+    object or None
+        Cached data frame, or None if the db file has not been cached
+        in memory with these arguments
+    """
+    key = _key(dbfile, **kwargs)
+    if key not in _FRAMES:
+        return None
+    _FRAMES.move_to_end(key)
+    return _FRAMES[key]
+
+
+def load(dbfile, **kwargs):
+    """Returns the columns of a db file from the on-disk cache
+
+    Parameters
+    ----------
+    dbfile : str, path-like
+        Input SQLite file
+    **kwargs
+        Arguments the db file is read with
+
+    Returns
+    -------
+    tuple or None
+        Years, column names, values, and attributes of each column (see
+        `put`), or None if no cache directory is set or the db file has
+        not been persisted with these arguments
+    """
+    if _CACHE_DIR is None:
+        return None
+    cache_file = _cache_file(_key(dbfile, **kwargs))
+    if not os.path.exists(cache_file):
+        return None
+    with np.load(cache_file) as cached:
+        return (
+            cached["years"],
+            [str(x) for x in cached["columns"]],
+            cached["values"],
+            json.loads(str(cached["attributes"])),
+        )
+
+
+def put(dbfile, dframe, nbytes, columns=None, **kwargs):
+    """Adds a data frame of a db file to the cache
+
+    Parameters
+    ----------
+    dbfile : str, path-like
+        Input SQLite file
+    dframe : object
+        Data frame to hold in memory
+    nbytes : int
+        Size of the data frame in bytes
+    columns : tuple, optional
+        Years (numpy.ndarray), column names (list), values (numpy.ndarray
+        of shape years x columns), and attributes of each column (dict)
+        to persist if a cache directory is set, by default None
+    **kwargs
+        Arguments the db file is read with
+    """
+    key = _key(dbfile, **kwargs)
+
+    # Entries of earlier versions of the file are no longer valid
+    for stale in [x for x in _FRAMES if x[0] == key[0] and x[1] != key[1]]:
+        del _FRAMES[stale]
+        del _NBYTES[stale]
+
+    _FRAMES[key] = dframe
+    _NBYTES[key] = nbytes
+    _FRAMES.move_to_end(key)
+    _evict()
+
+    if _CACHE_DIR is not None and columns is not None:
+        for path in glob.glob(os.path.join(_CACHE_DIR, f"{key[0]}.*.npz")):
+            if not os.path.basename(path).startswith(f"{key[0]}.{key[1]}."):
+                os.remove(path)
+
+        os.makedirs(_CACHE_DIR, exist_ok=True)
+        tmp_file = f"{_cache_file(key)}.{os.getpid()}.tmp"
+        with open(tmp_file, "wb") as fhandle:
+            np.savez(
+                fhandle,
+                years=columns[0],
+                columns=np.array(columns[1], dtype=str),
+                values=columns[2],
+                attributes=json.dumps(columns[3]),
+            )
+        os.replace(tmp_file, _cache_file(key))
+
+
+def invalidate(dbfile=None):
+    """Removes the cached data frames of a db file, or of all db files
+
+    Parameters
+    ----------
+    dbfile : str, path-like, optional
+        Input SQLite file, by default None (all db files)
+    """
+    if dbfile is None:
+        clear()
+        pattern = "*.npz"
+    else:
+        prefix = _digest(os.path.abspath(dbfile))
+        for key in [x for x in _FRAMES if x[0] == prefix]:
+            del _FRAMES[key]
+            del _NBYTES[key]
+        pattern = f"{prefix}.*.npz"
+
+    if _CACHE_DIR is not None:
+        for path in glob.glob(os.path.join(_CACHE_DIR, pattern)):
+            os.remove(path)
@@ -1,5 +1,6 @@
 """ Generic Suite of Utilities """
 
+import functools
 import math
 import pickle
 import sqlite3
@@ -10,6 +11,7 @@ import numpy as np
 from importlib.resources import files
 
 __all__ = [
+    "VitalsWriter",
     "get_web_vars_dict",
     "mask_latitude_bands",
     "area_mean",
@@ -21,10 +23,17 @@ __all__ = [
     "write_metadata",
 ]
 
+# Cell areas of standard grids, keyed by their lat/lon axes
+_CELL_AREAS = {}
 
+
+@functools.lru_cache(maxsize=None)
 def get_web_vars_dict():
     """Returns dictionary of legacy LM3 variables
 
+    The dictionary is loaded once and shared between callers, so it
+    must not be modified.
+
     Returns
     -------
     dict
@@ -279,18 +288,7 @@ def write_sqlite_data(
         Model component, by default None
     """
 
-    missing_value = -1.0e20
-
-    # check if result is a nan and replace with a defined missing value
-    if varmean is not None:
-        if math.isnan(float(varmean)):
-            print(f"  WARNING: {varname} mean is NaN in {sqlfile}, writing missing value", file=sys.stderr)
-            varmean = missing_value
-
-    if varsum is not None:
-        if math.isnan(float(varsum)):
-            print(f"  WARNING: {varname} sum is NaN in {sqlfile}, writing missing value", file=sys.stderr)
-            varsum = missing_value
+    varmean, varsum = _replace_nans(sqlfile, varname, varmean, varsum)
 
     conn = sqlite3.connect(sqlfile)
     cur = conn.cursor()
@@ -335,6 +333,42 @@ def write_sqlite_data(
     conn.close()
 
 
+def _replace_nans(sqlfile, varname, varmean, varsum):
+    """Replaces NaN results with a defined missing value
+
+    Parameters
+    ----------
+    sqlfile : str, path-like
+        Path to output sqlite file
+    varname : str
+        Variable name
+    varmean : float
+        Mean of the data
+    varsum : float
+        Sum of variable of the data
+
+    Returns
+    -------
+    tuple
+        varmean, varsum
+    """
+
+    missing_value = -1.0e20
+
+    # check if result is a nan and replace with a defined missing value
+    if varmean is not None:
+        if math.isnan(float(varmean)):
+            print(f"  WARNING: {varname} mean is NaN in {sqlfile}, writing missing value", file=sys.stderr)
+            varmean = missing_value
+
+    if varsum is not None:
+        if math.isnan(float(varsum)):
+            print(f"  WARNING: {varname} sum is NaN in {sqlfile}, writing missing value", file=sys.stderr)
+            varsum = missing_value
+
+    return varmean, varsum
+
+
 def parse_cell_measures(attr, key):
     """Parse cell measures attribute
 
@@ -417,9 +451,125 @@ def write_metadata(sqlfile, varname, attr, value):
     conn.close()
 
 
+class VitalsWriter:
+    """Buffered writer for sqlite files
+
+    Data and metadata are collected in memory and written with a single
+    connection and transaction per sqlite file when the writer is flushed.
+    The writer is a context manager that flushes on exit. The methods
+    mirror the signatures of `write_sqlite_data` and `write_metadata`.
+    """
+
+    def __init__(self):
+        # sqlfile -> table -> (create statement, insert statement, rows)
+        self.tables = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.flush()
+
+    def __str__(self):
+        return self.__class__.__name__
+
+    def _append(self, sqlfile, table, create, insert, row):
+        tables = self.tables.setdefault(sqlfile, {})
+        if table not in tables:
+            tables[table] = (create, insert, [])
+        tables[table][2].append(row)
+
+    def write_sqlite_data(
+        self, sqlfile, varname, fyear, varmean=None, varsum=None, component=None
+    ):
+        """Buffers data for a sqlite file
+
+        Parameters
+        ----------
+        sqlfile : str, path-like
+            Path to output sqlite file
+        varname : str
+            Variable name
+        fyear : str
+            Year being processed
+        varmean : float, optional
+            Mean of the data, by default None
+        varsum : float, optional
+            Sum of variable of the data, by default None
+        component : str, optional
+            Model component, by default None
+        """
+        varmean, varsum = _replace_nans(sqlfile, varname, varmean, varsum)
+
+        # Values are bound as text so that sqlite converts them to
+        # floating point exactly as it does for the unbuffered writer
+        if component == "land":
+            self._append(
+                sqlfile,
+                varname,
+                "create table if not exists "
+                + varname
+                + " (year integer primary key, sum float, avg float)",
+                "insert or replace into " + varname + " values(?,?,?)",
+                (int(fyear[:4]), str(varsum), str(varmean)),
+            )
+        else:
+            self._append(
+                sqlfile,
+                varname,
+                "create table if not exists "
+                + varname
+                + " (year integer primary key, value float)",
+                "insert or replace into " + varname + " values(?,?)",
+                (int(fyear[:4]), str(varmean)),
+            )
+
+    def write_metadata(self, sqlfile, varname, attr, value):
+        """Buffers metadata for a sqlite file
+
+        Parameters
+        ----------
+        sqlfile : str, path-like
+            Path to output sqlite file
+        varname : str
+            Variable name
+        attr : str
+            Attribute name
+        value : str
+            Attribute string
+        """
+        if value is None:
+            value = str("")
+        self._append(
+            sqlfile,
+            str(attr),
+            "create table if not exists "
+            + str(attr)
+            + " (var text primary key, value text)",
+            "insert or replace into " + str(attr) + " values(?,?)",
+            (str(varname), str(value)),
+        )
+
+    def flush(self):
+        """Writes all buffered data and metadata to the sqlite files"""
+        for sqlfile, tables in self.tables.items():
+            conn = sqlite3.connect(sqlfile)
+            with conn:
+                cur = conn.cursor()
+                for create, insert, rows in tables.values():
+                    cur.execute(create)
+                    cur.executemany(insert, rows)
+                cur.close()
+            conn.close()
+        self.tables = {}
+
+
 def standard_grid_cell_area(lat, lon, earth_radius=6371.0e3):
     """Calculate grid cell area for a standard grid
 
+    Areas are remembered for each set of lat/lon axes, so repeated calls
+    for the same grid do not recompute them.
+
     Parameters
     ----------
     lat : numpy.ndarray
@@ -434,20 +584,41 @@ def standard_grid_cell_area(lat, lon, earth_radius=6371.0e3):
     numpy.ndarray
         Array of cell areas
     """
-    dlat = lat[1] - lat[0]
-    dlon = lon[1] - lon[0]
+    lat = np.asarray(lat)
+    lon = np.asarray(lon)
+
+    key = (
+        lat.dtype.str,
+        lat.tobytes(),
+        lon.dtype.str,
+        lon.tobytes(),
+        earth_radius,
+    )
+    if key in _CELL_AREAS:
+        return _CELL_AREAS[key].copy()
+
+    # The spacing is taken in the precision of the coordinates, and is
+    # then promoted to float64 with the coordinates. This is what the
+    # scalar operations of NumPy 1.x did, and the areas do not depend
+    # on the NumPy version.
+    dlat = np.float64(lat[1] - lat[0])
+    dlon = np.float64(lon[1] - lon[0])
+    _lat = lat.astype(np.float64)
+    _lon = lon.astype(np.float64)
+
+    # The operations are applied in the same order and precision as for
+    # a single cell so that the areas do not change in the last bits
+    lon1 = _lon + dlon / 2.0
+    lon0 = _lon - dlon / 2.0
+    lat1 = _lat + dlat / 2.0
+    lat0 = _lat - dlat / 2.0
     area = np.empty((len(lat), len(lon)))
-    for j, _lat in enumerate(lat):
-        for i, _lon in enumerate(lon):
-            lon1 = _lon + dlon / 2.0
-            lon0 = _lon - dlon / 2.0
-            lat1 = _lat + dlat / 2.0
-            lat0 = _lat - dlat / 2.0
-            area[j, i] = (
-                (np.pi / 180.0)
-                * earth_radius
-                * earth_radius
-                * np.abs(np.sin(np.radians(lat0)) - np.sin(np.radians(lat1)))
-                * np.abs(lon0 - lon1)
-            )
-    return area
+    area[:] = (
+        (np.pi / 180.0)
+        * earth_radius
+        * earth_radius
+        * np.abs(np.sin(np.radians(lat0)) - np.sin(np.radians(lat1)))
+    )[:, None] * np.abs(lon0 - lon1)[None, :]
+
+    _CELL_AREAS[key] = area
+    return area.copy()
@@ -0,0 +1,222 @@
+""" Cache of static grid datasets shared across years and members """
+
+import collections
+import hashlib
+import os
+
+import xarray as xr
+
+import gfdlvitals.util.netcdf as netcdf
+
+__all__ = [
+    "clear",
+    "derived",
+    "get_cache_dir",
+    "load_grid",
+    "set_cache_dir",
+    "set_max_memory",
+]
+
+# Grid datasets held in memory, least recently used first
+_GRIDS = collections.OrderedDict()
+
+# Size in bytes of each grid dataset held in memory
+_NBYTES = {}
+
+# Memory budget of the in-memory cache
+_MAX_MEMORY = 1024**3
+
+# Quantities derived from the cached grid datasets
+_DERIVED = {}
+
+# Content hashes of members that have already been hashed
+_MEMBER_HASHES = {}
+
+# Optional directory where grid datasets are persisted
+_CACHE_DIR = None
+
+
+def set_cache_dir(path):
+    """Sets the directory where grid datasets are persisted
+
+    Parameters
+    ----------
+    path : str, path-like, or None
+        Cache directory. If None, grids are only cached in memory.
+    """
+    global _CACHE_DIR
+    _CACHE_DIR = None if path is None else os.path.abspath(path)
+
+
+def set_max_memory(nbytes):
+    """Sets the memory budget of the in-memory cache
+
+    Parameters
+    ----------
+    nbytes : int
+        Memory budget in bytes. The least recently used grids are
+        evicted once the budget is exceeded.
+    """
+    global _MAX_MEMORY
+    _MAX_MEMORY = nbytes
+    _evict()
+
+
+def get_cache_dir():
+    """Returns the directory where grid datasets are persisted
+
+    Returns
+    -------
+    str or None
+        Cache directory, or None if grids are only cached in memory
+    """
+    return _CACHE_DIR
+
+
+def clear():
+    """Removes all grid datasets from the in-memory cache"""
+    _GRIDS.clear()
+    _NBYTES.clear()
+    _DERIVED.clear()
+    _MEMBER_HASHES.clear()
+
+
+def _evict():
+    """Evicts the least recently used grids over the memory budget"""
+    while len(_GRIDS) > 0 and sum(_NBYTES.values()) > _MAX_MEMORY:
+        key, grid = _GRIDS.popitem(last=False)
+        del _NBYTES[key]
+        for derived_key in [x for x in _DERIVED if x[0] == id(grid)]:
+            del _DERIVED[derived_key]
+
+
+def _member_hash(tar, member):
+    """Returns the content hash of a tar file member
+
+    The hash is remembered for members of indexed tar files so that
+    each static file is only read once per tar file.
+
+    Parameters
+    ----------
+    tar : gfdlvitals.util.netcdf.TarIndex
+        Indexed history tarfile object
+    member : str
+        Name of file inside tar file
+
+    Returns
+    -------
+    str
+        Hex digest of the member contents
+    """
+    memo = None
+    if isinstance(tar, netcdf.TarIndex) and tar.path is not None:
+        info = tar.getmember(member)
+        memo = (os.path.abspath(tar.path), info.name, info.offset_data, info.size)
+        if memo in _MEMBER_HASHES:
+            return _MEMBER_HASHES[memo]
+
+    digest = hashlib.blake2b(netcdf.extract_buffer(tar, member)).hexdigest()
+
+    if memo is not None:
+        _MEMBER_HASHES[memo] = digest
+    return digest
+
+
+def load_grid(tar, members, variables=None, concat_dim=None):
+    """Loads a static grid dataset, reusing previously loaded copies
+
+    Grids are keyed by a hash of the member contents, so identical static
+    files from different years are only decoded once per run. The least
+    recently used grids are evicted from memory beyond a budget (see
+    `set_max_memory`). When a cache directory is set, grids are also
+    persisted to disk and shared between runs and worker processes.
+
+    Only static files should be loaded, since every member that changes
+    between years adds an entry to the cache.
+
+    The returned dataset is shared between callers and must not be
+    modified in place.
+
+    Parameters
+    ----------
+    tar : gfdlvitals.util.netcdf.TarIndex
+        Indexed history tarfile object
+    members : str or list
+        Name of the static file inside the tar file, or a list of names
+        for tiled grids
+    variables : list, optional
+        Variables to retain along with their coordinates, by default None
+    concat_dim : str, optional
+        Dimension along which to concatenate multiple members,
+        by default None
+
+    Returns
+    -------
+    xarray.Dataset
+        In-memory grid dataset
+    """
+    members = [members] if isinstance(members, str) else list(members)
+
+    key = hashlib.blake2b()
+    for member in members:
+        key.update(_member_hash(tar, member).encode())
+    key.update(repr((variables, concat_dim)).encode())
+    key = key.hexdigest()
+
+    if key in _GRIDS:
+        _GRIDS.move_to_end(key)
+        return _GRIDS[key]
+
+    cache_file = None if _CACHE_DIR is None else os.path.join(_CACHE_DIR, f"{key}.nc")
+
+    if cache_file is not None and os.path.exists(cache_file):
+        dset = netcdf.in_mem_xr(cache_file)
+        dset.load()
+        dset.close()
+    else:
+        dsets = [
+            netcdf.in_mem_xr(netcdf.extract_buffer(tar, x), variables=variables)
+            for x in members
+        ]
+        dset = dsets[0] if concat_dim is None else xr.concat(dsets, concat_dim)
+        dset.load()
+
+        if cache_file is not None:
+            os.makedirs(_CACHE_DIR, exist_ok=True)
+            tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+            dset.to_netcdf(tmp_file)
+            os.replace(tmp_file, cache_file)
+
+    _GRIDS[key] = dset
+    _NBYTES[key] = dset.nbytes
+    _evict()
+    return dset
+
+
+def derived(grid, name, function):
+    """Returns a quantity derived from a grid, computing it once per grid
+
+    Quantities are remembered for grid datasets returned by `load_grid`
+    for the duration of the run. For other datasets, they are computed
+    on every call.
+
+    Parameters
+    ----------
+    grid : xarray.Dataset
+        Grid dataset returned by `load_grid`
+    name : str
+        Name of the derived quantity
+    function : callable
+        Called with the grid dataset to compute the quantity
+
+    Returns
+    -------
+    object
+        Derived quantity
+    """
+    if not any(x is grid for x in _GRIDS.values()):
+        return function(grid)
+    key = (id(grid), name)
+    if key not in _DERIVED:
+        _DERIVED[key] = function(grid)
+    return _DERIVED[key]
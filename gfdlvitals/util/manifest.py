@@ -0,0 +1,140 @@
+""" Manifest of processed history files for incremental runs """
+
+import json
+import os
+
+__all__ = [
+    "MANIFEST_FILE",
+    "pending_components",
+    "read_manifest",
+    "record_year",
+    "tar_signature",
+    "write_manifest",
+]
+
+MANIFEST_FILE = "gfdlvitals_manifest.json"
+
+
+def read_manifest(outdir):
+    """Reads the manifest of processed history files
+
+    Parameters
+    ----------
+    outdir : str, path-like
+        Output directory containing the db files
+
+    Returns
+    -------
+    dict
+        Mappings of history tar file names to their recorded state
+    """
+    path = os.path.join(outdir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as fhandle:
+        return json.load(fhandle)
+
+
+def write_manifest(outdir, manifest):
+    """Writes the manifest of processed history files
+
+    The manifest is written to a temporary file first and then moved
+    into place so an interrupted run never leaves a truncated manifest.
+
+    Parameters
+    ----------
+    outdir : str, path-like
+        Output directory containing the db files
+    manifest : dict
+        Mappings of history tar file names to their recorded state
+    """
+    if not os.path.exists(outdir):
+        os.makedirs(outdir)
+    path = os.path.join(outdir, MANIFEST_FILE)
+    with open(path + ".tmp", "w") as fhandle:
+        json.dump(manifest, fhandle, indent=2, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+
+def tar_signature(infile):
+    """Returns the size and modification time of a history file
+
+    Parameters
+    ----------
+    infile : str, path-like
+        History tar file path
+
+    Returns
+    -------
+    dict
+        Size in bytes and modification time in nanoseconds
+    """
+    stat = os.stat(infile)
+    return {"size": stat.st_size, "mtime": stat.st_mtime_ns}
+
+
+def pending_components(manifest, infile, components, available=None):
+    """Determines which requested components still need to be computed
+
+    Parameters
+    ----------
+    manifest : dict
+        Mappings of history tar file names to their recorded state
+    infile : str, path-like
+        History tar file path
+    components : list
+        Requested components, possibly including "all"
+    available : list, optional
+        Components of the model that "all" stands for. If None, "all" is
+        computed again when only some components are recorded,
+        by default None
+
+    Returns
+    -------
+    list
+        Components to compute. An empty list means the year is up to date.
+    """
+    entry = manifest.get(os.path.basename(infile))
+    if entry is None or entry["signature"] != tar_signature(infile):
+        return list(components)
+
+    done = entry["components"]
+    if "all" in done:
+        return []
+    if "all" in components:
+        if available is None:
+            return ["all"]
+        components = sorted(set(available) | set(x for x in components if x != "all"))
+    return [x for x in components if x not in done]
+
+
+def record_year(manifest, infile, components):
+    """Records that components of a history file have been processed
+
+    Parameters
+    ----------
+    manifest : dict
+        Mappings of history tar file names to their recorded state
+    infile : str, path-like
+        History tar file path
+    components : list
+        Components that were computed
+
+    Returns
+    -------
+    dict
+        Updated manifest
+    """
+    name = os.path.basename(infile)
+    signature = tar_signature(infile)
+    entry = manifest.get(name)
+    if entry is None or entry["signature"] != signature:
+        done = []
+    else:
+        done = entry["components"]
+    if "all" in components or "all" in done:
+        done = ["all"]
+    else:
+        done = sorted(set(done) | set(components))
+    manifest[name] = {"signature": signature, "components": done}
+    return manifest
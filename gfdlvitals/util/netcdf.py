@@ -1,10 +1,296 @@
 """ Utilities for working with NetCDF files """
 
+import hashlib
+import io
+import json
+import mmap
+import os
 import tarfile
+import threading
 import netCDF4
+import numpy as np
 import xarray as xr
 
-__all__ = ["extract_from_tar", "in_mem_nc", "in_mem_xr", "tar_member_exists"]
+__all__ = [
+    "TarIndex",
+    "extract_buffer",
+    "extract_from_tar",
+    "in_mem_nc",
+    "in_mem_xr",
+    "tar_member_exists",
+]
+
+
+def _normalize_member(member):
+    """Strips the leading "./" that some tar files prepend to member names
+
+    Parameters
+    ----------
+    member : str
+        Name of file inside tar file
+
+    Returns
+    -------
+    str
+        Normalized member name
+    """
+    return member[2:] if member.startswith("./") else member
+
+
+def _sidecar_paths(path):
+    """Candidate locations of the index sidecar file for a tar file
+
+    The sidecar is stored next to the tar file when possible, otherwise
+    in the user cache directory.
+
+    Parameters
+    ----------
+    path : str, path-like
+        Path to tar file
+
+    Returns
+    -------
+    list
+        Paths to the sidecar file in order of preference
+    """
+    path = os.path.abspath(path)
+    cache_dir = os.environ.get(
+        "XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache")
+    )
+    cache_name = hashlib.sha1(path.encode()).hexdigest() + ".json"
+    return [
+        path + ".index.json",
+        os.path.join(cache_dir, "gfdlvitals", "tarindex", cache_name),
+    ]
+
+
+class TarIndex:
+    """Index of the members of a tar file
+
+    The member headers are scanned once and stored in a dictionary keyed
+    by the normalized member name so that lookups do not require repeated
+    scans of the tar file.
+
+    Members of uncompressed tar files can be accessed as zero-copy views
+    of a read-only memory map of the tar file.
+
+    When a path to an uncompressed tar file is provided, the offsets of the
+    members are also saved to a small sidecar file. Later instances
+    validate the sidecar against the size and modification time of the tar
+    file and seek directly to the members without scanning the headers.
+
+    Parameters
+    ----------
+    tar : tarfile object or path str
+        Opened tarfile handle or path to tar file
+    sidecar : bool, optional
+        Read and write the index sidecar file, by default True
+    """
+
+    SIDECAR_VERSION = 1
+
+    def __init__(self, tar, sidecar=True):
+        self.path = tar if isinstance(tar, (str, os.PathLike)) else None
+        self.tar = tarfile.open(tar) if self.path is not None else tar
+        self.mappable = isinstance(self.tar.fileobj, io.BufferedReader)
+        self._mmap = None
+
+        sidecar = sidecar and self.path is not None and self.mappable
+
+        self.members = self._read_sidecar() if sidecar else None
+        if self.members is None:
+            self.members = {_normalize_member(x.name): x for x in self.tar.getmembers()}
+            if sidecar:
+                self._write_sidecar()
+
+    def _signature(self):
+        stat = os.stat(self.path)
+        return {"size": stat.st_size, "mtime": stat.st_mtime_ns}
+
+    def _read_sidecar(self):
+        """Loads the member headers from a valid sidecar file
+
+        Returns
+        -------
+        dict or None
+            Mappings of member names to headers, None if no valid sidecar
+        """
+        signature = self._signature()
+        for sidecar in _sidecar_paths(self.path):
+            try:
+                with open(sidecar, "r") as fhandle:
+                    index = json.load(fhandle)
+            except (OSError, ValueError):
+                continue
+
+            if (
+                index.get("version") != self.SIDECAR_VERSION
+                or index.get("signature") != signature
+            ):
+                continue
+
+            members = {}
+            for name, (offset, offset_data, size, mtime, mtype) in index[
+                "members"
+            ].items():
+                info = tarfile.TarInfo(name)
+                info.offset = offset
+                info.offset_data = offset_data
+                info.size = size
+                info.mtime = mtime
+                info.type = mtype.encode("latin-1")
+                members[_normalize_member(name)] = info
+            return members
+
+        return None
+
+    def _write_sidecar(self):
+        """Saves the member headers to the first writable sidecar location"""
+        if any(x.issparse() for x in self.members.values()):
+            return
+
+        index = {
+            "version": self.SIDECAR_VERSION,
+            "signature": self._signature(),
+            "members": {
+                x.name: [
+                    x.offset,
+                    x.offset_data,
+                    x.size,
+                    x.mtime,
+                    x.type.decode("latin-1"),
+                ]
+                for x in self.members.values()
+            },
+        }
+        for sidecar in _sidecar_paths(self.path):
+            # -- Worker processes and the prefetch thread may index the
+            #    same tar file at once, so each writer has its own file
+            tmp_file = f"{sidecar}.{os.getpid()}.{threading.get_ident()}.tmp"
+            try:
+                os.makedirs(os.path.dirname(sidecar), exist_ok=True)
+                with open(tmp_file, "w") as fhandle:
+                    json.dump(index, fhandle, separators=(",", ":"))
+                os.replace(tmp_file, sidecar)
+                return
+            except OSError:
+                if os.path.exists(tmp_file):
+                    os.remove(tmp_file)
+                continue
+
+    def __contains__(self, member):
+        return _normalize_member(member) in self.members
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __str__(self):
+        return self.__class__.__name__
+
+    def getmember(self, member):
+        """Returns the header of a tar file member
+
+        Parameters
+        ----------
+        member : str
+            Name of file inside tar file
+
+        Returns
+        -------
+        tarfile.TarInfo
+            Member header
+        """
+        return self.members[_normalize_member(member)]
+
+    def getnames(self):
+        """Returns the normalized names of all members
+
+        Returns
+        -------
+        list
+            Member names
+        """
+        return list(self.members.keys())
+
+    def extractfile(self, member):
+        """Returns a file object for a tar file member
+
+        Parameters
+        ----------
+        member : str
+            Name of file inside tar file
+
+        Returns
+        -------
+        io.BufferedReader
+            Byte stream of the member
+        """
+        return self.tar.extractfile(self.getmember(member))
+
+    def view(self, member):
+        """Returns a zero-copy view of a tar file member
+
+        The pages of the member are read from disk on demand when the
+        view is accessed.
+
+        Parameters
+        ----------
+        member : str
+            Name of file inside tar file
+
+        Returns
+        -------
+        numpy.ndarray
+            Read-only array of the member bytes
+        """
+        info = self.getmember(member)
+        if not self.mappable or info.issparse():
+            return np.frombuffer(self.extractfile(member).read(), dtype=np.uint8)
+        if self._mmap is None:
+            self._mmap = mmap.mmap(
+                self.tar.fileobj.fileno(), 0, access=mmap.ACCESS_READ
+            )
+        return np.frombuffer(
+            self._mmap, dtype=np.uint8, count=info.size, offset=info.offset_data
+        )
+
+    def close(self):
+        """Closes the underlying tarfile handle and memory map"""
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                # Views are still held by open datasets; the map is
+                # released once the last of them is garbage collected
+                pass
+            self._mmap = None
+        self.tar.close()
+
+
+def extract_buffer(tar, member):
+    """Extract individual file from a tar file as a bytes-like object
+
+    Members of indexed, uncompressed tar files are returned as zero-copy
+    views of the memory-mapped tar file.
+
+    Parameters
+    ----------
+    tar : TarIndex or tarfile object
+        Indexed tar file or opened tar file
+    member : str
+        Filename to extract from tar file
+
+    Returns
+    -------
+    numpy.ndarray or bytes
+        Contents of the member
+    """
+    if isinstance(tar, TarIndex):
+        return tar.view(member)
+    return extract_from_tar(tar, member).read()
 
 
 def extract_from_tar(tar, member, ncfile=False):
@@ -12,8 +298,8 @@ def extract_from_tar(tar, member, ncfile=False):
 
     Parameters
     ----------
-    tar : either tarfile object or path str
-        Path to tar file
+    tar : TarIndex, tarfile object, or path str
+        Indexed tar file, opened tar file, or path to tar file
     member : str
         Filename to extract from tar file
     ncfile : bool, optional
@@ -25,15 +311,16 @@ def extract_from_tar(tar, member, ncfile=False):
         either byte stram or netCDF4.Dataset
     """
 
-    _tar = tarfile.open(tar) if isinstance(tar, str) else tar
-
-    if member not in _tar.getnames():
-        member = "./" + member
-
-    data = _tar.extractfile(member)
+    _tar = TarIndex(tar) if isinstance(tar, str) else tar
 
     if ncfile:
-        data = in_mem_nc(data)
+        data = in_mem_nc(extract_buffer(_tar, member))
+    elif isinstance(_tar, TarIndex):
+        data = _tar.extractfile(member)
+    else:
+        if member not in _tar.getnames():
+            member = "./" + member
+        data = _tar.extractfile(member)
 
     if isinstance(tar, str):
         _tar.close()
@@ -46,7 +333,7 @@ def in_mem_nc(data):
 
     Parameters
     ----------
-    data : byte stream object
+    data : byte stream object or bytes-like object
         In-memory object
 
     Returns
@@ -55,17 +342,23 @@ def in_mem_nc(data):
         In-memory netCDF4 dataset object
     """
 
-    data = data.read()
+    if hasattr(data, "read"):
+        data = data.read()
     return netCDF4.Dataset("in-mem-file", mode="r", memory=data)
 
 
-def in_mem_xr(data):
+def in_mem_xr(data, variables=None):
     """Wrapper to convert bytes object to xarray.Dataset
 
+    The dataset is opened lazily, so only the variables that are used
+    are read from the underlying file.
+
     Parameters
     ----------
-    data : byte stream object
+    data : byte stream object, bytes-like object, or netCDF4.Dataset
         In-memory object
+    variables : list, optional
+        Variables to retain along with their coordinates, by default None
 
     Returns
     -------
@@ -74,11 +367,16 @@ def in_mem_xr(data):
     """
 
     time_coder = xr.coders.CFDatetimeCoder(use_cftime=True)
+    if isinstance(data, (bytes, bytearray, memoryview, np.ndarray)):
+        data = in_mem_nc(data)
     if isinstance(data, netCDF4._netCDF4.Dataset):
         dfile = xr.open_dataset(xr.backends.NetCDF4DataStore(data), decode_times=time_coder, decode_timedelta=False)
     else:
         dfile = xr.open_dataset(data, decode_times=time_coder, decode_timedelta=False)
 
+    if variables is not None:
+        dfile = dfile[[x for x in variables if x in dfile.variables]]
+
     return dfile
 
 
@@ -87,8 +385,8 @@ def tar_member_exists(tar, member):
 
     Parameters
     ----------
-    tar : tarfile object
-        Opened tarfile handle
+    tar : TarIndex or tarfile object
+        Indexed tar file or opened tarfile handle
     member : str
         Name of file inside tar file
 
@@ -97,7 +395,9 @@ def tar_member_exists(tar, member):
     bool
         True if exists, otherwise False
     """
-    if member in tar.getnames():
+    if isinstance(tar, TarIndex):
+        status = member in tar
+    elif member in tar.getnames():
         status = True
     elif str("./" + member) in tar.getnames():
         status = True
@@ -0,0 +1,212 @@
+""" Background read-ahead of history tar files """
+
+import itertools
+import os
+import tarfile
+import threading
+
+import gfdlvitals.util.netcdf as netcdf
+
+__all__ = ["Prefetcher"]
+
+# Size of the blocks read by the background thread
+_BLOCK_SIZE = 16 * 1024**2
+
+
+class Prefetcher:
+    """Reads history tar files ahead of the year being processed
+
+    A background thread indexes the next `depth` tar files and reads the
+    members that will be used, so the pages are already in the operating
+    system cache when the averagers access them. I/O for the upcoming years overlaps with
+    the computation of the current year. The pages are shared with worker
+    processes and are not held by this process.
+
+    Parameters
+    ----------
+    infiles : list, optional
+        History tar file paths in the order they are processed. More files
+        can be added with `append`, by default None
+    depth : int, optional
+        Number of tar files to read ahead of the current one, by default 1
+    max_memory : int, optional
+        Maximum number of bytes read ahead of the current tar file,
+        by default None (unbounded)
+    members : list, optional
+        Names of the history files to read, e.g. "atmos_month" for
+        "00010101.atmos_month.nc" and its tiles, by default None (all)
+    """
+
+    def __init__(self, infiles=None, depth=1, max_memory=None, members=None):
+        self.infiles = [] if infiles is None else list(infiles)
+        self.depth = depth
+        self.max_memory = max_memory
+        self.members = None if members is None else set(members)
+        self.position = -1
+        self.nbytes = {}
+        self._closed = False
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __str__(self):
+        return self.__class__.__name__
+
+    def start(self):
+        """Starts the background thread
+
+        Returns
+        -------
+        Prefetcher
+            The started prefetcher
+        """
+        if self._thread is None and self.depth > 0:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def append(self, infile):
+        """Adds a tar file to the end of the processing order
+
+        Parameters
+        ----------
+        infile : str, path-like
+            History tar file path
+        """
+        with self._condition:
+            self.infiles.append(infile)
+            self._condition.notify_all()
+
+    def advance(self, infile):
+        """Marks a tar file as the one currently being processed
+
+        Tar files up to `depth` positions after it may be read ahead, and
+        the bytes read for it and earlier files no longer count towards
+        `max_memory`.
+
+        Parameters
+        ----------
+        infile : str, path-like
+            History tar file path
+        """
+        with self._condition:
+            self.position = max(self.position, self.infiles.index(infile))
+            self._condition.notify_all()
+
+    def close(self):
+        """Stops the background thread"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _bytes_ahead(self):
+        """Returns the number of bytes read ahead of the current tar file"""
+        return sum(y for x, y in self.nbytes.items() if x > self.position)
+
+    def _wait(self, num, nbytes=0):
+        """Waits until a tar file may be read
+
+        Parameters
+        ----------
+        num : int
+            Position of the tar file
+        nbytes : int, optional
+            Number of bytes about to be read, by default 0
+
+        Returns
+        -------
+        bool
+            True if reading should continue, False if the prefetcher is
+            closed or the tar file is already being processed
+        """
+        with self._condition:
+            while not self._closed and self.position < num:
+                if num <= self.position + self.depth and (
+                    self.max_memory is None
+                    or self._bytes_ahead() + nbytes <= self.max_memory
+                ):
+                    return True
+                self._condition.wait()
+            return False
+
+    def _run(self):
+        """Reads the tar files in order"""
+        for num in itertools.count():
+            with self._condition:
+                while not self._closed and num >= len(self.infiles):
+                    self._condition.wait()
+                if self._closed:
+                    return
+                infile = self.infiles[num]
+            if not self._wait(num):
+                if self._closed:
+                    return
+                continue
+            try:
+                self._read(num, infile)
+            except (OSError, tarfile.TarError):
+                # Errors are reported when the year is processed
+                continue
+
+    def _wanted(self, member):
+        """Returns True if a tar file member is one of the history files read
+
+        Parameters
+        ----------
+        member : tarfile.TarInfo
+            Member header
+
+        Returns
+        -------
+        bool
+            True if the member is read ahead
+        """
+        if not member.isfile():
+            return False
+        if self.members is None:
+            return True
+        # -- Member names are "<year>.<history file>[.tile<N>].nc"
+        parts = os.path.basename(member.name).split(".")
+        return len(parts) > 2 and parts[1] in self.members
+
+    def _read(self, num, infile):
+        """Reads the used members of a tar file in blocks
+
+        Parameters
+        ----------
+        num : int
+            Position of the tar file
+        infile : str, path-like
+            History tar file path
+        """
+        with netcdf.TarIndex(infile) as tar:
+            if tar.mappable:
+                extents = sorted(
+                    (x.offset_data, x.size)
+                    for x in tar.members.values()
+                    if self._wanted(x)
+                )
+            else:
+                extents = [(0, os.path.getsize(infile))]
+
+        with open(infile, "rb") as fhandle:
+            for offset, size in extents:
+                end = offset + size
+                while offset < end:
+                    nbytes = min(_BLOCK_SIZE, end - offset)
+                    if not self._wait(num, nbytes):
+                        return
+                    nbytes = len(os.pread(fhandle.fileno(), nbytes, offset))
+                    if nbytes == 0:
+                        break
+                    offset = offset + nbytes
+                    with self._condition:
+                        self.nbytes[num] = self.nbytes.get(num, 0) + nbytes
@@ -0,0 +1,408 @@
+""" Registry of user-defined averaging regions """
+
+import collections
+import hashlib
+import os
+import re
+import warnings
+
+import numpy as np
+import scipy.sparse
+import xarray as xr
+
+import gfdlvitals.util.gridcache as gridcache
+import gfdlvitals.util.netcdf as netcdf
+import gfdlvitals.util.xrtools as xrtools
+
+try:
+    import regionmask
+except ImportError:
+    regionmask = None
+
+__all__ = [
+    "RegionWeights",
+    "clear",
+    "configure",
+    "names",
+    "region_sum",
+    "register",
+    "weight_matrix",
+    "weighted_avg",
+]
+
+RegionWeights = collections.namedtuple("RegionWeights", ["names", "matrix", "dims"])
+RegionWeights.__doc__ = """Sparse region weights for a model grid
+
+Attributes
+----------
+names : list
+    Names of the regions, one per row of the matrix
+matrix : scipy.sparse.csr_matrix
+    Fraction of each grid cell in each region, shaped (region, cell)
+dims : tuple
+    Grid dimensions, in the order in which cells are flattened
+"""
+
+# Registered region definitions as (identifier, region names, mask function)
+_REGISTRY = []
+
+# Specification used to configure the registry
+_SPEC = None
+
+# Weight matrices held in memory for the duration of the run
+_MATRICES = {}
+
+
+def _sanitize(name):
+    """Returns a region name that is safe to use in a file name"""
+    return re.sub(r"[^0-9A-Za-z_-]", "_", str(name))
+
+
+def _add(ident, region_names, mask):
+    """Adds a set of regions to the registry
+
+    Region names label the output db files, so a name may not repeat
+    that of a predefined latitude region or another registered region.
+
+    Parameters
+    ----------
+    ident : str
+        Identifier of the region definitions
+    region_names : list
+        Sanitized region names
+    mask : callable
+        Function that returns the masks of the regions for a grid
+
+    Raises
+    ------
+    ValueError
+        If a region name is reserved or already registered
+    """
+    taken = list(xrtools.REGIONS) + names()
+    for num, name in enumerate(region_names):
+        if name in taken or name in region_names[:num]:
+            raise ValueError(
+                f"Region name {name} of {ident} is reserved or already registered"
+            )
+    _REGISTRY.append((ident, list(region_names), mask))
+
+
+def clear():
+    """Removes all registered regions"""
+    global _SPEC
+    _REGISTRY.clear()
+    _MATRICES.clear()
+    _SPEC = None
+
+
+def configure(spec):
+    """Configures the registry from a comma-separated specification
+
+    Each entry is either the name of a set of regionmask defined regions,
+    e.g. "ar6.land" or "srex", or the path to a netCDF mask file.
+    Configuring the registry with the current specification is a no-op.
+
+    Parameters
+    ----------
+    spec : str or None
+        Comma-separated list of region definitions. If None, only the
+        predefined latitude regions are used.
+    """
+    global _SPEC
+    if spec == _SPEC:
+        return
+    clear()
+    if spec is not None:
+        for entry in spec.split(","):
+            register(entry.strip())
+    _SPEC = spec
+
+
+def names():
+    """Returns the names of all registered regions
+
+    Returns
+    -------
+    list
+        Region names used to label the output db files
+    """
+    return [x for _, regions, _ in _REGISTRY for x in regions]
+
+
+def register(definition):
+    """Registers a set of regions
+
+    Parameters
+    ----------
+    definition : str, path-like, or regionmask.Regions
+        Path to a netCDF mask file, the name of a set of regionmask
+        defined regions (e.g. "ar6.land"), or a regionmask.Regions object.
+
+        Each variable in a mask file with at least two dimensions is a region
+        and holds the fraction of each grid cell in that region. Variables
+        with a "region" dimension, such as those written by
+        regionmask.Regions.mask_3D, are expanded into one region per entry,
+        labeled by their "abbrevs" coordinate.
+    """
+    if isinstance(definition, (str, os.PathLike)) and os.path.exists(definition):
+        _register_mask_file(os.path.abspath(definition))
+        return
+
+    if regionmask is None:
+        raise ImportError(f"regionmask is required for regions: {definition}")
+
+    if isinstance(definition, str):
+        regions = regionmask.defined_regions
+        for attr in definition.split("."):
+            regions = getattr(regions, attr)
+        ident = f"regionmask:{regionmask.__version__}:{definition}"
+    else:
+        regions = definition
+        outlines = [(x, y.wkt) for x, y in zip(regions.abbrevs, regions.polygons)]
+        ident = hashlib.blake2b(repr(outlines).encode()).hexdigest()
+        ident = f"regionmask:{regionmask.__version__}:{ident}"
+
+    def _mask(geolat, geolon):
+        if geolon is None:
+            warnings.warn(f"Unable to find longitudes for regions {ident}. Skipping.")
+            return None
+        lat = np.asarray(geolat).reshape(-1, geolat.shape[-1])
+        lon = np.asarray(geolon).reshape(-1, geolon.shape[-1])
+        mask = regions.mask_3D(lon, lat, drop=False)
+        return mask.values.reshape(len(regions.abbrevs), -1)
+
+    _add(ident, [_sanitize(x) for x in regions.abbrevs], _mask)
+
+
+def _read_mask_file(path):
+    """Reads the region masks from a netCDF mask file
+
+    Parameters
+    ----------
+    path : str, path-like
+        Path to netCDF mask file
+
+    Returns
+    -------
+    dict
+        Mappings of region names to mask arrays
+
+    Raises
+    ------
+    ValueError
+        If two masks have the same sanitized name
+    """
+    dset = netcdf.in_mem_xr(path)
+    masks = {}
+
+    def _set(name, mask):
+        name = _sanitize(name)
+        if name in masks:
+            raise ValueError(f"Region name {name} is repeated in {path}")
+        masks[name] = mask
+
+    for var in dset.data_vars:
+        arr = dset[var]
+        if "region" in arr.dims:
+            labels = arr["abbrevs"] if "abbrevs" in arr.coords else arr["region"]
+            for num, label in enumerate(labels.values):
+                mask = arr.isel(region=num)
+                if mask.ndim >= 2:
+                    _set(label, mask)
+        elif arr.ndim >= 2:
+            _set(var, arr)
+    return masks
+
+
+def _register_mask_file(path):
+    """Registers the regions defined in a netCDF mask file"""
+    stat = os.stat(path)
+    ident = f"file:{path}:{stat.st_size}:{stat.st_mtime_ns}"
+
+    def _mask(geolat, geolon):
+        masks = _read_mask_file(path)
+
+        # Masks on the grid of another component are skipped. Masks are
+        # matched to the grid by their dimension names, not only by size.
+        if any(sorted(x.dims) != sorted(geolat.dims) for x in masks.values()):
+            warnings.warn(
+                f"Mask file {path} is not on the grid {geolat.dims}. Skipping."
+            )
+            return None
+
+        for name, mask in masks.items():
+            masks[name] = mask.transpose(*geolat.dims)
+            if masks[name].shape != geolat.shape:
+                raise ValueError(
+                    f"Mask {name} in {path} has shape {masks[name].shape}; "
+                    + f"expected {geolat.shape}"
+                )
+        return np.stack([x.fillna(0.0).values.reshape(-1) for x in masks.values()])
+
+    _add(ident, list(_read_mask_file(path).keys()), _mask)
+
+
+def weight_matrix(geolat, geolon=None):
+    """Returns the sparse weights of the registered regions for a grid
+
+    Matrices are keyed by a hash of the grid coordinates and the region
+    definitions. When a grid cache directory is set, they are persisted
+    to disk and shared between runs and worker processes.
+
+    Parameters
+    ----------
+    geolat : xarray.DataArray
+        Data Array of latitude coordinates
+    geolon : xarray.DataArray, optional
+        Data Array of longitude coordinates, by default None
+
+    Returns
+    -------
+    RegionWeights
+        Region names, sparse weight matrix, and grid dimensions
+    """
+    key = hashlib.blake2b()
+    for arr in [geolat, geolon]:
+        if arr is not None:
+            key.update(repr((arr.dims, arr.shape)).encode())
+            key.update(np.ascontiguousarray(arr.values).tobytes())
+    key.update(repr([x[0] for x in _REGISTRY]).encode())
+    key = key.hexdigest()
+
+    if key not in _MATRICES:
+        cache_dir = gridcache.get_cache_dir()
+        cache_file = (
+            None
+            if cache_dir is None
+            else os.path.join(cache_dir, "regions", f"{key}.npz")
+        )
+
+        if cache_file is not None and os.path.exists(cache_file):
+            with np.load(cache_file) as cached:
+                matrix = scipy.sparse.csr_matrix(
+                    (cached["data"], cached["indices"], cached["indptr"]),
+                    shape=tuple(cached["shape"]),
+                )
+                regions = [str(x) for x in cached["names"]]
+        else:
+            regions = []
+            rows = []
+            for _, _names, _mask in _REGISTRY:
+                mask = _mask(geolat, geolon)
+                if mask is not None:
+                    regions = regions + _names
+                    rows.append(scipy.sparse.csr_matrix(mask, dtype=np.float64))
+            matrix = (
+                scipy.sparse.vstack(rows, format="csr")
+                if len(rows) > 0
+                else scipy.sparse.csr_matrix((0, geolat.size))
+            )
+
+            if cache_file is not None:
+                os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+                tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+                with open(tmp_file, "wb") as fhandle:
+                    np.savez(
+                        fhandle,
+                        data=matrix.data,
+                        indices=matrix.indices,
+                        indptr=matrix.indptr,
+                        shape=matrix.shape,
+                        names=np.array(regions, dtype=str),
+                    )
+                os.replace(tmp_file, cache_file)
+
+        _MATRICES[key] = (regions, matrix)
+
+    regions, matrix = _MATRICES[key]
+    return RegionWeights(regions, matrix, tuple(geolat.dims))
+
+
+def region_sum(arr, weights):
+    """Sums an array over the cells of each region
+
+    Parameters
+    ----------
+    arr : xarray.DataArray
+        Input array, e.g. cell area. Dimensions other than the grid
+        dimensions are summed as well.
+    weights : RegionWeights
+        Sparse region weights for the grid
+
+    Returns
+    -------
+    xarray.DataArray
+        Sum for each region
+    """
+    values = arr.fillna(0.0).transpose(..., *weights.dims).values
+    values = values.reshape(-1, weights.matrix.shape[1]).sum(axis=0)
+    return xr.DataArray(
+        weights.matrix @ values, dims="region", coords={"region": weights.names}
+    )
+
+
+def weighted_avg(dset, weights, region_weights):
+    """Generates weighted space and time averages for each region
+
+    This is the sparse counterpart of `xrtools.xr_weighted_avg`. Each
+    variable is reduced over its non-grid dimensions first, so the cost
+    of adding regions is a sparse product per variable. If a memory
+    budget or streaming is set in `xrtools`, variables are read and
+    reduced in chunks.
+
+    Parameters
+    ----------
+    dset : xarray.DataSet
+        Input dataset
+    weights : xarray.DataArray or list
+        Unmasked array to use for weights, e.g. time step times cell area
+    region_weights : RegionWeights
+        Sparse region weights for the grid
+
+    Returns
+    -------
+    xarray.DataSet
+        Weighted averages with a "region" dimension
+    """
+    _weights = [weights] if not isinstance(weights, list) else weights
+    ncell = region_weights.matrix.shape[1]
+
+    result = xr.Dataset(coords={"region": region_weights.names})
+
+    for weight in _weights:
+        order = [x for x in weight.dims if x not in region_weights.dims]
+        order = order + list(region_weights.dims)
+        weight = weight.fillna(0.0)
+
+        for x in list(dset.variables.keys()):
+            if x in result.variables or sorted(dset[x].dims) != sorted(order):
+                continue
+            arr = dset[x]
+            if "timedelta" in str(arr.dtype):
+                arr = arr.astype(np.float32)
+
+            numerator = 0.0
+            denominator = 0.0
+            chunk_dims = [d for d in order if d not in region_weights.dims]
+            indexers = xrtools.xr_chunk_indexers(arr, dims=chunk_dims)
+            for indexer, values in xrtools.xr_iter_chunks(arr, indexers):
+                values = values.transpose(*order).values
+                values = values.reshape(-1, ncell)
+                _weight = weight.isel(indexer).transpose(*order).values
+                _weight = _weight.reshape(-1, ncell)
+                valid = ~np.isnan(values)
+                values = np.where(valid, values * _weight, 0.0)
+                numerator = numerator + values.sum(axis=0)
+                denominator = denominator + np.where(valid, _weight, 0.0).sum(axis=0)
+
+            numerator = region_weights.matrix @ numerator
+            denominator = region_weights.matrix @ denominator
+
+            with np.errstate(divide="ignore", invalid="ignore"):
+                mean = np.where(denominator != 0.0, numerator / denominator, np.nan)
+
+            result[x] = xr.DataArray(
+                mean.astype(arr.dtype), dims="region", attrs=dset[x].attrs
+            )
+
+    return result
@@ -0,0 +1,265 @@
+""" Concurrent processing of the components of a model year """
+
+import atexit
+import concurrent.futures
+import contextlib
+import functools
+import multiprocessing
+import os
+
+import gfdlvitals.util.gridcache as gridcache
+import gfdlvitals.util.netcdf as netcdf
+import gfdlvitals.util.regions as regions
+import gfdlvitals.util.xrtools as xrtools
+
+__all__ = ["configure", "per_year", "run_components", "worker_processes"]
+
+# Worker pool that is reused across years, with the settings it was
+# started with
+_EXECUTOR = None
+_EXECUTOR_KEY = None
+
+# Number of years and components that are processed concurrently
+_CONCURRENCY = 1
+
+
+def configure(args):
+    """Applies the run-time settings of the command line arguments
+
+    Parameters
+    ----------
+    args : argparse.parser
+        Parsed commmand line arguments
+    """
+    global _CONCURRENCY
+    gridcache.set_cache_dir(getattr(args, "grid_cache", None))
+    regions.configure(getattr(args, "regions", None))
+    xrtools.set_max_memory(getattr(args, "max_memory", None))
+    xrtools.set_streaming(getattr(args, "stream", False))
+    _CONCURRENCY = max(1, getattr(args, "jobs", 1)) * max(
+        1, getattr(args, "component_jobs", 1)
+    )
+
+
+def worker_processes():
+    """Returns the number of processes a component routine may start
+
+    The CPUs are shared between the years and the components that are
+    processed concurrently, so that worker pools inside parallel jobs do
+    not oversubscribe the node.
+
+    Returns
+    -------
+    int
+        Number of processes, at least 1
+    """
+    return max(1, multiprocessing.cpu_count() // _CONCURRENCY)
+
+
+def per_year(function):
+    """Decorates a component routine that processes one year at a time
+
+    In batch mode, component routines are called with lists of years and
+    tar files. The decorated routine is called for each year in turn, and
+    if it returns lists, e.g. of the components that succeeded, the items
+    common to all years are returned.
+
+    Parameters
+    ----------
+    function : callable
+        Component routine called with the year label and the tar index
+
+    Returns
+    -------
+    callable
+        Component routine that also accepts lists of years and tar files
+    """
+
+    @functools.wraps(function)
+    def wrapper(fyear, tar, *args, **kwargs):
+        if not isinstance(fyear, list):
+            return function(fyear, tar, *args, **kwargs)
+        results = [
+            function(_fyear, _tar, *args, **kwargs) for _fyear, _tar in zip(fyear, tar)
+        ]
+        if len(results) == 0 or not all(isinstance(x, list) for x in results):
+            return None
+        return [x for x in results[0] if all(x in y for y in results[1:])]
+
+    return wrapper
+
+
+def _year_labels(infiles):
+    """Returns the year labels of history tar files
+
+    Parameters
+    ----------
+    infiles : str, pathlike, or list
+        History tar file path, or a list of paths
+
+    Returns
+    -------
+    str or list
+        Year label (YYYYMMDD), or a list of labels
+    """
+    if isinstance(infiles, list):
+        return [_year_labels(x) for x in infiles]
+    return str(infiles.split("/")[-1].split(".")[0])
+
+
+@contextlib.contextmanager
+def _open_tars(infiles):
+    """Opens and indexes history tar files
+
+    Parameters
+    ----------
+    infiles : str, pathlike, or list
+        History tar file path, or a list of paths
+
+    Yields
+    ------
+    gfdlvitals.util.netcdf.TarIndex or list
+        Indexed tar file, or a list of them
+    """
+    with contextlib.ExitStack() as stack:
+        if isinstance(infiles, list):
+            yield [stack.enter_context(netcdf.TarIndex(x)) for x in infiles]
+        else:
+            yield stack.enter_context(netcdf.TarIndex(infiles))
+
+
+def _get_executor(args, jobs):
+    """Returns the persistent worker pool, starting it if needed
+
+    Workers keep their in-memory grid cache between years when the pool
+    is started by the main process. The pool is restarted if the number
+    of workers or the run-time settings change.
+
+    Parameters
+    ----------
+    args : argparse.parser
+        Parsed commmand line arguments
+    jobs : int
+        Number of worker processes
+
+    Returns
+    -------
+    concurrent.futures.ProcessPoolExecutor
+        Worker pool
+    """
+    global _EXECUTOR, _EXECUTOR_KEY
+    key = (
+        jobs,
+        getattr(args, "grid_cache", None),
+        getattr(args, "regions", None),
+        getattr(args, "max_memory", None),
+        getattr(args, "stream", False),
+    )
+    if _EXECUTOR is not None and _EXECUTOR_KEY != key:
+        _shutdown()
+    if _EXECUTOR is None:
+        _EXECUTOR = concurrent.futures.ProcessPoolExecutor(
+            max_workers=jobs, initializer=configure, initargs=(args,)
+        )
+        _EXECUTOR_KEY = key
+        atexit.register(_shutdown)
+    return _EXECUTOR
+
+
+def _shutdown():
+    """Shuts down the persistent worker pool"""
+    global _EXECUTOR, _EXECUTOR_KEY
+    if _EXECUTOR is not None:
+        _EXECUTOR.shutdown()
+        _EXECUTOR = None
+        _EXECUTOR_KEY = None
+
+
+def _report(label, exc):
+    """Reports a component that failed"""
+    print(f"\n\n# -----\n# {label} vitals failed\n# -----\n\n")
+    print(exc)
+
+
+def _run_component(function, infile, workdir):
+    """Worker function that processes one component of a year
+
+    Parameters
+    ----------
+    function : callable
+        Component routine called with the year label and the tar index
+    infile : str, pathlike, or list
+        History tar file path, or a list of paths in batch mode
+    workdir : str, pathlike
+        Directory in which to write the db files
+
+    Returns
+    -------
+    object
+        Return value of the component routine
+    """
+    os.chdir(workdir)
+    with _open_tars(infile) as tar:
+        return function(_year_labels(infile), tar)
+
+
+def run_components(args, infile, components, jobs=None):
+    """Runs the components of a model year, optionally in parallel
+
+    Components must write to separate db files. Each worker opens the tar
+    file independently and reuses its index sidecar. Components are
+    submitted in the order given, so the largest ones should come first.
+
+    Parameters
+    ----------
+    args : argparse.parser
+        Parsed commmand line arguments
+    infile : str, pathlike, or list
+        History tar file path, or a list of paths of consecutive years
+        in batch mode
+    components : list
+        Component labels and routines, as tuples. Routines are called
+        with the year label and the tar index, or with lists of them in
+        batch mode (see `per_year`). A component that fails is reported
+        and does not stop the others.
+    jobs : int, optional
+        Number of components to run in parallel, by default the value of
+        `args.component_jobs`, or 1
+
+    Returns
+    -------
+    dict
+        Mappings of the labels of the components that did not fail to
+        the values their routines returned
+    """
+    jobs = getattr(args, "component_jobs", 1) if jobs is None else jobs
+
+    results = {}
+    if jobs <= 1 or len(components) <= 1:
+        with _open_tars(infile) as tar:
+            for label, function in components:
+                try:
+                    results[label] = function(_year_labels(infile), tar)
+                except Exception as exc:
+                    _report(label, exc)
+        return results
+
+    executor = _get_executor(args, jobs)
+    futures = [
+        (label, executor.submit(_run_component, function, infile, os.getcwd()))
+        for label, function in components
+    ]
+    for label, future in futures:
+        try:
+            results[label] = future.result()
+        except Exception as exc:
+            _report(label, exc)
+            if isinstance(exc, concurrent.futures.process.BrokenProcessPool):
+                _shutdown()
+
+    # -- Worker processes, e.g. with --jobs, do not run exit handlers and
+    #    would wait for the pool forever, so only the main process keeps it
+    if multiprocessing.parent_process() is not None:
+        _shutdown()
+
+    return results
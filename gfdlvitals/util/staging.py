@@ -0,0 +1,332 @@
+""" Staging of history tar files from archival storage """
+
+import os
+import queue
+import shutil
+import subprocess
+import threading
+import time
+
+__all__ = [
+    "BACKENDS",
+    "CopyBackend",
+    "DmgetBackend",
+    "LocalBackend",
+    "StageBackend",
+    "Stager",
+    "get_backend",
+]
+
+
+class StageBackend:
+    """Interface for bringing history tar files online
+
+    Backends report which files are already online, stage batches of
+    files, and map each file to the path from which it is read.
+    """
+
+    def __str__(self):
+        return self.__class__.__name__
+
+    def online(self, infiles):
+        """Reports which files can be read without staging
+
+        Parameters
+        ----------
+        infiles : list
+            History tar file paths
+
+        Returns
+        -------
+        list
+            True for each file that is online
+        """
+        return [True for _ in infiles]
+
+    def stage(self, infiles):
+        """Brings a batch of files online, blocking until they are
+
+        Parameters
+        ----------
+        infiles : list
+            History tar file paths
+        """
+
+    def path(self, infile):
+        """Returns the path from which a staged file is read
+
+        Parameters
+        ----------
+        infile : str, path-like
+            History tar file path
+
+        Returns
+        -------
+        str
+            Path to the online file
+        """
+        return infile
+
+    def release(self, infile):
+        """Releases a file that is no longer needed
+
+        Parameters
+        ----------
+        infile : str, path-like
+            History tar file path
+        """
+
+
+class LocalBackend(StageBackend):
+    """Backend for files that are already on disk
+
+    Files can be marked as offline to emulate archival storage, e.g. for
+    testing. Staging them then takes `delay` seconds.
+
+    Parameters
+    ----------
+    offline : list, optional
+        Files to report as offline until they are staged, by default None
+    delay : float, optional
+        Time in seconds that staging a batch takes, by default 0.0
+    """
+
+    def __init__(self, offline=None, delay=0.0):
+        self.offline = set() if offline is None else set(offline)
+        self.delay = delay
+        self.batches = []
+
+    def online(self, infiles):
+        return [x not in self.offline for x in infiles]
+
+    def stage(self, infiles):
+        time.sleep(self.delay)
+        self.batches.append(list(infiles))
+        self.offline = self.offline - set(infiles)
+
+
+class DmgetBackend(StageBackend):
+    """Backend for files managed by the Data Migration Facility
+
+    The state of each file is queried with ``dmls`` and offline files are
+    recalled with ``dmget``.
+    """
+
+    # File states of data that is on disk
+    ONLINE_STATES = ["REG", "DUL", "MIG"]
+
+    def online(self, infiles):
+        if len(infiles) == 0 or shutil.which("dmls") is None:
+            return [False for _ in infiles]
+        try:
+            output = subprocess.run(
+                ["dmls", "-l"] + list(infiles),
+                capture_output=True,
+                text=True,
+                check=False,
+            ).stdout
+        except OSError:
+            return [False for _ in infiles]
+
+        states = {}
+        for line in output.splitlines():
+            fields = line.split()
+            if len(fields) > 1 and fields[-2].startswith("("):
+                states[os.path.basename(fields[-1])] = fields[-2].strip("()")
+        return [states.get(os.path.basename(x)) in self.ONLINE_STATES for x in infiles]
+
+    def stage(self, infiles):
+        subprocess.call(["dmget"] + list(infiles))
+
+
+class CopyBackend(StageBackend):
+    """Backend that copies files to a local staging directory
+
+    Copies are removed once they are released.
+
+    Parameters
+    ----------
+    directory : str, path-like
+        Staging directory
+    """
+
+    def __init__(self, directory):
+        self.directory = os.path.abspath(directory)
+
+    def online(self, infiles):
+        result = []
+        for infile in infiles:
+            path = self.path(infile)
+            result.append(
+                os.path.exists(path)
+                and os.path.getsize(path) == os.path.getsize(infile)
+                and os.stat(path).st_mtime_ns == os.stat(infile).st_mtime_ns
+            )
+        return result
+
+    def stage(self, infiles):
+        os.makedirs(self.directory, exist_ok=True)
+        for infile in infiles:
+            tmp_file = f"{self.path(infile)}.{os.getpid()}.tmp"
+            shutil.copy2(infile, tmp_file)
+            os.replace(tmp_file, self.path(infile))
+
+    def path(self, infile):
+        return os.path.join(self.directory, os.path.basename(infile))
+
+    def release(self, infile):
+        for path in [self.path(infile), f"{self.path(infile)}.index.json"]:
+            if os.path.exists(path):
+                os.remove(path)
+
+
+BACKENDS = {"copy": CopyBackend, "dmget": DmgetBackend, "local": LocalBackend}
+
+
+def get_backend(name=None, directory=None):
+    """Returns a staging backend by name
+
+    Parameters
+    ----------
+    name : str, optional
+        One of "dmget", "copy", or "local". By default "dmget" if the
+        ``dmget`` command is available, otherwise "local".
+    directory : str, path-like, optional
+        Staging directory for the "copy" backend, by default None
+
+    Returns
+    -------
+    StageBackend
+        Staging backend
+    """
+    if name is None:
+        name = "dmget" if shutil.which("dmget") is not None else "local"
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown staging backend: {name}")
+    if name == "copy":
+        if directory is None:
+            raise ValueError("A staging directory is required to copy files")
+        return CopyBackend(directory)
+    return BACKENDS[name]()
+
+
+class Stager:
+    """Stages history tar files in rolling batches
+
+    Files that are already online are returned first, in the order given.
+    Offline files are staged in batches by a background thread and are
+    returned as soon as their batch is online. At most `window` staged
+    files are held before they are released.
+
+    Parameters
+    ----------
+    infiles : list
+        History tar file paths
+    backend : StageBackend, optional
+        Staging backend, by default a LocalBackend
+    batch_size : int, optional
+        Number of files staged at once, by default 8
+    window : int, optional
+        Maximum number of staged files that have not been released,
+        by default twice the batch size
+    callback : callable, optional
+        Called with the path of each file when it is online, by default None
+    """
+
+    def __init__(self, infiles, backend=None, batch_size=8, window=None, callback=None):
+        self.infiles = list(infiles)
+        self.backend = LocalBackend() if backend is None else backend
+        self.batch_size = max(1, batch_size)
+        self.window = 2 * self.batch_size if window is None else window
+        self.callback = callback
+        self._held = set()
+        self._closed = False
+        self._condition = threading.Condition()
+        self._queue = queue.Queue()
+        self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __iter__(self):
+        for _ in self.infiles:
+            yield self._queue.get()
+
+    def __str__(self):
+        return self.__class__.__name__
+
+    def start(self):
+        """Queues the online files and starts staging the others
+
+        Returns
+        -------
+        Stager
+            The started stager
+        """
+        online = self.backend.online(self.infiles)
+        offline = [x for x, y in zip(self.infiles, online) if not y]
+        for infile in [x for x, y in zip(self.infiles, online) if y]:
+            self._put(infile)
+        if len(offline) > 0:
+            self._thread = threading.Thread(
+                target=self._run, args=(offline,), daemon=True
+            )
+            self._thread.start()
+        return self
+
+    def release(self, infile):
+        """Releases a file once it has been processed
+
+        Parameters
+        ----------
+        infile : str, path-like
+            History tar file path
+        """
+        self.backend.release(infile)
+        with self._condition:
+            self._held.discard(infile)
+            self._condition.notify_all()
+
+    def close(self):
+        """Stops staging further batches"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _put(self, infile):
+        """Returns a file to the consumer once it is online"""
+        path = self.backend.path(infile)
+        if self.callback is not None:
+            self.callback(path)
+        self._queue.put((infile, path))
+
+    def _run(self, offline):
+        """Stages the offline files in batches"""
+        for num in range(0, len(offline), self.batch_size):
+            batch = offline[num : num + self.batch_size]
+            with self._condition:
+                while (
+                    not self._closed
+                    and len(self._held) > 0
+                    and len(self._held) + len(batch) > self.window
+                ):
+                    self._condition.wait()
+                if self._closed:
+                    return
+                self._held.update(batch)
+
+            print(f"Staging {len(batch)} history files ...")
+            try:
+                self.backend.stage(batch)
+            except (OSError, subprocess.SubprocessError) as exc:
+                # Errors are reported when the year is processed
+                print(exc)
+
+            for infile in batch:
+                self._put(infile)
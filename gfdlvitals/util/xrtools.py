@@ -1,12 +1,358 @@
 """ Tools for working with xarray datasets """
 
+import concurrent.futures
+
 import xarray as xr
 import numpy as np
+import pandas as pd
+from xarray.backends import BackendArray
+from xarray.core import indexing
+
+from gfdlvitals.util.gmeantools import VitalsWriter
+
+__all__ = [
+    "REGIONS",
+    "RegionAccumulator",
+    "get_max_memory",
+    "is_chunked",
+    "set_max_memory",
+    "set_streaming",
+    "xr_chunk_indexers",
+    "xr_concat_lazy",
+    "xr_gather",
+    "xr_gather_index",
+    "xr_iter_chunks",
+    "xr_mask_by_latitude",
+    "xr_region_weights",
+    "xr_stack_years",
+    "xr_time_dependent",
+    "xr_to_db",
+    "xr_weighted_avg",
+]
+
+# Predefined latitude regions
+REGIONS = ["global", "nh", "sh", "tropics"]
+
+# Dimensions of the weights that are kept by `xr_weighted_avg`
+_KEEP_DIMS = ["region", "year"]
+
+# Approximate bytes of working memory per array element during a reduction
+_BYTES_PER_ELEMENT = 24
+
+# Optional memory budget in bytes for chunked averaging
+_MAX_MEMORY = None
+
+# Read and reduce variables one time record at a time
+_STREAM = False
+
+
+def set_max_memory(nbytes):
+    """Sets the memory budget for chunked averaging
+
+    Parameters
+    ----------
+    nbytes : int or None
+        Memory budget in bytes. If None, variables are averaged in memory.
+    """
+    global _MAX_MEMORY
+    _MAX_MEMORY = nbytes
+
+
+def get_max_memory():
+    """Returns the memory budget for chunked averaging
+
+    Returns
+    -------
+    int or None
+        Memory budget in bytes, or None if variables are averaged in memory
+    """
+    return _MAX_MEMORY
+
+
+def set_streaming(stream):
+    """Sets whether variables are averaged one time record at a time
+
+    Parameters
+    ----------
+    stream : bool
+        If True, variables are read and reduced record by record
+    """
+    global _STREAM
+    _STREAM = bool(stream)
+
+
+def is_chunked():
+    """Returns True if variables are averaged in chunks
+
+    Returns
+    -------
+    bool
+        True if a memory budget is set or streaming is enabled
+    """
+    return _MAX_MEMORY is not None or _STREAM
+
+
+class RegionAccumulator:
+    """Running weighted average of a variable
+
+    Chunks of a variable are added one at a time. The accumulator keeps
+    the weighted sum and the sum of weights over the reduced dimensions,
+    so only one chunk needs to be in memory. It also keeps the running
+    minimum and maximum of arrays passed to `add_extrema`, such as the
+    regional means of each time record.
+
+    Parameters
+    ----------
+    dims : list
+        Dimensions to reduce
+    """
+
+    def __init__(self, dims):
+        self.dims = list(dims)
+        self.weighted_sum = None
+        self.sum_of_weights = None
+        self.minimum = None
+        self.maximum = None
 
-from gfdlvitals.util.gmeantools import write_sqlite_data
-from gfdlvitals.util.gmeantools import write_metadata
+    def __str__(self):
+        return self.__class__.__name__
 
-__all__ = ["xr_mask_by_latitude", "xr_to_db", "xr_weighted_avg"]
+    def add(self, arr, weight):
+        """Adds a chunk of a variable to the running sums
+
+        Parameters
+        ----------
+        arr : xarray.DataArray
+            Chunk of the variable
+        weight : xarray.DataArray
+            Weights for the chunk
+        """
+        weighted_sum = xr.dot(arr.fillna(0.0), weight, dim=self.dims)
+        sum_of_weights = xr.dot(arr.notnull(), weight, dim=self.dims)
+        if self.weighted_sum is None:
+            self.weighted_sum = weighted_sum
+            self.sum_of_weights = sum_of_weights
+        else:
+            self.weighted_sum = self.weighted_sum + weighted_sum
+            self.sum_of_weights = self.sum_of_weights + sum_of_weights
+
+    def add_extrema(self, arr, dim=None):
+        """Updates the running minimum and maximum
+
+        Parameters
+        ----------
+        arr : xarray.DataArray
+            Input array
+        dim : str or list, optional
+            Dimensions over which to take the extrema, by default all
+        """
+        minimum = arr.min(dim)
+        maximum = arr.max(dim)
+        if self.minimum is None:
+            self.minimum = minimum
+            self.maximum = maximum
+        else:
+            self.minimum = np.fmin(self.minimum, minimum)
+            self.maximum = np.fmax(self.maximum, maximum)
+
+    def mean(self):
+        """Returns the weighted mean of the chunks added so far
+
+        Returns
+        -------
+        xarray.DataArray
+            Weighted mean, NaN where the sum of weights is zero
+        """
+        return self.weighted_sum / self.sum_of_weights.where(self.sum_of_weights != 0.0)
+
+
+class _StackedArray(BackendArray):
+    """Lazily stacked array of equally shaped variables"""
+
+    def __init__(self, variables):
+        self.variables = variables
+        self.shape = (len(variables),) + variables[0].shape
+        self.dtype = variables[0].dtype
+
+    def __getitem__(self, key):
+        return indexing.explicit_indexing_adapter(
+            key, self.shape, indexing.IndexingSupport.BASIC, self._getitem
+        )
+
+    def _getitem(self, key):
+        if isinstance(key[0], (int, np.integer)):
+            return self.variables[key[0]][key[1:]].values
+        return np.stack(
+            [self.variables[x][key[1:]].values for x in range(self.shape[0])[key[0]]]
+        )
+
+
+def xr_chunk_indexers(arr, max_memory=None, dims=None, stream=None):
+    """Splits an array into chunks that fit within a memory budget
+
+    Parameters
+    ----------
+    arr : xarray.DataArray
+        Input array
+    max_memory : int, optional
+        Memory budget in bytes, by default the value set with
+        `set_max_memory`. If no budget is set, the array is only split
+        when streaming.
+    dims : list, optional
+        Dimensions to split, in order of preference. By default, "time"
+        followed by the other dimensions except the two innermost spatial
+        ones, such as depth. The "region" and "year" dimensions are kept
+        whole. Gathered arrays (see `xr_gather`) have a single spatial
+        dimension and should list the dimensions to split.
+    stream : bool, optional
+        Split the array into single time records, by default the value
+        set with `set_streaming`
+
+    Returns
+    -------
+    list
+        Indexers (dicts of dimension slices) for use with `isel`
+    """
+    max_memory = _MAX_MEMORY if max_memory is None else max_memory
+    stream = _STREAM if stream is None else stream
+
+    if dims is None:
+        dims = [x for x in arr.dims if x != "time"][:-2]
+        dims = ["time"] + [x for x in dims if x not in _KEEP_DIMS]
+
+    indexers = [{}]
+    nbytes = arr.size * _BYTES_PER_ELEMENT
+
+    if stream and arr.sizes.get("time", 0) > 0:
+        indexers = [{"time": slice(i, i + 1)} for i in range(arr.sizes["time"])]
+        nbytes = nbytes / arr.sizes["time"]
+
+    if max_memory is None:
+        return indexers
+
+    for dim in [x for x in dims if x in arr.dims and x not in indexers[0]]:
+        if nbytes <= max_memory:
+            break
+        size = arr.sizes[dim]
+        nbytes = nbytes / size
+        step = max(1, int(max_memory // nbytes))
+        indexers = [
+            dict(x, **{dim: slice(i, i + step)})
+            for x in indexers
+            for i in range(0, size, step)
+        ]
+        nbytes = nbytes * min(step, size)
+
+    return indexers
+
+
+def _load_chunk(arr, indexer):
+    """Reads a chunk of an array into memory"""
+    return arr.isel(indexer).load()
+
+
+def xr_iter_chunks(arr, indexers):
+    """Iterates over chunks of an array, reading ahead in the background
+
+    The next chunk is read in a background thread while the current chunk
+    is being reduced, so decompression and I/O overlap with computation.
+
+    Parameters
+    ----------
+    arr : xarray.DataArray
+        Input array
+    indexers : list
+        Indexers from `xr_chunk_indexers`
+
+    Yields
+    ------
+    tuple
+        Indexer and the corresponding chunk loaded into memory
+    """
+    if len(indexers) == 1:
+        yield indexers[0], _load_chunk(arr, indexers[0])
+        return
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+        future = executor.submit(_load_chunk, arr, indexers[0])
+        for num, indexer in enumerate(indexers):
+            chunk = future.result()
+            if num + 1 < len(indexers):
+                future = executor.submit(_load_chunk, arr, indexers[num + 1])
+            yield indexer, chunk
+
+
+def xr_concat_lazy(dsets, dim):
+    """Concatenates datasets along a new dimension without loading them
+
+    This is a lazy counterpart of `xarray.concat` for datasets with
+    identical variables and shapes, such as cubed sphere tiles. Data
+    variables are stacked along the new dimension and only read when
+    indexed. Coordinates are taken from the first dataset.
+
+    Parameters
+    ----------
+    dsets : list
+        Datasets to concatenate
+    dim : str
+        Name of the new dimension
+
+    Returns
+    -------
+    xarray.DataSet
+        Concatenated dataset
+    """
+    result = xr.Dataset(coords=dsets[0].coords)
+    for x in dsets[0].data_vars:
+        variables = [ds[x].variable for ds in dsets]
+        result[x] = xr.Variable(
+            (dim,) + variables[0].dims,
+            indexing.LazilyIndexedArray(_StackedArray(variables)),
+            attrs=variables[0].attrs,
+            encoding=variables[0].encoding,
+        )
+    return result
+
+
+def xr_gather_index(mask, dim="point"):
+    """Returns indexers that pack the valid cells of a grid into one dimension
+
+    Parameters
+    ----------
+    mask : xarray.DataArray
+        Boolean array that is True for the cells to retain
+    dim : str, optional
+        Name of the packed dimension, by default "point"
+
+    Returns
+    -------
+    dict
+        Integer index arrays of each grid dimension, for use with `xr_gather`
+    """
+    index = np.nonzero(np.asarray(mask.values, dtype=bool))
+    return {x: xr.DataArray(y, dims=dim) for x, y in zip(mask.dims, index)}
+
+
+def xr_gather(obj, indexers):
+    """Packs the valid cells of an xarray object into one dimension
+
+    The packed dimension is placed last. Lazily concatenated datasets
+    (see `xr_concat_lazy`) remain lazy.
+
+    Parameters
+    ----------
+    obj : xarray.DataArray or xarray.DataSet
+        Input object on the full grid
+    indexers : dict
+        Indexers from `xr_gather_index`
+
+    Returns
+    -------
+    xarray.DataArray or xarray.DataSet
+        Object with the grid dimensions replaced by the packed dimension
+    """
+    dim = list(indexers.values())[0].dims[0]
+    return obj.isel(indexers).transpose(..., dim)
 
 
 def xr_mask_by_latitude(arr, geolat, region=None):
@@ -40,7 +386,88 @@ def xr_mask_by_latitude(arr, geolat, region=None):
     return result
 
 
-def xr_to_db(dset, fyear, sqlfile):
+def xr_region_weights(arr, geolat, regions=None):
+    """Stacks latitude-masked copies of an array along a region dimension
+
+    The result can be passed to `xr_weighted_avg` as weights to compute
+    the averages for all regions in a single reduction.
+
+    Parameters
+    ----------
+    arr : xarray.DataArray
+        Input unmasked array, e.g. cell area
+    geolat : xarray.DataArray
+        Data Array of latitude coordinates
+    regions : list, optional
+        Predefined regions, by default `REGIONS`
+
+    Returns
+    -------
+    xarray.DataArray
+        Masked arrays with a leading "region" dimension
+    """
+    regions = REGIONS if regions is None else regions
+    return xr.concat(
+        [xr_mask_by_latitude(arr, geolat, region=x) for x in regions],
+        pd.Index(regions, name="region"),
+    )
+
+
+def xr_stack_years(dsets, fyears):
+    """Stacks the datasets of consecutive years along a "year" dimension
+
+    The time coordinate is dropped, so the years must have the same
+    variables and number of time records. Time bounds are kept as data
+    variables. When variables are averaged in chunks, the datasets are
+    stacked lazily.
+
+    Parameters
+    ----------
+    dsets : list
+        Time-dependent datasets, one per year
+    fyears : list
+        Year labels
+
+    Returns
+    -------
+    xarray.DataSet or None
+        Stacked dataset, or None if the years cannot be stacked
+    """
+    dsets = [x.drop_vars("time", errors="ignore") for x in dsets]
+    if any(
+        sorted(x.data_vars) != sorted(dsets[0].data_vars)
+        or dict(x.sizes) != dict(dsets[0].sizes)
+        for x in dsets
+    ):
+        return None
+
+    if is_chunked():
+        dset = xr_concat_lazy(dsets, "year")
+    else:
+        dset = xr.concat(dsets, "year", coords="minimal", compat="override")
+    return dset.assign_coords(year=("year", list(fyears)))
+
+
+def xr_time_dependent(dset):
+    """Retains only the time-dependent variables of a dataset
+
+    Parameters
+    ----------
+    dset : xarray.DataSet
+        Input dataset
+
+    Returns
+    -------
+    xarray.DataSet
+        Dataset without the static variables and coordinates. The "year"
+        coordinate of stacked years (see `xr_stack_years`) is kept.
+    """
+    return dset.drop_vars(
+        [x for x in dset.variables if "time" not in dset[x].dims and x != "year"]
+    )
+
+
+def xr_to_db(dset, fyear, sqlfile, writer=None):
     """Writes Xarray dataset to SQLite format
 
     Parameters
@@ -51,18 +478,60 @@ def xr_to_db(dset, fyear, sqlfile):
         Year label (YYYY)
     sqlfile : str
         Filename of output db file
+    writer : gfdlvitals.util.gmeantools.VitalsWriter, optional
+        Buffered writer to use. If None, the dataset is written
+        in a single transaction, by default None
     """
+    if writer is None:
+        with VitalsWriter() as writer:
+            xr_to_db(dset, fyear, sqlfile, writer=writer)
+        return
+
     for var in list(dset.variables):
-        write_sqlite_data(sqlfile, var, str(fyear), str(dset[var].data))
+        writer.write_sqlite_data(sqlfile, var, str(fyear), str(dset[var].data))
         if "units" in list(dset[var].attrs):
-            write_metadata(sqlfile, var, "units", dset[var].units)
+            writer.write_metadata(sqlfile, var, "units", dset[var].units)
         if "long_name" in list(dset[var].attrs):
-            write_metadata(sqlfile, var, "long_name", dset[var].long_name)
+            writer.write_metadata(sqlfile, var, "long_name", dset[var].long_name)
         if "measure" in list(dset[var].attrs):
-            write_metadata(sqlfile, var, "cell_measure", dset[var].measure)
+            writer.write_metadata(sqlfile, var, "cell_measure", dset[var].measure)
+
 
+def _chunked_weighted_mean(dset, weight, dims, max_memory=None, split_dims=None):
+    """Weighted mean of each variable, reduced chunk by chunk
 
-def xr_weighted_avg(dset, weights):
+    Parameters
+    ----------
+    dset : xarray.DataSet
+        Input dataset
+    weight : xarray.DataArray
+        Array to use for weights
+    dims : list
+        Dimensions to reduce
+    max_memory : int, optional
+        Memory budget in bytes, by default None
+    split_dims : list, optional
+        Dimensions to split (see `xr_chunk_indexers`), by default None
+
+    Returns
+    -------
+    xarray.DataSet
+        Weighted means
+    """
+    result = xr.Dataset()
+    for x in list(dset.data_vars):
+        accumulator = RegionAccumulator(dims)
+        indexers = xr_chunk_indexers(dset[x], max_memory, dims=split_dims)
+        for indexer, _arr in xr_iter_chunks(dset[x], indexers):
+            _weight = weight.isel(
+                {k: v for k, v in indexer.items() if k in weight.dims}
+            )
+            accumulator.add(_arr, _weight)
+        result[x] = accumulator.mean()
+    return result
+
+
+def xr_weighted_avg(dset, weights, max_memory=None, split_dims=None):
     """Generates weighted space and time average of an xarray DataSet
 
     Parameters
@@ -70,21 +539,34 @@ def xr_weighted_avg(dset, weights):
     dset : xarray.DataSet
         Input dataset
     weights : xarray.DataArray or list
-        Array to use for weights
+        Array to use for weights. Weights may have an additional
+        "region" dimension (see `xr_region_weights`), in which case
+        the averages for all regions are computed together. A "year"
+        dimension (see `xr_stack_years`) is kept in the same way.
+    max_memory : int, optional
+        Memory budget in bytes, by default the value set with
+        `set_max_memory`. If a budget is set or streaming is enabled,
+        variables are read and reduced in chunks along time and depth.
+    split_dims : list, optional
+        Dimensions along which variables are read in chunks, in order of
+        preference (see `xr_chunk_indexers`). Gathered datasets (see
+        `xr_gather`) should list them, by default None
 
     Returns
     -------
     xarray DataSet containing weighted averages
     """
     _weights = [weights] if not isinstance(weights, list) else weights
+    max_memory = _MAX_MEMORY if max_memory is None else max_memory
 
-    _dset = xr.Dataset()
     result = xr.Dataset()
 
     for weight in _weights:
+        _dims = [x for x in weight.dims if x not in _KEEP_DIMS]
+        _dset = xr.Dataset()
         variables = list(dset.variables.keys())
         for x in variables:
-            if sorted(dset[x].dims) == sorted(weight.dims):
+            if sorted(y for y in dset[x].dims if y != "year") == sorted(_dims):
                 if 'timedelta' in str(dset[x].dtype):
                     dset[x] = dset[x].astype(np.float32)
                 _dset[x] = dset[x]
@@ -92,8 +574,13 @@ def xr_weighted_avg(dset, weights):
         if isinstance(weight, xr.DataArray):
             weight = weight.fillna(0.0)
 
-        _dset_weighted = _dset.weighted(weight).mean()
-        for x in list(_dset_weighted.variables):
+        if max_memory is None and not _STREAM:
+            _dset_weighted = _dset.weighted(weight).mean(_dims)
+        else:
+            _dset_weighted = _chunked_weighted_mean(
+                _dset, weight, _dims, max_memory, split_dims
+            )
+        for x in [x for x in _dset_weighted.variables if x not in _KEEP_DIMS]:
             _dset_weighted[x] = _dset_weighted[x].astype(dset[x].dtype)
             _dset_weighted[x].attrs = dset[x].attrs
 
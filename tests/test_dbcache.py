@@ -0,0 +1,64 @@
+"""Tests for the cache of db files"""
+
+import shutil
+import sqlite3
+
+import numpy as np
+
+from gfdlvitals import extensions, sample
+from gfdlvitals.util import dbcache
+
+
+def test_open_db_cache(tmp_path, monkeypatch):
+    dbfile = str(tmp_path / "globalAveAtmos.db")
+    shutil.copyfile(sample.historical, dbfile)
+    max_memory = dbcache._MAX_MEMORY
+    dbcache.clear()
+    dbcache.set_cache_dir(tmp_path / "cache")
+
+    calls = []
+    read_columns = extensions._read_columns
+
+    def _read_columns(*args, **kwargs):
+        calls.append(args)
+        return read_columns(*args, **kwargs)
+
+    monkeypatch.setattr(extensions, "_read_columns", _read_columns)
+
+    try:
+        expected = extensions.open_db(dbfile)
+        first = extensions.open_db(dbfile, cache=True)
+        second = extensions.open_db(dbfile, cache=True)
+        assert len(calls) == 2
+        assert first.equals(expected) and second.equals(expected)
+
+        # Data frames are persisted between sessions
+        dbcache.clear()
+        assert extensions.open_db(dbfile, cache=True).equals(expected)
+        assert len(calls) == 2
+
+        # Other arguments and modified files are read again
+        extensions.open_db(dbfile, start=1900, end=1950, cache=True)
+        assert len(calls) == 3
+        with sqlite3.connect(dbfile) as conn:
+            var = list(expected.columns)[0]
+            conn.execute(f"UPDATE {var} SET value = value * 2.0")
+        modified = extensions.open_db(dbfile, cache=True)
+        assert len(calls) == 4
+        assert np.allclose(modified[var], expected[var] * 2.0)
+
+        dbcache.invalidate(dbfile)
+        assert len(list((tmp_path / "cache").glob("*.npz"))) == 0
+        extensions.open_db(dbfile, cache=True)
+        assert len(calls) == 5
+
+        # The least recently used data frames are evicted
+        dbcache.set_max_memory(0)
+        extensions.open_db(dbfile, cache=True)
+        dbcache.set_cache_dir(None)
+        extensions.open_db(dbfile, cache=True)
+        assert len(calls) == 6
+    finally:
+        dbcache.set_cache_dir(None)
+        dbcache.set_max_memory(max_memory)
+        dbcache.clear()
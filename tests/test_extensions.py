@@ -0,0 +1,55 @@
+"""Tests for the db reader"""
+
+import numpy as np
+
+from gfdlvitals import extensions, sample
+
+
+def test_open_db_matches_timeseries():
+    df = extensions.open_db(sample.historical, start=1900, end=1950)
+    assert len(df) == 51
+
+    for var in df.columns:
+        tsobj = extensions.Timeseries(sample.historical, var, start=1900, end=1950)
+        assert np.array_equal(df[var].to_numpy(), np.array(tsobj.data), equal_nan=True)
+
+
+def test_lazy_open_db_reads_columns_on_access():
+    expected = extensions.open_db(sample.historical)
+    lazy = extensions.open_db(sample.historical, lazy=True)
+    assert list(lazy.columns) == list(expected.columns)
+    assert list(lazy.index) == list(expected.index)
+    assert lazy.loaded == []
+
+    var = list(lazy.columns)[-1]
+    assert np.array_equal(lazy[var].to_numpy(), expected[var].to_numpy())
+    assert lazy.loaded == [var]
+    assert np.allclose(
+        lazy.smooth(5)[var].to_numpy(),
+        expected.smooth(5)[var].to_numpy(),
+        equal_nan=True,
+    )
+    assert lazy.load().equals(expected)
+
+
+def test_open_mfdb_labels_experiments(tmp_path):
+    for experiment in ["exp1", "exp2"]:
+        (tmp_path / experiment).mkdir()
+        with open(sample.historical, "rb") as fhandle:
+            (tmp_path / experiment / "globalAveAtmos.db").write_bytes(fhandle.read())
+
+    df = extensions.open_mfdb(str(tmp_path / "*" / "*.db"), start=1900, end=1950)
+    assert list(df.columns.names) == ["experiment", "region", "component", "variable"]
+    assert sorted(set(df.columns.get_level_values(0))) == ["exp1", "exp2"]
+    assert len(df) == 51
+
+    expected = extensions.open_db(sample.historical, start=1900, end=1950)
+    for var in expected.columns:
+        assert np.array_equal(
+            df[("exp2", "global", "Atmos", var)].to_numpy(),
+            expected[var].to_numpy(),
+            equal_nan=True,
+        )
+
+    df = extensions.open_mfdb({"ctrl": tmp_path / "exp1"}, variables=["missing"])
+    assert len(df.columns) == 0
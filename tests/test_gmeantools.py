@@ -0,0 +1,97 @@
+"""Tests for the sqlite writers"""
+
+import sqlite3
+
+import numpy as np
+
+from gfdlvitals.util import gmeantools
+
+
+def _dump(sqlfile):
+    conn = sqlite3.connect(sqlfile)
+    tables = conn.execute("select name from sqlite_master where type='table'")
+    result = {
+        x[0]: sorted(conn.execute(f"select * from {x[0]}").fetchall()) for x in tables
+    }
+    conn.close()
+    return result
+
+
+def test_vitals_writer_matches_unbuffered(tmp_path):
+    unbuffered = str(tmp_path / "unbuffered.db")
+    buffered = str(tmp_path / "buffered.db")
+    values = [np.float32(0.1), np.float64(1.0) / 3.0, np.nan]
+
+    for year, value in zip(["00010101", "00020101", "00030101"], values):
+        gmeantools.write_sqlite_data(unbuffered, "tas", year, str(value))
+        gmeantools.write_sqlite_data(
+            unbuffered, "mrso", year, varmean=value, varsum=value, component="land"
+        )
+    gmeantools.write_metadata(unbuffered, "tas", "units", "K")
+
+    with gmeantools.VitalsWriter() as writer:
+        for year, value in zip(["00010101", "00020101", "00030101"], values):
+            writer.write_sqlite_data(buffered, "tas", year, str(value))
+            writer.write_sqlite_data(
+                buffered, "mrso", year, varmean=value, varsum=value, component="land"
+            )
+        writer.write_metadata(buffered, "tas", "units", "K")
+
+    assert _dump(buffered) == _dump(unbuffered)
+
+
+def _loop_cell_area(lat, lon, earth_radius=6371.0e3):
+    # Scalar operations are promoted to float64 as under NumPy 1.x
+    dlat = np.float64(lat[1] - lat[0])
+    dlon = np.float64(lon[1] - lon[0])
+    area = np.empty((len(lat), len(lon)))
+    for j, _lat in enumerate(lat.astype(np.float64)):
+        for i, _lon in enumerate(lon.astype(np.float64)):
+            lon1 = _lon + dlon / 2.0
+            lon0 = _lon - dlon / 2.0
+            lat1 = _lat + dlat / 2.0
+            lat0 = _lat - dlat / 2.0
+            area[j, i] = (
+                (np.pi / 180.0)
+                * earth_radius
+                * earth_radius
+                * np.abs(np.sin(np.radians(lat0)) - np.sin(np.radians(lat1)))
+                * np.abs(lon0 - lon1)
+            )
+    return area
+
+
+def test_standard_grid_cell_area_is_bit_identical():
+    for dtype in [np.float32, np.float64]:
+        lat = np.linspace(-89.5, 89.5, 180).astype(dtype)
+        lon = np.linspace(0.625, 359.375, 288).astype(dtype)
+        expected = _loop_cell_area(lat, lon)
+        result = gmeantools.standard_grid_cell_area(lat, lon)
+        assert result.dtype == expected.dtype
+        assert result.tobytes() == expected.tobytes()
+
+        # Cached areas are returned as independent copies
+        result[:] = 0.0
+        result = gmeantools.standard_grid_cell_area(lat, lon)
+        assert result.tobytes() == expected.tobytes()
+
+
+def test_standard_grid_cell_area_float32_coordinates():
+    lat = np.linspace(-89.5, 89.5, 180).astype(np.float32)
+    lon = np.linspace(0.625, 359.375, 288).astype(np.float32)
+    result = gmeantools.standard_grid_cell_area(lat, lon)
+    assert result.dtype == np.float64
+
+    # Cell edges are computed in float64 from the float32 coordinates
+    dlat = np.float64(lat[1] - lat[0])
+    dlon = np.float64(lon[1] - lon[0])
+    lat0 = np.float64(lat[0]) - dlat / 2.0
+    lat1 = np.float64(lat[0]) + dlat / 2.0
+    expected = (
+        (np.pi / 180.0)
+        * 6371.0e3
+        * 6371.0e3
+        * np.abs(np.sin(np.radians(lat0)) - np.sin(np.radians(lat1)))
+        * np.abs((np.float64(lon[0]) - dlon / 2.0) - (np.float64(lon[0]) + dlon / 2.0))
+    )
+    assert result[0, 0] == expected
@@ -0,0 +1,49 @@
+"""Tests for the cache of static grid datasets"""
+
+import io
+import tarfile
+
+import numpy as np
+import xarray as xr
+
+from gfdlvitals.util import gridcache
+from gfdlvitals.util import netcdf
+
+
+def _make_tar(path, members):
+    with tarfile.open(path, "w") as tar:
+        for name, dset in members.items():
+            data = dset.to_netcdf()
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+
+
+def test_least_recently_used_grids_are_evicted(tmp_path):
+    path = str(tmp_path / "00010101.nc.tar")
+    _make_tar(
+        path,
+        {
+            f"00010101.{name}.nc": xr.Dataset(
+                {"area": (("y", "x"), np.full((8, 8), x))}
+            )
+            for x, name in enumerate(["ocean_static", "ice_static"])
+        },
+    )
+
+    gridcache.clear()
+    gridcache.set_max_memory(768)
+    try:
+        with netcdf.TarIndex(path) as tar:
+            ocean = gridcache.load_grid(tar, "00010101.ocean_static.nc")
+            assert gridcache.load_grid(tar, "00010101.ocean_static.nc") is ocean
+            assert gridcache.derived(ocean, "sum", lambda x: x.area.sum()) == 0.0
+
+            ice = gridcache.load_grid(tar, "00010101.ice_static.nc")
+            assert gridcache.load_grid(tar, "00010101.ice_static.nc") is ice
+            assert gridcache.load_grid(tar, "00010101.ocean_static.nc") is not ocean
+            assert len(gridcache._GRIDS) == 1
+            assert len(gridcache._DERIVED) == 0
+    finally:
+        gridcache.set_max_memory(1024**3)
+        gridcache.clear()
@@ -0,0 +1,65 @@
+"""Tests for the sea ice averager"""
+
+import numpy as np
+import xarray as xr
+
+from gfdlvitals.averagers import ice
+from gfdlvitals.util import xrtools
+
+
+def test_regional_stats_match_per_region_loop():
+    rng = np.random.default_rng(0)
+    lat = np.linspace(-89.5, 89.5, 36)
+    geolat = xr.DataArray(np.tile(lat[:, None], (1, 8)), dims=("yT", "xT"))
+    area = xr.DataArray(
+        rng.uniform(1.0e9, 2.0e9, (36, 8)).astype(np.float32), dims=("yT", "xT")
+    )
+    data = rng.uniform(0.0, 1.0, (12, 36, 8)).astype(np.float32)
+    data[:, 0, 0] = np.nan
+    dset = xr.Dataset({"CN": (("time", "yT", "xT"), data)})
+    dt = xr.DataArray(np.arange(28.0, 40.0), dims="time")
+
+    regions = ["global", "nh", "sh"]
+    masked_area = xrtools.xr_region_weights(area, geolat, regions=regions)
+    stats = ice._regional_stats(dset, dset["CN"], masked_area, dt)
+
+    for region in regions:
+        _masked_area = xrtools.xr_mask_by_latitude(area, geolat, region=region)
+        cn_mean = (dset["CN"] * _masked_area).sum(("yT", "xT")) / _masked_area.sum()
+        extent = (
+            xr.ones_like(dset["CN"]).where(dset["CN"] > 0.15, 0.0) * _masked_area
+        ).sum(("yT", "xT")) * 1.0e-12
+        expected = xr.Dataset({"CN": cn_mean, "extent": extent})
+        weighted = expected.weighted(dt).mean("time")
+
+        result = stats.sel(region=region, drop=True)
+        for x in ["CN", "extent"]:
+            assert str(result[f"{x}_mean"].data) == str(
+                weighted[x].astype(np.float32).data
+            )
+            assert str(result[f"{x}_max"].data) == str(expected[x].max().data)
+            assert str(result[f"{x}_min"].data) == str(expected[x].min().data)
+
+
+def test_regional_sums_match_per_region_loop():
+    rng = np.random.default_rng(1)
+    lat = np.linspace(-89.5, 89.5, 18)
+    geolat = xr.DataArray(np.tile(lat[:, None], (1, 6)), dims=("yT", "xT"))
+    area = xr.DataArray(rng.uniform(1.0e9, 2.0e9, (18, 6)), dims=("yT", "xT"))
+    data = rng.uniform(0.0, 1.0, (4, 2, 18, 6)).astype(np.float32)
+    data[:, :, 3, 2] = np.nan
+    arr = xr.DataArray(
+        data, dims=("time", "ct", "yT", "xT"), coords={"time": np.arange(4.0)}
+    )
+
+    regions = ["global", "nh", "sh"]
+    masked_area = xrtools.xr_region_weights(area, geolat, regions=regions)
+    sums = ice._regional_sums(arr, masked_area)
+
+    assert sums.dims == ("region", "time", "ct")
+    for region in regions:
+        _masked_area = xrtools.xr_mask_by_latitude(area, geolat, region=region)
+        expected = (arr * _masked_area).sum(("yT", "xT"))
+        result = sums.sel(region=region, drop=True)
+        assert result.dtype == expected.dtype
+        np.testing.assert_array_equal(result.values, expected.values)
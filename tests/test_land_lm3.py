@@ -0,0 +1,91 @@
+"""Tests for the legacy LM3 land averager"""
+
+import glob
+import os
+import sqlite3
+
+import numpy as np
+import pytest
+import xarray as xr
+
+from gfdlvitals.averagers import land_lm3
+from gfdlvitals.util.average import RichVariable
+from gfdlvitals.util.average import process_var
+
+import gfdlvitals.util.netcdf as nctools
+
+
+def _make_files():
+    rng = np.random.default_rng(0)
+    lat = np.linspace(-85.0, 85.0, 18)
+    lon = np.linspace(5.0, 355.0, 36)
+    coords = {"lat": lat, "lon": lon}
+    land_frac = np.where(rng.uniform(size=(18, 36)) > 0.6, 1.0, 0.0)
+    land_area = rng.uniform(1.0e10, 2.0e10, (18, 36))
+
+    grid = xr.Dataset(coords=coords)
+    grid["land_area"] = (("lat", "lon"), land_area)
+    grid["land_frac"] = (("lat", "lon"), land_frac)
+    grid["soil_area"] = (("time", "lat", "lon"), (0.9 * land_area * land_frac)[None])
+
+    data = xr.Dataset(coords=dict(coords, time=np.arange(12.0)))
+    data["average_DT"] = ("time", np.full(12, 30.0))
+    for var in ["melts", "meltr", "sat_frac"]:
+        data[var] = (("time", "lat", "lon"), rng.normal(size=(12, 18, 36)))
+
+    return grid.to_netcdf(), data.to_netcdf()
+
+
+def _dump(outdir):
+    result = {}
+    for sqlfile in sorted(glob.glob(os.path.join(outdir, "*.db"))):
+        conn = sqlite3.connect(sqlfile)
+        result[os.path.basename(sqlfile)] = sorted(conn.iterdump())
+        conn.close()
+    return result
+
+
+def _serial_average(grid_file, data_file, fyear, out, lab):
+    _grid_file = nctools.in_mem_nc(grid_file)
+    _data_file = nctools.in_mem_nc(data_file)
+    geolon, geolat = np.meshgrid(_data_file["lon"][:], _data_file["lat"][:])
+    cell_area = _grid_file["land_area"][:]
+    cell_frac = _grid_file["land_frac"][:]
+    soil_area = _grid_file["soil_area"][0]
+    for var in _data_file.variables.keys():
+        variable = RichVariable(
+            var,
+            grid_file,
+            data_file,
+            fyear,
+            out,
+            lab,
+            geolat,
+            geolon,
+            cell_area=cell_area,
+            cell_frac=cell_frac,
+            soil_area=soil_area,
+            soil_frac=np.ma.array(soil_area / (cell_area * cell_frac)),
+        )
+        process_var(variable, averager="land-lm3")
+    _grid_file.close()
+    _data_file.close()
+
+
+@pytest.mark.parametrize("processes", [1, 2])
+def test_average_matches_serial(tmp_path, processes):
+    grid_file, data_file = _make_files()
+    expected = str(tmp_path / "expected")
+    result = str(tmp_path / "result")
+    os.makedirs(expected)
+    os.makedirs(result)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for fyear in ["00010101", "00020101"]:
+            _serial_average(grid_file, data_file, fyear, expected, "Land")
+            land_lm3.average(
+                grid_file, data_file, fyear, result, "Land", processes=processes
+            )
+
+    assert len(_dump(result)) == 8
+    assert _dump(result) == _dump(expected)
@@ -0,0 +1,41 @@
+"""Tests for the incremental-run manifest"""
+
+from gfdlvitals.util import manifest
+
+
+def test_pending_components(tmp_path):
+    infile = tmp_path / "00010101.nc.tar"
+    infile.write_bytes(b"history")
+
+    records = {}
+    assert manifest.pending_components(records, str(infile), ["atmos"]) == ["atmos"]
+
+    manifest.record_year(records, str(infile), ["atmos"])
+    assert manifest.pending_components(records, str(infile), ["atmos"]) == []
+    assert manifest.pending_components(records, str(infile), ["atmos", "land"]) == [
+        "land"
+    ]
+    assert manifest.pending_components(records, str(infile), ["all"]) == ["all"]
+    assert manifest.pending_components(
+        records, str(infile), ["all"], ["atmos", "ice", "land"]
+    ) == ["ice", "land"]
+
+    manifest.record_year(records, str(infile), ["land"])
+    assert manifest.pending_components(
+        records, str(infile), ["all"], ["atmos", "ice", "land"]
+    ) == ["ice"]
+
+    manifest.record_year(records, str(infile), ["all"])
+    assert manifest.pending_components(records, str(infile), ["ocean"]) == []
+
+
+def test_changed_file_is_reprocessed(tmp_path):
+    infile = tmp_path / "00010101.nc.tar"
+    infile.write_bytes(b"history")
+
+    records = manifest.record_year({}, str(infile), ["all"])
+    manifest.write_manifest(str(tmp_path), records)
+    records = manifest.read_manifest(str(tmp_path))
+
+    infile.write_bytes(b"updated history")
+    assert manifest.pending_components(records, str(infile), ["atmos"]) == ["atmos"]
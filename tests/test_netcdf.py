@@ -0,0 +1,66 @@
+"""Tests for the tar file utilities"""
+
+import io
+import tarfile
+import threading
+
+from gfdlvitals.util import netcdf
+
+
+def _make_tar(path, members):
+    with tarfile.open(path, "w") as tar:
+        for name, data in members.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+
+
+def test_tar_index_lookup(tmp_path):
+    path = str(tmp_path / "00010101.nc.tar")
+    _make_tar(path, {"./00010101.atmos_month.nc": b"atmos", "00010101.ice.nc": b"ice"})
+
+    with netcdf.TarIndex(path) as tar:
+        assert netcdf.tar_member_exists(tar, "00010101.atmos_month.nc")
+        assert netcdf.tar_member_exists(tar, "./00010101.ice.nc")
+        assert not netcdf.tar_member_exists(tar, "00010101.land_month.nc")
+        assert netcdf.extract_from_tar(tar, "00010101.atmos_month.nc").read() == b"atmos"
+        assert sorted(tar.getnames()) == ["00010101.atmos_month.nc", "00010101.ice.nc"]
+        assert netcdf.extract_buffer(tar, "00010101.ice.nc").tobytes() == b"ice"
+
+
+def test_tar_index_sidecar(tmp_path, monkeypatch):
+    path = str(tmp_path / "00010101.nc.tar")
+    _make_tar(path, {"./00010101.atmos_month.nc": b"atmos", "00010101.ice.nc": b"ice"})
+
+    netcdf.TarIndex(path).close()
+    assert (tmp_path / "00010101.nc.tar.index.json").exists()
+
+    def _no_scan(self):
+        raise AssertionError("tar headers were scanned")
+
+    monkeypatch.setattr(tarfile.TarFile, "getmembers", _no_scan)
+    with netcdf.TarIndex(path) as tar:
+        assert netcdf.extract_from_tar(tar, "00010101.ice.nc").read() == b"ice"
+        assert netcdf.extract_from_tar(tar, "00010101.atmos_month.nc").read() == b"atmos"
+
+
+def test_tar_index_concurrent_sidecar_writers(tmp_path, monkeypatch):
+    path = str(tmp_path / "00010101.nc.tar")
+    _make_tar(path, {"00010101.atmos_month.nc": b"atmos", "00010101.ice.nc": b"ice"})
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+
+    def _index():
+        netcdf.TarIndex(path, sidecar=False)._write_sidecar()
+
+    threads = [threading.Thread(target=_index) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(x.name for x in tmp_path.iterdir()) == [
+        "00010101.nc.tar",
+        "00010101.nc.tar.index.json",
+    ]
+    with netcdf.TarIndex(path) as tar:
+        assert netcdf.extract_from_tar(tar, "00010101.ice.nc").read() == b"ice"
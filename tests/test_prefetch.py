@@ -0,0 +1,65 @@
+"""Tests for the background read-ahead of history files"""
+
+import tarfile
+import time
+
+from gfdlvitals.util import prefetch
+
+
+def _make_tars(tmp_path, count):
+    infiles = []
+    for num in range(count):
+        member = tmp_path / f"{num:04d}0101.atmos_month.nc"
+        member.write_bytes(bytes(range(256)) * (num + 1))
+        infile = tmp_path / f"{num:04d}0101.nc.tar"
+        with tarfile.open(infile, "w") as tar:
+            tar.add(member, arcname=member.name)
+        infiles.append(str(infile))
+    return infiles
+
+
+def test_prefetcher_reads_upcoming_members(tmp_path):
+    infiles = _make_tars(tmp_path, 3)
+    prefetcher = prefetch.Prefetcher(infiles, depth=2)
+    prefetcher.advance(infiles[0])
+    with prefetcher:
+        deadline = time.time() + 10.0
+        while len(prefetcher.nbytes) < 2 and time.time() < deadline:
+            time.sleep(0.01)
+    assert prefetcher.nbytes == {1: 512, 2: 768}
+
+
+def _wait_for(prefetcher, num):
+    deadline = time.time() + 10.0
+    while num not in prefetcher.nbytes and time.time() < deadline:
+        time.sleep(0.01)
+
+
+def test_prefetcher_respects_memory_cap(tmp_path):
+    infiles = _make_tars(tmp_path, 3)
+    prefetcher = prefetch.Prefetcher(infiles, depth=2, max_memory=1000)
+    prefetcher.advance(infiles[0])
+    with prefetcher:
+        # -- The next file fits within the cap, the one after it does not
+        _wait_for(prefetcher, 1)
+        time.sleep(0.1)
+        assert prefetcher.nbytes == {1: 512}
+
+        # -- Once the next file is processed, its bytes no longer count
+        prefetcher.advance(infiles[1])
+        _wait_for(prefetcher, 2)
+    assert prefetcher.nbytes == {1: 512, 2: 768}
+
+
+def test_prefetcher_reads_only_used_members(tmp_path):
+    infile = tmp_path / "00010101.nc.tar"
+    with tarfile.open(infile, "w") as tar:
+        for name, size in [("atmos_month.tile1", 256), ("ocean_month", 512)]:
+            member = tmp_path / f"00010101.{name}.nc"
+            member.write_bytes(bytes(size))
+            tar.add(member, arcname=member.name)
+
+    prefetcher = prefetch.Prefetcher([str(infile)], members=["atmos_month"])
+    with prefetcher:
+        _wait_for(prefetcher, 0)
+    assert prefetcher.nbytes == {0: 256}
@@ -0,0 +1,84 @@
+"""Tests for the user-defined region registry"""
+
+import numpy as np
+import pytest
+import xarray as xr
+
+from gfdlvitals.util import regions
+from gfdlvitals.util import xrtools
+
+
+def test_mask_file_regions(tmp_path):
+    rng = np.random.default_rng(0)
+    lat = np.linspace(-89.5, 89.5, 36)
+    geolat = xr.DataArray(np.tile(lat[:, None], (1, 8)), dims=("yh", "xh"))
+    area = xr.DataArray(rng.uniform(1.0, 2.0, (36, 8)), dims=("yh", "xh"))
+    data = rng.normal(size=(12, 36, 8)).astype(np.float32)
+    data[:, 0, 0] = np.nan
+    dset = xr.Dataset({"tas": (("time", "yh", "xh"), data)})
+    weights = xr.DataArray(np.arange(1.0, 13.0), dims="time")
+
+    masks = xr.Dataset()
+    masks["north"] = (("yh", "xh"), np.where(geolat > 30.0, 1.0, 0.0))
+    masks["south"] = (("yh", "xh"), np.where(geolat < -30.0, 1.0, 0.0))
+    masks.to_netcdf(tmp_path / "masks.nc")
+
+    regions.configure(str(tmp_path / "masks.nc"))
+    try:
+        assert regions.names() == ["north", "south"]
+        region_weights = regions.weight_matrix(geolat)
+        result = regions.weighted_avg(dset, weights * area, region_weights)
+        region_area = regions.region_sum(area, region_weights)
+    finally:
+        regions.clear()
+
+    for region, band in [("north", "nh"), ("south", "sh")]:
+        _masked_area = xrtools.xr_mask_by_latitude(area, geolat, region=band)
+        expected = xrtools.xr_weighted_avg(dset, weights * _masked_area)
+        assert np.isclose(result["tas"].sel(region=region), expected["tas"])
+        assert np.isclose(region_area.sel(region=region), _masked_area.sum())
+
+
+def test_transposed_mask_file(tmp_path):
+    lat = np.linspace(-89.5, 89.5, 36)
+    geolat = xr.DataArray(np.tile(lat[:, None], (1, 8)), dims=("yh", "xh"))
+
+    masks = xr.Dataset()
+    masks["north"] = (("yh", "xh"), np.where(geolat > 30.0, 1.0, 0.0))
+    masks.to_netcdf(tmp_path / "masks.nc")
+    masks.transpose("xh", "yh").to_netcdf(tmp_path / "transposed.nc")
+
+    regions.configure(str(tmp_path / "masks.nc"))
+    try:
+        expected = regions.weight_matrix(geolat).matrix.toarray()
+    finally:
+        regions.clear()
+
+    regions.configure(str(tmp_path / "transposed.nc"))
+    try:
+        result = regions.weight_matrix(geolat).matrix.toarray()
+        with pytest.raises(ValueError):
+            regions.weight_matrix(geolat.isel(xh=slice(0, 4)))
+    finally:
+        regions.clear()
+
+    assert np.array_equal(result, expected)
+
+
+def test_region_names_must_be_unique(tmp_path):
+    lat = np.linspace(-89.5, 89.5, 36)
+    geolat = xr.DataArray(np.tile(lat[:, None], (1, 8)), dims=("yh", "xh"))
+    north = np.where(geolat > 30.0, 1.0, 0.0)
+
+    xr.Dataset({"north": (("yh", "xh"), north)}).to_netcdf(tmp_path / "north.nc")
+    xr.Dataset({"nh": (("yh", "xh"), north)}).to_netcdf(tmp_path / "nh.nc")
+    masks = xr.Dataset(
+        {"mask": (("region", "yh", "xh"), np.stack([north, north]))},
+        coords={"abbrevs": ("region", ["N.Am", "N_Am"])},
+    )
+    masks.to_netcdf(tmp_path / "abbrevs.nc")
+
+    for spec in ["nh.nc", "north.nc,north.nc", "abbrevs.nc"]:
+        with pytest.raises(ValueError):
+            regions.configure(",".join(str(tmp_path / x) for x in spec.split(",")))
+        regions.clear()
@@ -0,0 +1,46 @@
+"""Tests for the concurrent processing of components"""
+
+import os
+import tarfile
+
+import pytest
+
+from gfdlvitals.util import scheduler
+
+
+def _write_member(fyear, tar):
+    with open(f"{fyear}.member.txt", "w") as fhandle:
+        fhandle.write(",".join(tar.getnames()))
+    return ["atmos"]
+
+
+def _fail(fyear, tar):
+    raise RuntimeError(f"failed {fyear}")
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_failed_components_are_isolated(tmp_path, monkeypatch, capsys, jobs):
+    member = tmp_path / "00010101.atmos_month.nc"
+    member.write_bytes(b"data")
+    infile = str(tmp_path / "00010101.nc.tar")
+    with tarfile.open(infile, "w") as tar:
+        tar.add(member, arcname=member.name)
+
+    monkeypatch.chdir(tmp_path)
+    results = scheduler.run_components(
+        None, infile, [("Broken", _fail), ("Atmosphere", _write_member)], jobs=jobs
+    )
+    assert results == {"Atmosphere": ["atmos"]}
+
+    assert "# Broken vitals failed" in capsys.readouterr().out
+    with open(os.path.join(tmp_path, "00010101.member.txt")) as fhandle:
+        assert fhandle.read() == "00010101.atmos_month.nc"
+
+
+def test_per_year_returns_components_done_for_all_years():
+    @scheduler.per_year
+    def _component(fyear, tar):
+        return ["ocean", "amoc"] if fyear == "00010101" else ["ocean"]
+
+    assert _component("00010101", None) == ["ocean", "amoc"]
+    assert _component(["00010101", "00020101"], [None, None]) == ["ocean"]
@@ -0,0 +1,31 @@
+"""Tests for the staging of history files"""
+
+from gfdlvitals.util import staging
+
+
+def test_online_files_are_returned_first(tmp_path):
+    infiles = [str(tmp_path / f"{x:04d}0101.nc.tar") for x in range(1, 6)]
+    backend = staging.LocalBackend(offline=infiles[:3])
+
+    with staging.Stager(infiles, backend, batch_size=2) as stager:
+        order = [x[0] for x in stager]
+        for infile in order:
+            stager.release(infile)
+
+    assert order == infiles[3:] + infiles[:3]
+    assert backend.batches == [infiles[:2], infiles[2:3]]
+
+
+def test_copy_backend_stages_and_releases(tmp_path):
+    infile = tmp_path / "00010101.nc.tar"
+    infile.write_bytes(b"history")
+    backend = staging.get_backend("copy", directory=tmp_path / "staged")
+
+    assert backend.online([str(infile)]) == [False]
+    backend.stage([str(infile)])
+    assert backend.online([str(infile)]) == [True]
+    with open(backend.path(str(infile)), "rb") as fhandle:
+        assert fhandle.read() == b"history"
+
+    backend.release(str(infile))
+    assert backend.online([str(infile)]) == [False]
@@ -0,0 +1,149 @@
+"""Tests for the xarray averaging tools"""
+
+import numpy as np
+import xarray as xr
+
+from gfdlvitals.util import xrtools
+
+
+def test_region_weights_match_per_region_average():
+    rng = np.random.default_rng(0)
+    lat = np.linspace(-89.5, 89.5, 36)
+    geolat = xr.DataArray(np.tile(lat[:, None], (1, 8)), dims=("yh", "xh"))
+    area = xr.DataArray(rng.uniform(1.0, 2.0, (36, 8)), dims=("yh", "xh"))
+    data = rng.normal(size=(12, 36, 8)).astype(np.float32)
+    data[:, 0, 0] = np.nan
+    dset = xr.Dataset({"tas": (("time", "yh", "xh"), data)})
+    weights = xr.DataArray(np.arange(1.0, 13.0), dims="time")
+
+    masked_area = xrtools.xr_region_weights(area, geolat)
+    fused = xrtools.xr_weighted_avg(dset, weights * masked_area)
+
+    for region in xrtools.REGIONS:
+        _masked_area = xrtools.xr_mask_by_latitude(area, geolat, region=region)
+        expected = xrtools.xr_weighted_avg(dset, weights * _masked_area)
+        result = fused.sel(region=region, drop=True)
+        assert list(result.variables) == list(expected.variables)
+        assert str(result["tas"].data) == str(expected["tas"].data)
+
+
+def test_chunked_average_matches_in_memory():
+    rng = np.random.default_rng(1)
+    area = xr.DataArray(rng.uniform(1.0, 2.0, (2, 6, 5)), dims=("tile", "yh", "xh"))
+    data = rng.normal(size=(12, 6, 5)).astype(np.float32)
+    data[:, 0, 0] = np.nan
+    tiles = [xr.Dataset({"sos": (("time", "yh", "xh"), data + x)}) for x in range(2)]
+    weights = xr.DataArray(np.arange(1.0, 13.0), dims="time") * area
+
+    lazy = xrtools.xr_concat_lazy(tiles, "tile")
+    assert lazy["sos"].shape == (2, 12, 6, 5)
+
+    indexers = xrtools.xr_chunk_indexers(lazy["sos"], max_memory=1000)
+    assert len(indexers) == 12 * 2
+
+    expected = xrtools.xr_weighted_avg(xr.concat(tiles, "tile"), weights)
+    result = xrtools.xr_weighted_avg(lazy, weights, max_memory=1000)
+    assert np.isclose(result["sos"], expected["sos"])
+
+
+def test_region_accumulator_streams_records():
+    rng = np.random.default_rng(2)
+    data = xr.DataArray(rng.normal(size=(12, 6, 5)), dims=("time", "yh", "xh"))
+    data[3, 2, 2] = np.nan
+    weights = xr.DataArray(rng.uniform(1.0, 2.0, (12, 6, 5)), dims=data.dims)
+
+    indexers = xrtools.xr_chunk_indexers(data, stream=True)
+    assert len(indexers) == 12
+
+    accumulator = xrtools.RegionAccumulator(["time", "yh", "xh"])
+    for indexer, chunk in xrtools.xr_iter_chunks(data, indexers):
+        accumulator.add(chunk, weights.isel(indexer))
+        accumulator.add_extrema(chunk.mean(("yh", "xh")))
+
+    expected = data.weighted(weights).mean()
+    assert np.isclose(accumulator.mean(), expected)
+    assert accumulator.minimum == data.mean(("yh", "xh")).min()
+    assert accumulator.maximum == data.mean(("yh", "xh")).max()
+
+
+def test_stacked_years_match_per_year_average():
+    rng = np.random.default_rng(2)
+    lat = np.linspace(-89.5, 89.5, 36)
+    geolat = xr.DataArray(np.tile(lat[:, None], (1, 8)), dims=("yh", "xh"))
+    area = xr.DataArray(rng.uniform(1.0, 2.0, (36, 8)), dims=("yh", "xh"))
+    masked_area = xrtools.xr_region_weights(area, geolat)
+    fyears = ["00010101", "00020101", "00030101"]
+
+    dsets = []
+    for _ in fyears:
+        data = rng.normal(size=(12, 36, 8)).astype(np.float32)
+        dt = xr.DataArray(rng.uniform(28.0, 31.0, 12), dims="time")
+        dsets.append(xr.Dataset({"tas": (("time", "yh", "xh"), data), "dt": dt}))
+
+    stacked = xrtools.xr_stack_years(dsets, fyears)
+    assert stacked["tas"].dims == ("year", "time", "yh", "xh")
+    result = xrtools.xr_weighted_avg(stacked, stacked["dt"] * masked_area)
+
+    for fyear, dset in zip(fyears, dsets):
+        expected = xrtools.xr_weighted_avg(dset, dset["dt"] * masked_area)
+        assert np.allclose(result["tas"].sel(year=fyear), expected["tas"])
+
+    dsets[-1] = dsets[-1].rename({"tas": "ts"})
+    assert xrtools.xr_stack_years(dsets, fyears) is None
+
+
+def test_gathered_average_matches_full_grid():
+    rng = np.random.default_rng(3)
+    lat = np.linspace(-89.5, 89.5, 6)
+    geolat = xr.DataArray(
+        np.tile(lat[None, :, None], (2, 1, 5)), dims=("tile", "yh", "xh")
+    )
+    area = xr.DataArray(rng.uniform(1.0, 2.0, (2, 6, 5)), dims=("tile", "yh", "xh"))
+    area = area.where(rng.uniform(size=(2, 6, 5)) > 0.6)
+    data = rng.normal(size=(12, 6, 5)).astype(np.float32)
+    tiles = [xr.Dataset({"mrso": (("time", "yh", "xh"), data + x)}) for x in range(2)]
+    dt = xr.DataArray(np.arange(1.0, 13.0), dims="time")
+
+    expected = xrtools.xr_weighted_avg(
+        xr.concat(tiles, "tile"), dt * xrtools.xr_region_weights(area, geolat)
+    )
+
+    index = xrtools.xr_gather_index(area.notnull(), dim="land_point")
+    assert index["tile"].size == int(area.notnull().sum())
+    weights = dt * xrtools.xr_region_weights(
+        xrtools.xr_gather(area, index), xrtools.xr_gather(geolat, index)
+    )
+    for dset in [xr.concat(tiles, "tile"), xrtools.xr_concat_lazy(tiles, "tile")]:
+        gathered = xrtools.xr_gather(dset, index)
+        assert gathered["mrso"].dims == ("time", "land_point")
+        result = xrtools.xr_weighted_avg(gathered, weights)
+        assert np.allclose(result["mrso"], expected["mrso"])
+
+
+def test_gathered_arrays_are_chunked_along_depth():
+    rng = np.random.default_rng(3)
+    data = xr.DataArray(rng.normal(size=(2, 4, 6, 5)), dims=("time", "zl", "yh", "xh"))
+    mask = xr.DataArray(rng.uniform(size=(6, 5)) > 0.3, dims=("yh", "xh"))
+    gathered = xrtools.xr_gather(data, xrtools.xr_gather_index(mask, "wet_point"))
+
+    nbytes = gathered.size // 8 * xrtools._BYTES_PER_ELEMENT
+    assert xrtools.xr_chunk_indexers(gathered, max_memory=nbytes) == [
+        {"time": slice(x, x + 1)} for x in range(2)
+    ]
+
+    indexers = xrtools.xr_chunk_indexers(
+        gathered, max_memory=nbytes, dims=["time", "zl"]
+    )
+    assert indexers == [
+        {"time": slice(x, x + 1), "zl": slice(y, y + 1)}
+        for x in range(2)
+        for y in range(4)
+    ]
+
+    weights = xr.ones_like(gathered)
+    dset = xr.Dataset({"thetao": gathered})
+    expected = xrtools.xr_weighted_avg(dset, weights)
+    result = xrtools.xr_weighted_avg(
+        dset, weights, max_memory=nbytes, split_dims=["time", "zl"]
+    )
+    assert np.allclose(result["thetao"], expected["thetao"])